@@ -1,13 +1,13 @@
 import logging
 from decimal import Decimal
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 
 from web3 import Web3
-from web3.exceptions import ContractLogicError
 
 from defi_protocols.cache import const_call
 from defi_protocols.constants import AAVE_ETH, ABPT_ETH, ETHEREUM, STKAAVE_ETH
 from defi_protocols.functions import balance_of, get_contract, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 
 logger = logging.getLogger(__name__)
 
@@ -99,42 +99,127 @@ def get_reserves_tokens(pdp_contract, block):
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-# get_reserves_tokens_balances
+# get_reserves_data_many
 # 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# 'reserves_tokens' = reserves_tokens -> Improves performance
+# 'price_oracle_address' = price_oracle_address -> the prices of the reserves are read with the balances
+# Output: a tuple with 2 elements:
+# 1 - dict by wallet with a List of Tuples: [token_address, balance], where balance = currentATokenBalance - currentStableDebt - currentVariableDebt
+# 2 - dict by reserve token address: price in the price oracle (empty if there isn't a price oracle)
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-def get_reserves_tokens_balances(
-    web3: Web3, wallet: str, block: int | str, blockchain: str, decimals: bool = True
-) -> List:
+def get_reserves_data_many(
+    web3: Web3,
+    wallets: List[str],
+    block: int | str,
+    blockchain: str,
+    pdp_address: str,
+    decimals: bool = True,
+    reserves_tokens: List[str] = None,
+    price_oracle_address: str = None,
+) -> Tuple[Dict[str, List], Dict[str, int]]:
     """
+    The reserve data of all the wallets in all the reserves, and the prices of the reserves, are read in a single batch.
+    Together with the reserves, when they aren't given, that's 2 round trips for any number of wallets. Agave, a fork
+    of Aave, reads its reserves with it too.
+
     :param web3:
-    :param wallet:
+    :param wallets:
     :param block:
     :param blockchain:
+    :param pdp_address:
     :param decimals:
+    :param reserves_tokens:
+    :param price_oracle_address:
     :return:
     """
-    balances = []
-
-    pdp_address = get_protocol_data_provider(blockchain)
-    if pdp_address:
-        pdp_contract = get_contract(pdp_address, blockchain, web3=web3, abi=ABI_PDP, block=block)
+    # each wallet is read once, even if it's repeated
+    wallets = list(dict.fromkeys(wallets))
+    pdp_contract = get_contract(pdp_address, blockchain, web3=web3, abi=ABI_PDP, block=block)
+    if reserves_tokens is None:
         reserves_tokens = get_reserves_tokens(pdp_contract, block)
 
-        for reserves_token in reserves_tokens:
-            try:
-                user_reserve_data = pdp_contract.functions.getUserReserveData(reserves_token, wallet).call(
-                    block_identifier=block
+    calls = [
+        pdp_contract.functions.getUserReserveData(reserves_token, Web3.to_checksum_address(wallet))
+        for wallet in wallets
+        for reserves_token in reserves_tokens
+    ]
+    if price_oracle_address:
+        price_oracle_contract = get_contract(
+            price_oracle_address, blockchain, web3=web3, abi=ABI_PRICE_ORACLE, block=block
+        )
+        calls += [price_oracle_contract.functions.getAssetPrice(reserves_token) for reserves_token in reserves_tokens]
+    data = multicall(calls, block, blockchain, web3=web3)
+
+    balances = {wallet: [] for wallet in wallets}
+    for i, wallet in enumerate(wallets):
+        for j, reserves_token in enumerate(reserves_tokens):
+            user_reserve_data = data[i * len(reserves_tokens) + j]
+            if user_reserve_data is None:
+                # the reserve is left out of the balances, as when the call reverted one by one
+                logger.warning(
+                    "getUserReserveData(%s, %s) reverted at block %s in %s: the reserve is left out",
+                    reserves_token,
+                    wallet,
+                    block,
+                    blockchain,
                 )
-            except ContractLogicError:
                 continue
 
             # balance = currentATokenBalance - currentStableDebt - currentVariableDebt
             balance = Decimal(user_reserve_data[0] - user_reserve_data[1] - user_reserve_data[2])
 
             if balance != 0:
-                balances.append([reserves_token, to_token_amount(reserves_token, balance, blockchain, web3, decimals)])
+                balances[wallet].append(
+                    [reserves_token, to_token_amount(reserves_token, balance, blockchain, web3, decimals)]
+                )
 
-    return balances
+    prices = dict(zip(reserves_tokens, data[len(wallets) * len(reserves_tokens) :]))
+
+    return balances, prices
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_reserves_tokens_balances
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_reserves_tokens_balances(
+    web3: Web3, wallet: str, block: int | str, blockchain: str, decimals: bool = True
+) -> List:
+    """
+    :param web3:
+    :param wallet:
+    :param block:
+    :param blockchain:
+    :param decimals:
+    :return:
+    """
+    return get_reserves_tokens_balances_many(web3, [wallet], block, blockchain, decimals=decimals)[wallet]
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_reserves_tokens_balances_many
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of get_reserves_tokens_balances for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_reserves_tokens_balances_many(
+    web3: Web3, wallets: List[str], block: int | str, blockchain: str, decimals: bool = True
+) -> Dict[str, List]:
+    """
+    The reserves are read once, and the reserve data of all the wallets in all of them in a single batch (see
+    get_reserves_data_many).
+
+    :param web3:
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param decimals:
+    :return:
+    """
+    pdp_address = get_protocol_data_provider(blockchain)
+    if not pdp_address:
+        return {wallet: [] for wallet in wallets}
+
+    return get_reserves_data_many(web3, wallets, block, blockchain, pdp_address, decimals=decimals)[0]
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -153,15 +238,31 @@ def get_data(wallet, block, blockchain, web3=None, decimals=True):
     :param decimals:
     :return:
     """
-    aave_data = {}
-    collaterals = []
-    debts = []
+    return get_data_many([wallet], block, blockchain, web3=web3, decimals=decimals)[wallet]
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_data_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of get_data for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_data_many(wallets, block, blockchain, web3=None, decimals=True):
+    """
+    2 round trips for any number of wallets: the reserves, the price oracle, the ETH price and the account data of the
+    wallets first, then their reserve data and the prices of the reserves (see get_reserves_data_many).
 
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :return:
+    """
+    wallets = list(dict.fromkeys(wallets))
     if web3 is None:
         web3 = get_node(blockchain, block=block)
 
-    wallet = Web3.to_checksum_address(wallet)
-
     lpapr_address = get_lpapr_address(blockchain)
     lpapr_contract = get_contract(lpapr_address, blockchain, web3=web3, abi=ABI_LPAPR, block=block)
 
@@ -172,65 +273,84 @@ def get_data(wallet, block, blockchain, web3=None, decimals=True):
         CHAINLINK_ETH_USD, blockchain, web3=web3, abi=ABI_CHAINLINK_ETH_USD, block=block
     )
     chainlink_eth_usd_decimals = const_call(chainlink_eth_usd_contract.functions.decimals())
-    eth_usd_price = chainlink_eth_usd_contract.functions.latestAnswer().call(block_identifier=block) / Decimal(
-        10**chainlink_eth_usd_decimals
+
+    pdp_address = get_protocol_data_provider(blockchain)
+    pdp_contract = get_contract(pdp_address, blockchain, web3=web3, abi=ABI_PDP, block=block)
+
+    reserves_tokens, price_oracle_address, eth_usd_price, *users_account_data = multicall(
+        [
+            pdp_contract.functions.getAllReservesTokens(),
+            lpapr_contract.functions.getPriceOracle(),
+            chainlink_eth_usd_contract.functions.latestAnswer(),
+        ]
+        + [lending_pool_contract.functions.getUserAccountData(Web3.to_checksum_address(wallet)) for wallet in wallets],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    eth_usd_price = eth_usd_price / Decimal(10**chainlink_eth_usd_decimals)
+
+    wallets_balances, prices = get_reserves_data_many(
+        web3,
+        wallets,
+        block,
+        blockchain,
+        pdp_address,
+        decimals=decimals,
+        reserves_tokens=[reserves_token[1] for reserves_token in reserves_tokens],
+        price_oracle_address=price_oracle_address,
     )
-    balances = get_reserves_tokens_balances(web3, wallet, block, blockchain, decimals=decimals)
 
-    if balances:
-        price_oracle_address = lpapr_contract.functions.getPriceOracle().call(block_identifier=block)
-        price_oracle_contract = get_contract(
-            price_oracle_address, blockchain, web3=web3, abi=ABI_PRICE_ORACLE, block=block
-        )
+    result = {}
+    for wallet, user_account_data in zip(wallets, users_account_data):
+        aave_data = {}
+        collaterals = []
+        debts = []
 
-        for balance in balances:
+        for balance in wallets_balances[wallet]:
             asset = {"token_address": balance[0], "token_amount": abs(balance[1])}
 
-            asset["token_price_usd"] = (
-                price_oracle_contract.functions.getAssetPrice(asset["token_address"]).call(block_identifier=block)
-                / Decimal(10**18)
-                * eth_usd_price
-            )
+            asset["token_price_usd"] = prices[asset["token_address"]] / Decimal(10**18) * eth_usd_price
 
             if balance[1] < 0:
                 debts.append(asset)
             else:
                 collaterals.append(asset)
 
-    # getUserAccountData return a list with the following data:
-    # [0] = totalCollateralETH,
-    # [1] = totalDebtETH,
-    # [2] = availableBorrowsETH,
-    # [3] = currentLiquidationThreshold,
-    # [4] = ltv,
-    # [5] = healthFactor
-    user_account_data = lending_pool_contract.functions.getUserAccountData(wallet).call(block_identifier=block)
-
-    total_collateral_ETH, total_debt_ETH, _, current_liquidation_th, *_ = user_account_data
+        # getUserAccountData return a list with the following data:
+        # [0] = totalCollateralETH,
+        # [1] = totalDebtETH,
+        # [2] = availableBorrowsETH,
+        # [3] = currentLiquidationThreshold,
+        # [4] = ltv,
+        # [5] = healthFactor
+        total_collateral_ETH, total_debt_ETH, _, current_liquidation_th, *_ = user_account_data
+
+        if total_collateral_ETH > 0:
+            if total_debt_ETH > 0:
+                aave_data["collateral_ratio"] = Decimal(100 * total_collateral_ETH / total_debt_ETH)
+            else:
+                aave_data["collateral_ratio"] = Decimal("infinity")
+        else:
+            aave_data["collateral_ratio"] = Decimal("nan")
 
-    if total_collateral_ETH > 0:
-        if total_debt_ETH > 0:
-            aave_data["collateral_ratio"] = Decimal(100 * total_collateral_ETH / total_debt_ETH)
+        if current_liquidation_th > 0:
+            aave_data["liquidation_ratio"] = 1000000 / Decimal(current_liquidation_th)
         else:
-            aave_data["collateral_ratio"] = Decimal("infinity")
-    else:
-        aave_data["collateral_ratio"] = Decimal("nan")
+            aave_data["liquidation_ratio"] = Decimal("infinity")
 
-    if current_liquidation_th > 0:
-        aave_data["liquidation_ratio"] = 1000000 / Decimal(current_liquidation_th)
-    else:
-        aave_data["liquidation_ratio"] = Decimal("infinity")
+        # Ether price in USD
+        aave_data["eth_price_usd"] = eth_usd_price
 
-    # Ether price in USD
-    aave_data["eth_price_usd"] = eth_usd_price
+        # Collaterals Data
+        aave_data["collaterals"] = collaterals
 
-    # Collaterals Data
-    aave_data["collaterals"] = collaterals
+        # Debts Data
+        aave_data["debts"] = debts
 
-    # Debts Data
-    aave_data["debts"] = debts
+        result[wallet] = aave_data
 
-    return aave_data
+    return result
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -270,6 +390,43 @@ def get_all_rewards(wallet, block, blockchain, web3=None, decimals=True):
     return all_rewards
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_all_rewards_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of get_all_rewards for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_all_rewards_many(wallets, block, blockchain, web3=None, decimals=True):
+    """
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    stkaave_address = get_stkaave_address(blockchain)
+    if not stkaave_address:
+        return {wallet: [] for wallet in wallets}
+
+    stkaave_contract = get_contract(stkaave_address, blockchain, web3=web3, abi=ABI_STKAAVE, block=block)
+    reward_token = const_call(stkaave_contract.functions.REWARD_TOKEN())
+    reward_balances = multicall(
+        [stkaave_contract.functions.getTotalRewardsBalance(Web3.to_checksum_address(wallet)) for wallet in wallets],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: [[reward_token, to_token_amount(reward_token, reward_balance, blockchain, web3, decimals)]]
+        for wallet, reward_balance in zip(wallets, reward_balances)
+    }
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # underlying_all
 # 'reward' = True -> retrieves the rewards / 'reward' = False or not passed onto the function -> no reward retrieval
@@ -307,6 +464,42 @@ def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=F
     return result
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# underlying_all_many
+# 'reward' = True -> retrieves the rewards / 'reward' = False or not passed onto the function -> no reward retrieval
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of underlying_all for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def underlying_all_many(wallets, block, blockchain, web3=None, decimals=True, reward=False):
+    """
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :param reward:
+    :return:
+    """
+    wallets = list(dict.fromkeys(wallets))
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    wallets_balances = get_reserves_tokens_balances_many(web3, wallets, block, blockchain, decimals=decimals)
+    if reward:
+        # only the wallets with balances get their rewards
+        wallets_with_balances = [wallet for wallet in wallets if wallets_balances[wallet]]
+        rewards = get_all_rewards_many(wallets_with_balances, block, blockchain, web3=web3, decimals=decimals)
+
+    result = {}
+    for wallet, balances in wallets_balances.items():
+        if balances and reward:
+            result[wallet] = [balances, rewards[wallet]]
+        else:
+            result[wallet] = balances
+
+    return result
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # get_apr
 # 'web3' = web3 (Node) -> Improves performance
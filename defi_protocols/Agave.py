@@ -15,9 +15,11 @@ from typing import Dict, List, Union
 
 from web3 import Web3
 
+from defi_protocols.Aave import get_reserves_data_many
 from defi_protocols.cache import const_call
 from defi_protocols.constants import AGVE_XDAI, STKAGAVE_XDAI
 from defi_protocols.functions import balance_of, get_contract, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 
 logger = logging.getLogger(__name__)
 
@@ -84,33 +86,37 @@ def get_reserves_tokens(pdp_contract, block: Union[int, str]) -> List[str]:
 def get_reserves_tokens_balances(
     web3, wallet: str, block: Union[int, str], blockchain: str, decimals: bool = True
 ) -> List[List]:
-    balances = []
-
-    pdp_contract = get_contract(PDP_XDAI, blockchain, web3=web3, abi=ABI_PDP, block=block)
-    reserves_tokens = get_reserves_tokens(pdp_contract, block)
-    cs_wallet = Web3.to_checksum_address(wallet)
+    return get_reserves_tokens_balances_many(web3, [wallet], block, blockchain, decimals=decimals)[wallet]
 
-    for token in reserves_tokens:
-        user_reserve_data = pdp_contract.functions.getUserReserveData(token, cs_wallet).call(block_identifier=block)
-        currentATokenBalance, currentStableDebt, currentVariableDebt, *_ = user_reserve_data
-        balance = currentATokenBalance - currentStableDebt - currentVariableDebt
 
-        if balance != 0:
-            balances.append([token, to_token_amount(token, balance, blockchain, web3, decimals)])
+def get_reserves_tokens_balances_many(
+    web3, wallets: List[str], block: Union[int, str], blockchain: str, decimals: bool = True
+) -> Dict[str, List[List]]:
+    """
+    Output: a dict with the output of get_reserves_tokens_balances for each wallet, by wallet.
 
-    return balances
+    The reserves are read once, and the reserve data of all the wallets in all of them in a single batch, as in Aave.
+    """
+    return get_reserves_data_many(web3, wallets, block, blockchain, PDP_XDAI, decimals=decimals)[0]
 
 
 def get_data(wallet: str, block: Union[int, str], blockchain: str, web3=None, decimals: bool = True) -> Dict:
-    agave_data = {}
-    collaterals = []
-    debts = []
+    return get_data_many([wallet], block, blockchain, web3=web3, decimals=decimals)[wallet]
+
 
+def get_data_many(
+    wallets: List[str], block: Union[int, str], blockchain: str, web3=None, decimals: bool = True
+) -> Dict[str, Dict]:
+    """
+    Output: a dict with the output of get_data for each wallet, by wallet.
+
+    2 round trips for any number of wallets: the reserves, the price oracle, the xDAI price and the account data of
+    the wallets first, then their reserve data and the prices of the reserves.
+    """
+    wallets = list(dict.fromkeys(wallets))
     if web3 is None:
         web3 = get_node(blockchain, block=block)
 
-    wallet = Web3.to_checksum_address(wallet)
-
     lpapr_contract = get_contract(LPAPR_XDAI, blockchain, web3=web3, abi=ABI_LPAPR, block=block)
 
     lending_pool_address = const_call(lpapr_contract.functions.getLendingPool())
@@ -120,23 +126,43 @@ def get_data(wallet: str, block: Union[int, str], blockchain: str, web3=None, de
         CHAINLINK_XDAI_USD, blockchain, web3=web3, abi=ABI_CHAINLINK_XDAI_USD, block=block
     )
     chainlink_eth_usd_decimals = const_call(chainlink_eth_usd_contract.functions.decimals())
-    xdai_usd_price = chainlink_eth_usd_contract.functions.latestAnswer().call(block_identifier=block)
+
+    pdp_contract = get_contract(PDP_XDAI, blockchain, web3=web3, abi=ABI_PDP, block=block)
+
+    reserves_tokens, price_oracle_address, xdai_usd_price, *users_account_data = multicall(
+        [
+            pdp_contract.functions.getAllReservesTokens(),
+            lpapr_contract.functions.getPriceOracle(),
+            chainlink_eth_usd_contract.functions.latestAnswer(),
+        ]
+        + [lending_pool_contract.functions.getUserAccountData(Web3.to_checksum_address(wallet)) for wallet in wallets],
+        block,
+        blockchain,
+        web3=web3,
+    )
     xdai_usd_price = Decimal(xdai_usd_price) / Decimal(10**chainlink_eth_usd_decimals)
 
-    balances = get_reserves_tokens_balances(web3, wallet, block, blockchain, decimals=decimals)
+    wallets_balances, prices = get_reserves_data_many(
+        web3,
+        wallets,
+        block,
+        blockchain,
+        PDP_XDAI,
+        decimals=decimals,
+        reserves_tokens=[e[1] for e in reserves_tokens],
+        price_oracle_address=price_oracle_address,
+    )
 
-    if balances:
-        price_oracle_address = lpapr_contract.functions.getPriceOracle().call(block_identifier=block)
-        price_oracle_contract = get_contract(
-            price_oracle_address, blockchain, web3=web3, abi=ABI_PRICE_ORACLE, block=block
-        )
+    result = {}
+    for wallet, user_account_data in zip(wallets, users_account_data):
+        agave_data = {}
+        collaterals = []
+        debts = []
 
-        for balance in balances:
+        for balance in wallets_balances[wallet]:
             asset = {"token_address": balance[0], "token_amount": abs(balance[1])}
 
-            token_price_usd = price_oracle_contract.functions.getAssetPrice(asset["token_address"]).call(
-                block_identifier=block
-            )
+            token_price_usd = prices[asset["token_address"]]
             asset["token_price_usd"] = Decimal(token_price_usd) / Decimal(10**18) * xdai_usd_price
 
             if balance[1] < 0:
@@ -144,40 +170,40 @@ def get_data(wallet: str, block: Union[int, str], blockchain: str, web3=None, de
             else:
                 collaterals.append(asset)
 
-    # getUserAccountData return a list with the following data:
-    # [0] = totalCollateralETH,
-    # [1] = totalDebtETH,
-    # [2] = availableBorrowsETH,
-    # [3] = currentLiquidationThreshold,
-    # [4] = ltv,
-    # [5] = healthFactor
-    user_account_data = lending_pool_contract.functions.getUserAccountData(wallet).call(block_identifier=block)
-
-    total_collateral_ETH, total_debt_ETH, _, current_liquidation_th, *_ = user_account_data
+        # getUserAccountData return a list with the following data:
+        # [0] = totalCollateralETH,
+        # [1] = totalDebtETH,
+        # [2] = availableBorrowsETH,
+        # [3] = currentLiquidationThreshold,
+        # [4] = ltv,
+        # [5] = healthFactor
+        total_collateral_ETH, total_debt_ETH, _, current_liquidation_th, *_ = user_account_data
+
+        if total_collateral_ETH > 0:
+            if total_debt_ETH > 0:
+                agave_data["collateral_ratio"] = 100 * total_collateral_ETH / Decimal(total_debt_ETH)
+            else:
+                agave_data["collateral_ratio"] = Decimal("infinity")
+        else:
+            agave_data["collateral_ratio"] = Decimal("nan")
 
-    if total_collateral_ETH > 0:
-        if total_debt_ETH > 0:
-            agave_data["collateral_ratio"] = 100 * total_collateral_ETH / Decimal(total_debt_ETH)
+        if current_liquidation_th > 0:
+            agave_data["liquidation_ratio"] = 1000000 / Decimal(current_liquidation_th)
         else:
-            agave_data["collateral_ratio"] = Decimal("infinity")
-    else:
-        agave_data["collateral_ratio"] = Decimal("nan")
+            agave_data["liquidation_ratio"] = Decimal("infinity")
 
-    if current_liquidation_th > 0:
-        agave_data["liquidation_ratio"] = 1000000 / Decimal(current_liquidation_th)
-    else:
-        agave_data["liquidation_ratio"] = Decimal("infinity")
+        # Ether price in USD
+        agave_data["xdai_price_usd"] = xdai_usd_price
 
-    # Ether price in USD
-    agave_data["xdai_price_usd"] = xdai_usd_price
+        # Collaterals Data
+        agave_data["collaterals"] = collaterals
 
-    # Collaterals Data
-    agave_data["collaterals"] = collaterals
+        # Debts Data
+        agave_data["debts"] = debts
 
-    # Debts Data
-    agave_data["debts"] = debts
+        result[wallet] = agave_data
 
-    return agave_data
+    return result
 
 
 def get_all_rewards(
@@ -205,6 +231,33 @@ def get_all_rewards(
     return all_rewards
 
 
+def get_all_rewards_many(
+    wallets: List[str], block: Union[int, str], blockchain: str, web3=None, decimals: bool = True
+) -> Dict[str, List[List]]:
+    """
+    Output: a dict with the output of get_all_rewards for each wallet, by wallet.
+    """
+
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    stkagave_contract = get_contract(STKAGAVE_XDAI, blockchain, web3=web3, abi=ABI_STKAGAVE, block=block)
+
+    reward_token = const_call(stkagave_contract.functions.REWARD_TOKEN())
+
+    reward_balances = multicall(
+        [stkagave_contract.functions.getTotalRewardsBalance(Web3.to_checksum_address(wallet)) for wallet in wallets],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: [[reward_token, to_token_amount(reward_token, reward_balance, blockchain, web3, decimals)]]
+        for wallet, reward_balance in zip(wallets, reward_balances)
+    }
+
+
 def underlying_all(
     wallet: str, block: Union[int, str], blockchain: str, web3=None, decimals: bool = True, reward: bool = False
 ) -> List[List]:
@@ -227,6 +280,31 @@ def underlying_all(
     return result
 
 
+def underlying_all_many(
+    wallets: List[str],
+    block: Union[int, str],
+    blockchain: str,
+    web3=None,
+    decimals: bool = True,
+    reward: bool = False,
+) -> Dict[str, List[List]]:
+    """
+    Output: a dict with the output of underlying_all for each wallet, by wallet.
+    """
+
+    wallets = list(dict.fromkeys(wallets))
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    result = get_reserves_tokens_balances_many(web3, wallets, block, blockchain, decimals=decimals)
+    if reward:
+        all_rewards = get_all_rewards_many(wallets, block, blockchain, web3=web3, decimals=decimals)
+        for wallet in wallets:
+            result[wallet].extend(all_rewards[wallet])
+
+    return result
+
+
 def get_apr(token_address: str, block: Union[int, str], blockchain: str, web3=None, apy: bool = False) -> List[Dict]:
     """
     Output:
@@ -5,6 +5,7 @@ from web3 import Web3
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
 from defi_protocols.functions import get_contract, get_logs_web3, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 from defi_protocols.util.topic import AddressHexor, TopicCreator
 
 POOL_ADDR_V1 = "0xac004b512c33D029cf23ABf04513f1f380B3FD0a"
@@ -160,3 +161,78 @@ def underlying_all(
             results.append([underlying(wallet, nftid, block, blockchain, web3, decimals=decimals, rewards=rewards)][0])
 
     return results
+
+
+def underlying_all_many(
+    wallets: list,
+    block: Union[int, str],
+    blockchain: str,
+    web3: Web3 = None,
+    decimals: bool = True,
+    rewards: bool = False,
+) -> dict:
+    """Returns the output of underlying_all for each wallet, by wallet.
+
+    The nfts of all the wallets, their owners and their withdrawable amounts are read in batches. The deposits still
+    come from the logs of each nft.
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    checksum_wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+    pool_v1_contract = get_contract(POOL_ADDR_V1, blockchain, web3=web3, abi=AZURO_POOL_ABI, block=block)
+    pool_v2_contract = get_contract(POOL_ADDR_V2, blockchain, web3=web3, abi=AZURO_POOL_ABI, block=block)
+    pool_contracts = [pool_v1_contract, pool_v2_contract]
+
+    assets_in_pools = multicall(
+        [contract.functions.balanceOf(wallet) for wallet in checksum_wallets for contract in pool_contracts],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    # (wallet, index) of the nfts, listed as underlying_all does: the v1 pool is asked for the nfts of both pools
+    listed = [
+        (i, asset)
+        for i in range(len(wallets))
+        for assets_in_pool in assets_in_pools[2 * i : 2 * i + 2]
+        for asset in range(assets_in_pool)
+    ]
+    owners = [i for i, _ in listed]
+    nftids = multicall(
+        [pool_v1_contract.functions.tokenOfOwnerByIndex(checksum_wallets[i], asset) for i, asset in listed],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    nfts_owners = multicall(
+        [contract.functions.ownerOf(nftid) for nftid in nftids for contract in pool_contracts],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    # (nft, contract) of the nfts owned by the wallets that listed them
+    owned = [
+        (i, contract)
+        for i, owner in enumerate(owners)
+        for contract, nft_owner in zip(pool_contracts, nfts_owners[2 * i : 2 * i + 2])
+        if nft_owner == checksum_wallets[owner]
+    ]
+    node_withdraws = multicall(
+        [contract.functions.nodeWithdrawView(nftids[i]) for i, contract in owned], block, blockchain, web3=web3
+    )
+
+    balances = [0] * len(nftids)
+    nft_rewards = [0] * len(nftids)
+    for (i, contract), node_withdraw in zip(owned, node_withdraws):
+        deposit = get_deposit(checksum_wallets[owners[i]], nftids[i], contract.address, block, blockchain, web3)
+        balances[i] += node_withdraw
+        nft_rewards[i] += node_withdraw - deposit
+
+    token = pool_v1_contract.functions.token().call(block_identifier=block)
+    results = {wallet: [] for wallet in wallets}
+    for owner, balance, reward in zip(owners, balances, nft_rewards):
+        balance = [token, to_token_amount(token, balance, blockchain, web3, decimals)]
+        reward = [token, to_token_amount(token, reward, blockchain, web3, decimals)]
+        results[wallets[owner]].append([balance, reward] if rewards else [balance])
+
+    return results
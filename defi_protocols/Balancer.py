@@ -1,4 +1,3 @@
-from datetime import datetime, timedelta
 from decimal import Decimal
 from itertools import groupby
 from operator import itemgetter
@@ -7,7 +6,7 @@ from typing import Union
 from web3 import Web3
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
-from defi_protocols.cache import const_call
+from defi_protocols.cache import cache_call, const_call
 from defi_protocols.constants import (
     ARBITRUM,
     BAL_ARB,
@@ -23,15 +22,17 @@ from defi_protocols.constants import (
 )
 from defi_protocols.functions import (
     balance_of,
-    block_to_date,
-    date_to_block,
+    block_to_timestamp,
     get_contract,
     get_decimals,
     get_logs_web3,
     get_node,
     last_block,
+    latest_not_in_params,
+    timestamp_to_block,
     to_token_amount,
 )
+from defi_protocols.multicall import multicall
 from defi_protocols.prices.prices import get_price
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -264,6 +265,244 @@ def get_lptoken_data(lptoken_address, block, blockchain, web3=None):
     return lptoken_data
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_pool_structure
+# Output: a dictionary with what doesn't change in a pool: its poolId, decimals, the function that returns its supply, the BPT index
+# and its tokens, each one classified once as a nested pool (getRate), a wrapped token (UNDERLYING / UNDERLYING_ASSET_ADDRESS),
+# wstETH or a plain token. It's read at the latest block, whatever the block it's asked at, and cached by pool. Tokens that aren't
+# pools (no poolId) are not cached.
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_pool_structure(lptoken_address, block, blockchain, web3=None):
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    lptoken_contract = get_contract(lptoken_address, blockchain, web3=web3, abi=ABI_LPTOKEN, block=block)
+
+    try:
+        pool_id = const_call(lptoken_contract.functions.getPoolId())
+    except ContractLogicError:
+        try:
+            pool_id = const_call(lptoken_contract.functions.POOL_ID())
+        except ContractLogicError:
+            pool_id = None
+
+    if pool_id is None:
+        return {
+            "poolId": None,
+            "decimals": const_call(lptoken_contract.functions.decimals()),
+            "supplyFunction": "totalSupply",
+            "bptIndex": None,
+            "tokens": [],
+        }
+
+    return _get_pool_structure(lptoken_address, pool_id, blockchain, web3=web3)
+
+
+@cache_call(exclude_args=["web3"])
+def _get_pool_structure(lptoken_address, pool_id, blockchain, web3):
+    lptoken_contract = get_contract(lptoken_address, blockchain, web3=web3, abi=ABI_LPTOKEN)
+
+    actual_supply, virtual_supply, bpt_index = multicall(
+        [
+            lptoken_contract.functions.getActualSupply(),
+            lptoken_contract.functions.getVirtualSupply(),
+            lptoken_contract.functions.getBptIndex(),
+        ],
+        "latest",
+        blockchain,
+        web3=web3,
+    )
+
+    structure = {"poolId": pool_id, "decimals": const_call(lptoken_contract.functions.decimals()), "tokens": []}
+
+    if actual_supply is not None:
+        structure["supplyFunction"] = "getActualSupply"
+    elif virtual_supply is not None:
+        structure["supplyFunction"] = "getVirtualSupply"
+    else:
+        structure["supplyFunction"] = "totalSupply"
+
+    # Only boosted pools have their own BPT among their tokens
+    structure["bptIndex"] = bpt_index if structure["supplyFunction"] != "totalSupply" else None
+
+    vault_contract = get_contract(VAULT, blockchain, web3=web3, abi=ABI_VAULT)
+    pool_tokens = vault_contract.functions.getPoolTokens(pool_id).call()[0]
+
+    token_contracts = [
+        get_contract(token_address, blockchain, web3=web3, abi=ABI_POOL_TOKENS_BALANCER)
+        for token_address in pool_tokens
+    ]
+    token_data = multicall(
+        [
+            method
+            for token_contract in token_contracts
+            for method in [
+                token_contract.functions.decimals(),
+                token_contract.functions.getRate(),
+                token_contract.functions.UNDERLYING(),
+                token_contract.functions.UNDERLYING_ASSET_ADDRESS(),
+                token_contract.functions.stETH(),
+            ]
+        ],
+        "latest",
+        blockchain,
+        web3=web3,
+    )
+
+    for i, token_address in enumerate(pool_tokens):
+        token = {"address": token_address, "mainToken": token_address, "type": "token"}
+        token["decimals"], rate, underlying_token, underlying_asset_address, steth = token_data[5 * i : 5 * i + 5]
+
+        if i == structure["bptIndex"]:
+            token["type"] = "bpt"
+        elif rate is not None:
+            token["type"] = "pool"
+        elif underlying_token is not None:
+            token["mainToken"] = underlying_token
+        elif underlying_asset_address is not None:
+            token["mainToken"] = underlying_asset_address
+        elif steth is not None:
+            token["type"] = "wsteth"
+
+        structure["tokens"].append(token)
+
+    return structure
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_pool_graph
+# Output: a dictionary with the structure of the pool and of all the pools nested in it, by pool address
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_pool_graph(lptoken_address, block, blockchain, web3=None, graph=None):
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    if graph is None:
+        graph = {}
+
+    graph[lptoken_address] = get_pool_structure(lptoken_address, block, blockchain, web3=web3)
+    for token in graph[lptoken_address]["tokens"]:
+        if token["type"] == "pool" and token["address"] not in graph:
+            get_pool_graph(token["address"], block, blockchain, web3=web3, graph=graph)
+
+    return graph
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_pool_graph_state
+# Output: a dictionary with the supply, scaling factors and balances of the pool and of all the pools nested in it at the block,
+# by pool address. They are all read in a single batch.
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+@cache_call(exclude_args=["web3"], filter=latest_not_in_params)
+def get_pool_graph_state(lptoken_address, block, blockchain, web3=None):
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    graph = get_pool_graph(lptoken_address, block, blockchain, web3=web3)
+    pools = [pool for pool, structure in graph.items() if structure["poolId"] is not None]
+
+    vault_contract = get_contract(VAULT, blockchain, web3=web3, abi=ABI_VAULT, block=block)
+    calls = []
+    for pool in pools:
+        lptoken_contract = get_contract(pool, blockchain, web3=web3, abi=ABI_LPTOKEN, block=block)
+        calls += [
+            getattr(lptoken_contract.functions, graph[pool]["supplyFunction"])(),
+            lptoken_contract.functions.getScalingFactors(),
+            vault_contract.functions.getPoolTokens(graph[pool]["poolId"]),
+        ]
+    data = multicall(calls, block, blockchain, web3=web3)
+
+    state = {}
+    for i, pool in enumerate(pools):
+        total_supply, scaling_factors, pool_tokens_data = data[3 * i : 3 * i + 3]
+        state[pool] = {
+            "totalSupply": total_supply,
+            "scalingFactors": scaling_factors,
+            "balances": [Decimal(balance) for balance in pool_tokens_data[1]],
+        }
+
+    return state
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_pool_token_balances
+# Output: a list with the balances of each pool token, but the BPT, unwrapped down to the main tokens: [[main_token, balance], ...]
+# The balances are the whole pool's, they are memoized by pool and block.
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+@cache_call(exclude_args=["web3"], filter=latest_not_in_params)
+def get_pool_token_balances(lptoken_address, block, blockchain, web3=None, decimals=True):
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    graph = get_pool_graph(lptoken_address, block, blockchain, web3=web3)
+    state = get_pool_graph_state(lptoken_address, block, blockchain, web3=web3)
+
+    return _get_pool_token_balances(lptoken_address, graph, state, decimals, {})
+
+
+def _get_pool_token_balances(lptoken_address, graph, state, decimals, memo):
+    # Nested pools are unwrapped once, even if they are in more than one of the pools
+    if lptoken_address in memo:
+        return memo[lptoken_address]
+
+    token_balances = []
+    if graph[lptoken_address]["poolId"] is not None:
+        pool_state = state[lptoken_address]
+
+        for i, token in enumerate(graph[lptoken_address]["tokens"]):
+            if token["type"] == "bpt":
+                continue
+
+            if token["type"] == "pool":
+                unwrapped_balances = _unwrap(
+                    pool_state["balances"][i] / Decimal(10 ** token["decimals"]),
+                    token["address"],
+                    graph,
+                    state,
+                    decimals,
+                    memo,
+                )
+            else:
+                if pool_state["scalingFactors"] is not None and token["type"] != "wsteth":
+                    token_balance = (
+                        pool_state["balances"][i]
+                        * pool_state["scalingFactors"][i]
+                        / (10 ** (2 * 18 - token["decimals"]))
+                    )
+                else:
+                    token_balance = pool_state["balances"][i]
+
+                if decimals is True:
+                    token_balance = token_balance / (10 ** token["decimals"])
+
+                unwrapped_balances = [[token["mainToken"], token_balance]]
+
+            token_balances.append(unwrapped_balances)
+
+    memo[lptoken_address] = token_balances
+    return token_balances
+
+
+def _unwrap(lptoken_amount, lptoken_address, graph, state, decimals, memo):
+    balances = []
+
+    if graph[lptoken_address]["poolId"] is not None:
+        pool_balance_fraction = (
+            Decimal(lptoken_amount)
+            * Decimal(10 ** graph[lptoken_address]["decimals"])
+            / state[lptoken_address]["totalSupply"]
+        )
+
+        for unwrapped_balances in _get_pool_token_balances(lptoken_address, graph, state, decimals, memo):
+            for main_token, token_balance in unwrapped_balances:
+                balances.append([main_token, token_balance * pool_balance_fraction])
+
+        first = itemgetter(0)
+        balances = [[k, sum(item[1] for item in tups_to_sum)] for k, tups_to_sum in groupby(balances, key=first)]
+
+    return balances
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # get_bal_address
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -437,14 +676,11 @@ def underlying(wallet, lptoken_address, block, blockchain, web3=None, reward=Fal
 
     lptoken_address = Web3.to_checksum_address(lptoken_address)
 
-    vault_contract = get_contract(VAULT, blockchain, web3=web3, abi=ABI_VAULT, block=block)
-
     gauge_address = get_gauge_address(blockchain, block, web3, lptoken_address)
 
-    lptoken_data = get_lptoken_data(lptoken_address, block, blockchain, web3=web3)
-    lptoken_data["balanceOf"] = Decimal(
-        lptoken_data["contract"].functions.balanceOf(wallet).call(block_identifier=block)
-    )
+    lptoken_data = {"structure": get_pool_structure(lptoken_address, block, blockchain, web3=web3)}
+    lptoken_contract = get_contract(lptoken_address, blockchain, web3=web3, abi=ABI_LPTOKEN, block=block)
+    lptoken_data["balanceOf"] = Decimal(lptoken_contract.functions.balanceOf(wallet).call(block_identifier=block))
 
     if gauge_address != ZERO_ADDRESS:
         lptoken_data["staked"] = balance_of(wallet, gauge_address, block, blockchain, web3=web3, decimals=False)
@@ -463,71 +699,17 @@ def underlying(wallet, lptoken_address, block, blockchain, web3=None, reward=Fal
             except:
                 pass
 
-    if lptoken_data["poolId"] is not None:
-        pool_tokens_data = vault_contract.functions.getPoolTokens(lptoken_data["poolId"]).call(block_identifier=block)
-        pool_tokens = pool_tokens_data[0]
-        pool_balances = [Decimal(balance) for balance in pool_tokens_data[1]]
+    if lptoken_data["structure"]["poolId"] is not None:
+        lptoken_data["totalSupply"] = get_pool_graph_state(lptoken_address, block, blockchain, web3=web3)[
+            lptoken_address
+        ]["totalSupply"]
 
         pool_balance_fraction = lptoken_data["balanceOf"] / lptoken_data["totalSupply"]
         pool_staked_fraction = lptoken_data["staked"] / lptoken_data["totalSupply"]
         pool_locked_fraction = lptoken_data["locked"] / lptoken_data["totalSupply"]
-        for i in range(len(pool_tokens)):
-            if i == lptoken_data["bptIndex"]:
-                continue
-
-            token_address = pool_tokens[i]
-            token_contract = get_contract(
-                token_address, blockchain, web3=web3, abi=ABI_POOL_TOKENS_BALANCER, block=block
-            )
-
-            token_decimals = const_call(token_contract.functions.decimals())
-
-            unwrapped_balances = []
-
-            if call_contract_method(token_contract.functions.getRate(), block) is not None:
-                unwrapped_balances = unwrap(
-                    pool_balances[i] / (10**token_decimals),
-                    token_address,
-                    block,
-                    blockchain,
-                    web3=web3,
-                    decimals=decimals,
-                )
-            else:
-                is_wsteth = False
-                main_token = call_contract_method(token_contract.functions.UNDERLYING(), block)
-                if main_token is None:
-                    main_token = call_contract_method(token_contract.functions.UNDERLYING_ASSET_ADDRESS(), block)
-                    if main_token is None:
-                        main_token = token_address
-                        stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        if stETH is not None:
-                            is_wsteth = True
-                        # The previous 4 lines can be replaced by the commented code below to have stETH being returned instead of stETH
-                        # stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        # if stETH is not None:
-                        #    if lptoken_data["scalingFactors"] is not None and lptoken_data["scalingFactors"][i] != (
-                        #        10**18
-                        #    ):
-                        #        main_token = stETH
-                        #    else:
-                        #        main_token = token_address
-                        # else:
-                        #    main_token = token_address
-
-                # if lptoken_data["scalingFactors"] is not None:
-                if lptoken_data["scalingFactors"] is not None and not is_wsteth:
-                    token_balance = (
-                        pool_balances[i] * lptoken_data["scalingFactors"][i] / (10 ** (2 * 18 - token_decimals))
-                    )
-                else:
-                    token_balance = pool_balances[i]
-
-                if decimals is True:
-                    token_balance = token_balance / (10**token_decimals)
-
-                unwrapped_balances.append([main_token, token_balance])
-
+        for unwrapped_balances in get_pool_token_balances(
+            lptoken_address, block, blockchain, web3=web3, decimals=decimals
+        ):
             for main_token, token_balance in unwrapped_balances:
                 token_balance = Decimal(token_balance)
 
@@ -567,70 +749,41 @@ def pool_balances(lptoken_address, block, blockchain, web3=None, decimals=True):
 
     lptoken_address = Web3.to_checksum_address(lptoken_address)
 
-    vault_contract = get_contract(VAULT, blockchain, web3=web3, abi=ABI_VAULT, block=block)
-
-    lptoken_data = get_lptoken_data(lptoken_address, block, blockchain, web3=web3)
+    graph = get_pool_graph(lptoken_address, block, blockchain, web3=web3)
 
-    if lptoken_data["poolId"] is not None:
-        pool_tokens_data = vault_contract.functions.getPoolTokens(lptoken_data["poolId"]).call(block_identifier=block)
-        pool_tokens = pool_tokens_data[0]
-        pool_balances = [Decimal(balance) for balance in pool_tokens_data[1]]
+    if graph[lptoken_address]["poolId"] is not None:
+        state = get_pool_graph_state(lptoken_address, block, blockchain, web3=web3)
+        pool_state = state[lptoken_address]
+        memo = {}
 
-        for i in range(len(pool_tokens)):
-            if i == lptoken_data["bptIndex"]:
+        for i, token in enumerate(graph[lptoken_address]["tokens"]):
+            if token["type"] == "bpt":
                 continue
 
-            token_address = pool_tokens[i]
-            token_contract = get_contract(
-                token_address, blockchain, web3=web3, abi=ABI_POOL_TOKENS_BALANCER, block=block
-            )
-
-            token_decimals = const_call(token_contract.functions.decimals())
-
-            unwrapped_balances = []
-            if call_contract_method(token_contract.functions.getRate(), block) is not None:
-                unwrapped_balances = unwrap(
-                    pool_balances[i] / Decimal(10**token_decimals),
-                    token_address,
-                    block,
-                    blockchain,
-                    web3=web3,
-                    decimals=decimals,
+            if token["type"] == "pool":
+                unwrapped_balances = _unwrap(
+                    pool_state["balances"][i] / Decimal(10 ** token["decimals"]),
+                    token["address"],
+                    graph,
+                    state,
+                    decimals,
+                    memo,
                 )
             else:
-                is_wsteth = False
-                main_token = call_contract_method(token_contract.functions.UNDERLYING(), block)
-                if main_token is None:
-                    main_token = call_contract_method(token_contract.functions.UNDERLYING_ASSET_ADDRESS(), block)
-                    if main_token is None:
-                        main_token = token_address
-                        stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        if stETH is not None:
-                            is_wsteth = True
-                        # The previous 4 lines can be replaced by the commented code below to have stETH being returned instead of stETH
-                        # stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        # if stETH is not None:
-                        #    if lptoken_data["scalingFactors"] is not None and lptoken_data["scalingFactors"][i] != (
-                        #        10**18
-                        #    ):
-                        #        main_token = stETH
-                        #    else:
-                        #        main_token = token_address
-                        # else:
-                        #    main_token = token_address
-
-                # if lptoken_data["scalingFactors"] is not None:
-                if lptoken_data["scalingFactors"] is not None and not is_wsteth:
+                main_token = token["mainToken"]
+                if pool_state["scalingFactors"] is not None and token["type"] != "wsteth":
                     token_balance = (
-                        pool_balances[i] * lptoken_data["scalingFactors"][i] / Decimal(10 ** (2 * 18 - token_decimals))
+                        pool_state["balances"][i]
+                        * pool_state["scalingFactors"][i]
+                        / Decimal(10 ** (2 * 18 - token["decimals"]))
                     )
                 else:
-                    main_token = pool_tokens[i]
-                    token_balance = pool_balances[i]
+                    main_token = token["address"]
+                    token_balance = pool_state["balances"][i]
 
-                unwrapped_balances.append(
+                unwrapped_balances = [
                     [main_token, to_token_amount(main_token, token_balance, blockchain, web3, decimals)]
-                )
+                ]
 
             for main_token, token_balance in unwrapped_balances:
                 balances.append([main_token, token_balance])
@@ -652,92 +805,20 @@ def unwrap(
     web3: Web3 = None,
     decimals: bool = True,
 ) -> Decimal:
-    balances = []
-
     if web3 is None:
         web3 = get_node(blockchain, block=block)
 
     lptoken_address = Web3.to_checksum_address(lptoken_address)
 
-    vault_contract = get_contract(VAULT, blockchain, web3=web3, abi=ABI_VAULT, block=block)
-
-    lptoken_data = get_lptoken_data(lptoken_address, block, blockchain, web3=web3)
-
-    if lptoken_data["poolId"] is not None:
-        pool_tokens_data = vault_contract.functions.getPoolTokens(lptoken_data["poolId"]).call(block_identifier=block)
-        pool_tokens = pool_tokens_data[0]
-        pool_balances = [Decimal(balance) for balance in pool_tokens_data[1]]
-
-        pool_balance_fraction = (
-            Decimal(lptoken_amount) * Decimal(10 ** lptoken_data["decimals"]) / lptoken_data["totalSupply"]
-        )
-
-        for i in range(len(pool_tokens)):
-            if i == lptoken_data["bptIndex"]:
-                continue
-
-            token_address = pool_tokens[i]
-            token_contract = get_contract(
-                token_address, blockchain, web3=web3, abi=ABI_POOL_TOKENS_BALANCER, block=block
-            )
-
-            token_decimals = const_call(token_contract.functions.decimals())
-
-            unwrapped_balances = []
-            if call_contract_method(token_contract.functions.getRate(), block) is not None:
-                unwrapped_balances = unwrap(
-                    pool_balances[i] / Decimal(10**token_decimals),
-                    token_address,
-                    block,
-                    blockchain,
-                    web3=web3,
-                    decimals=decimals,
-                )
-            else:
-                is_wsteth = False
-                main_token = call_contract_method(token_contract.functions.UNDERLYING(), block)
-                if main_token is None:
-                    main_token = call_contract_method(token_contract.functions.UNDERLYING_ASSET_ADDRESS(), block)
-                    if main_token is None:
-                        main_token = token_address
-                        stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        if stETH is not None:
-                            is_wsteth = True
-                        # The previous 4 lines can be replaced by the commented code below to have stETH being returned instead of stETH
-                        # stETH = call_contract_method(token_contract.functions.stETH(), block)
-                        # if stETH is not None:
-                        #    if lptoken_data["scalingFactors"] is not None and lptoken_data["scalingFactors"][i] != (
-                        #        10**18
-                        #    ):
-                        #        main_token = stETH
-                        #    else:
-                        #        main_token = token_address
-                        # else:
-                        #    main_token = token_address
-
-                # if lptoken_data["scalingFactors"] is not None:
-                if lptoken_data["scalingFactors"] is not None and not is_wsteth:
-                    token_balance = (
-                        pool_balances[i] * lptoken_data["scalingFactors"][i] / (10 ** (2 * 18 - token_decimals))
-                    )
-                else:
-                    token_balance = pool_balances[i]
+    graph = get_pool_graph(lptoken_address, block, blockchain, web3=web3)
+    if graph[lptoken_address]["poolId"] is None:
+        return []
 
-                if decimals is True:
-                    token_balance = token_balance / (10**token_decimals)
-
-                unwrapped_balances.append([main_token, token_balance])
+    state = get_pool_graph_state(lptoken_address, block, blockchain, web3=web3)
+    # The balances of the pool, unwrapped, are memoized: only the fraction of the amount is left
+    memo = {lptoken_address: get_pool_token_balances(lptoken_address, block, blockchain, web3=web3, decimals=decimals)}
 
-            for unwrapped_balance in unwrapped_balances:
-                main_token, token_balance = unwrapped_balance
-                token_balance = token_balance * pool_balance_fraction
-
-                balances.append([main_token, token_balance])
-
-        first = itemgetter(0)
-        balances = [[k, sum(item[1] for item in tups_to_sum)] for k, tups_to_sum in groupby(balances, key=first)]
-
-    return balances
+    return _unwrap(lptoken_amount, lptoken_address, graph, state, decimals, memo)
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -802,13 +883,7 @@ def get_swap_fees_APR(
     days: int = 1,
     apy: bool = False,
 ) -> Decimal:
-    block_start = date_to_block(
-        datetime.strftime(
-            datetime.strptime(block_to_date(block_end, blockchain), "%Y-%m-%d %H:%M:%S") - timedelta(days=days),
-            "%Y-%m-%d %H:%M:%S",
-        ),
-        blockchain,
-    )
+    block_start = timestamp_to_block(block_to_timestamp(block_end, blockchain) - days * 24 * 3600, blockchain)
 
     if block_start < BLOCKCHAIN_START_BLOCK[blockchain]:
         block_start = BLOCKCHAIN_START_BLOCK[blockchain]
@@ -2,6 +2,7 @@ from web3 import Web3
 
 from defi_protocols.cache import const_call
 from defi_protocols.functions import get_contract, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # LITERALS
@@ -81,3 +82,65 @@ def underlying_all(wallet: str, block: int, blockchain: str, web3=None, decimals
         balance = underlying(bn_token, wallet, block, blockchain, web3, decimals, reward)
         balances.append(balance)
     return balances
+
+
+def underlying_all_many(wallets: list, block: int, blockchain: str, web3=None, decimals=True, reward=True) -> dict:
+    """
+    Returns the output of underlying_all for each wallet, by wallet: the pools are read once and the balances and the
+    withdrawal amounts of all the wallets in batches.
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :param reward:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    checksum_wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+
+    liquiditypools_contract = get_contract(BANCOR_NETWORK_ADDRESS, blockchain, web3=web3, abi=ABI_NETWORK, block=block)
+    liquidity_pools = liquiditypools_contract.functions.liquidityPools().call(block_identifier=block)
+    network_info_address = get_contract(
+        BANCOR_NETWORK_INFO_ADDRESS, blockchain, web3=web3, abi=ABI_NETWORK_INFO, block=block
+    )
+
+    bancor_poolcontracts = [
+        get_contract(
+            const_call(network_info_address.functions.poolToken(pool)), blockchain, web3=web3, abi=ABI_POOL, block=block
+        )
+        for pool in liquidity_pools
+    ]
+    balances = multicall(
+        [contract.functions.balanceOf(wallet) for wallet in checksum_wallets for contract in bancor_poolcontracts],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    # (wallet, pool, balance) of the pools with a balance
+    positions = [
+        (i, j, balances[i * len(bancor_poolcontracts) + j])
+        for i in range(len(wallets))
+        for j in range(len(bancor_poolcontracts))
+        if balances[i * len(bancor_poolcontracts) + j] != 0
+    ]
+    reserve_tokens = {j: const_call(bancor_poolcontracts[j].functions.reserveToken()) for _, j, _ in positions}
+    bancor_pools = multicall(
+        [network_info_address.functions.withdrawalAmounts(reserve_tokens[j], balance) for _, j, balance in positions],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    results = {wallet: [[] for _ in bancor_poolcontracts] for wallet in wallets}
+    for (i, j, _), bancor_pool in zip(positions, bancor_pools):
+        pool_balances = results[wallets[i]][j]
+        pool_balances.append(
+            [reserve_tokens[j], to_token_amount(reserve_tokens[j], bancor_pool[1], blockchain, web3, decimals)]
+        )
+        if reward:
+            pool_balances.append([BNT_TOKEN, to_token_amount(BNT_TOKEN, bancor_pool[2], blockchain, web3, decimals)])
+    return results
@@ -2,9 +2,10 @@ from decimal import Decimal
 
 from web3 import Web3
 
-from defi_protocols.cache import const_call
-from defi_protocols.constants import COMP_ETH, ETHEREUM, ZERO_ADDRESS
-from defi_protocols.functions import balance_of, get_contract, get_decimals, get_node, to_token_amount
+from defi_protocols.cache import cache_call, const_call
+from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, COMP_ETH, ETHEREUM, ZERO_ADDRESS
+from defi_protocols.functions import get_contract, get_decimals, get_node, latest_not_in_params, to_token_amount
+from defi_protocols.multicall import multicall
 from defi_protocols.prices import prices
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -28,8 +29,8 @@ ABI_CTOKEN = '[{"constant":true,"inputs":[],"name":"decimals","outputs":[{"name"
 # Comptroller ABI - getAllMarkets, compRate, compSpeeds, compSupplySpeeds, compBorrowSpeeds
 ABI_COMPTROLLER = '[{"constant":true,"inputs":[],"name":"getAllMarkets","outputs":[{"internalType":"contract CToken[]","name":"","type":"address[]"}],"payable":false,"stateMutability":"view","type":"function"}, {"constant":true,"inputs":[],"name":"compRate","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"}, {"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"compSpeeds","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"}, {"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"compSupplySpeeds","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"}, {"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"compBorrowSpeeds","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"}]'
 
-# Compound Lens ABI - getCompBalanceMetadataExt
-ABI_COMPOUND_LENS = '[{"constant":false,"inputs":[{"internalType":"contract Comp","name":"comp","type":"address"},{"internalType":"contract ComptrollerLensInterface","name":"comptroller","type":"address"},{"internalType":"address","name":"account","type":"address"}],"name":"getCompBalanceMetadataExt","outputs":[{"components":[{"internalType":"uint256","name":"balance","type":"uint256"},{"internalType":"uint256","name":"votes","type":"uint256"},{"internalType":"address","name":"delegate","type":"address"},{"internalType":"uint256","name":"allocated","type":"uint256"}],"internalType":"struct CompoundLens.CompBalanceMetadataExt","name":"","type":"tuple"}],"payable":false,"stateMutability":"nonpayable","type":"function"}]'
+# Compound Lens ABI - getCompBalanceMetadataExt, cTokenBalancesAll
+ABI_COMPOUND_LENS = '[{"constant":false,"inputs":[{"internalType":"contract CToken[]","name":"cTokens","type":"address[]"},{"internalType":"address payable","name":"account","type":"address"}],"name":"cTokenBalancesAll","outputs":[{"components":[{"internalType":"address","name":"cToken","type":"address"},{"internalType":"uint256","name":"balanceOf","type":"uint256"},{"internalType":"uint256","name":"borrowBalanceCurrent","type":"uint256"},{"internalType":"uint256","name":"balanceOfUnderlying","type":"uint256"},{"internalType":"uint256","name":"tokenBalance","type":"uint256"},{"internalType":"uint256","name":"tokenAllowance","type":"uint256"}],"internalType":"struct CompoundLens.CTokenBalances[]","name":"","type":"tuple[]"}],"payable":false,"stateMutability":"nonpayable","type":"function"}, {"constant":false,"inputs":[{"internalType":"contract Comp","name":"comp","type":"address"},{"internalType":"contract ComptrollerLensInterface","name":"comptroller","type":"address"},{"internalType":"address","name":"account","type":"address"}],"name":"getCompBalanceMetadataExt","outputs":[{"components":[{"internalType":"uint256","name":"balance","type":"uint256"},{"internalType":"uint256","name":"votes","type":"uint256"},{"internalType":"address","name":"delegate","type":"address"},{"internalType":"uint256","name":"allocated","type":"uint256"}],"internalType":"struct CompoundLens.CompBalanceMetadataExt","name":"","type":"tuple"}],"payable":false,"stateMutability":"nonpayable","type":"function"}]'
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # WEB DOCS
@@ -76,6 +77,124 @@ def get_comptroller_contract(blockchain, web3, block):
     return get_contract(comptroller_address, blockchain, web3=web3, abi=ABI_COMPTROLLER, block=block)
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_markets_snapshot
+# 'web3' = web3 (Node) -> Improves performance
+# Output: a dict with 2 elements:
+# 'markets' - dict by cToken address: {'underlying', 'decimals', 'underlying_decimals', 'exchangeRateStored'}
+# 'ctokens_by_underlying' - dict by underlying token address: list of cToken addresses
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+@cache_call(exclude_args=["web3"], filter=latest_not_in_params)
+def get_markets_snapshot(block, blockchain, web3=None):
+    """
+    The data of all the markets at the block that doesn't depend on the wallet, read in 2 batches and cached by block.
+
+    :param block:
+    :param blockchain:
+    :param web3:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    ctoken_list = get_ctokens_contract_list(blockchain, web3, block)
+    ctoken_contracts = [
+        get_contract(ctoken_address, blockchain, web3=web3, abi=ABI_CTOKEN, block=block)
+        for ctoken_address in ctoken_list
+    ]
+    markets_data = multicall(
+        [
+            contract_function
+            for ctoken_contract in ctoken_contracts
+            for contract_function in [
+                ctoken_contract.functions.decimals(),
+                ctoken_contract.functions.underlying(),
+                ctoken_contract.functions.exchangeRateStored(),
+            ]
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    markets = {}
+    ctokens_by_underlying = {}
+    for i, ctoken_address in enumerate(ctoken_list):
+        ctoken_decimals, underlying_token, exchange_rate = markets_data[3 * i : 3 * i + 3]
+        # cETH does not have the underlying function
+        underlying_token = ZERO_ADDRESS if underlying_token is None else underlying_token
+        markets[ctoken_address] = {
+            "underlying": underlying_token,
+            "decimals": ctoken_decimals,
+            "exchangeRateStored": exchange_rate,
+        }
+        ctokens_by_underlying.setdefault(underlying_token, []).append(ctoken_address)
+
+    underlying_tokens = [token for token in ctokens_by_underlying if token != ZERO_ADDRESS]
+    underlying_decimals = multicall(
+        [
+            get_contract(token, blockchain, web3=web3, abi=ABI_TOKEN_SIMPLIFIED, block=block).functions.decimals()
+            for token in underlying_tokens
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    underlying_decimals = dict(zip(underlying_tokens, underlying_decimals))
+    for market in markets.values():
+        token_decimals = underlying_decimals.get(market["underlying"])
+        if token_decimals is None:
+            token_decimals = get_decimals(market["underlying"], blockchain, web3=web3, block=block)
+        market["underlying_decimals"] = token_decimals
+
+    return {"markets": markets, "ctokens_by_underlying": ctokens_by_underlying}
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_wallets_ctoken_balances
+# 'web3' = web3 (Node) -> Improves performance
+# Output: a dict by wallet with a dict by cToken address: [balanceOf, borrowBalanceStored]
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_wallets_ctoken_balances(wallets, ctokens, block, blockchain, web3=None):
+    """
+    Reads the balance and the borrow balance of every wallet in every cToken in a single batch.
+
+    :param wallets:
+    :param ctokens:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    ctoken_contracts = [
+        get_contract(ctoken_address, blockchain, web3=web3, abi=ABI_CTOKEN, block=block) for ctoken_address in ctokens
+    ]
+    wallets_data = multicall(
+        [
+            contract_function
+            for wallet in wallets
+            for ctoken_contract in ctoken_contracts
+            for contract_function in [
+                ctoken_contract.functions.balanceOf(Web3.to_checksum_address(wallet)),
+                ctoken_contract.functions.borrowBalanceStored(Web3.to_checksum_address(wallet)),
+            ]
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: {
+            ctoken_address: wallets_data[2 * (i * len(ctokens) + j) :][:2] for j, ctoken_address in enumerate(ctokens)
+        }
+        for i, wallet in enumerate(wallets)
+    }
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # get_ctoken_data
 # 'web3' = web3 (Node) -> Improves performance
@@ -123,8 +242,73 @@ def get_ctoken_data(ctoken_address, wallet, block, blockchain, web3=None, ctoken
     return ctoken_data
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# get_wallets_lens_balances
+# 'web3' = web3 (Node) -> Improves performance
+# Output: a dict by wallet with a dict by cToken address: [balanceOf, balanceOfUnderlying, borrowBalanceCurrent],
+# or None for the wallets whose balances the lens couldn't read
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def get_wallets_lens_balances(wallets, ctokens, block, blockchain, web3=None):
+    """
+    Reads the balances of every wallet in all the cTokens with a single cTokenBalancesAll call to the Compound Lens per
+    wallet, all of them in one batch. Unlike balanceOf and borrowBalanceStored, the underlying and borrow balances
+    include the interest accrued until the block.
+
+    :param wallets:
+    :param ctokens:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :return:
+    """
+    compound_lens_address = get_compound_lens_address(blockchain)
+    if compound_lens_address is None:
+        return {wallet: None for wallet in wallets}
+
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    compound_lens_contract = get_contract(
+        compound_lens_address, blockchain, web3=web3, abi=ABI_COMPOUND_LENS, block=block
+    )
+    # the lens reverts or isn't deployed yet at the block: None
+    lens_balances = multicall(
+        [
+            compound_lens_contract.functions.cTokenBalancesAll(ctokens, Web3.to_checksum_address(wallet))
+            for wallet in wallets
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: None
+        if ctoken_balances is None
+        else {
+            ctoken_balance[0]: [ctoken_balance[1], ctoken_balance[3], ctoken_balance[2]]
+            for ctoken_balance in ctoken_balances
+        }
+        for wallet, ctoken_balances in zip(wallets, lens_balances)
+    }
+
+
+def _get_ctoken_data(market, wallet_balances):
+    # the same data as get_ctoken_data, from the markets snapshot and the balances of the wallet
+    balance_of, borrow_balance_stored = wallet_balances
+    return dict(market, balanceOf=balance_of, borrowBalanceStored=borrow_balance_stored)
+
+
+def _to_underlying_amount(amount, underlying_token_decimals, decimals):
+    amount = Decimal(amount)
+    return amount / Decimal(10**underlying_token_decimals) if decimals else amount
+
+
 def _get_token_balance(ctoken_data, token_address, block, blockchain, web3, decimals):
-    underlying_token_decimals = get_decimals(token_address, block=block, blockchain=blockchain, web3=web3)
+    if "underlying_decimals" in ctoken_data:
+        underlying_token_decimals = ctoken_data["underlying_decimals"]
+    else:
+        underlying_token_decimals = get_decimals(token_address, block=block, blockchain=blockchain, web3=web3)
 
     mantissa = 18 - ctoken_data["decimals"] + underlying_token_decimals
     exchange_rate = ctoken_data["exchangeRateStored"] / Decimal(10**mantissa)
@@ -162,28 +346,12 @@ def underlying(wallet, token_address, block, blockchain, web3=None, decimals=Tru
     wallet = Web3.to_checksum_address(wallet)
     token_address = Web3.to_checksum_address(token_address)
 
-    ctoken_list = get_ctokens_contract_list(blockchain, web3, block)
-    for ctoken_address in ctoken_list:
-        ctoken_contract = get_contract(ctoken_address, blockchain, web3=web3, abi=ABI_CTOKEN, block=block)
-
-        symbol = const_call(ctoken_contract.functions.symbol())
-        if symbol == "cETH":
-            # cETH does not have the underlying function
-            underlying_token = ZERO_ADDRESS
-        else:
-            underlying_token = ctoken_contract.functions.underlying().call(block_identifier=block)
-
-        if underlying_token == token_address:
-            ctoken_data = get_ctoken_data(
-                ctoken_address,
-                wallet,
-                block,
-                blockchain,
-                web3=web3,
-                ctoken_contract=ctoken_contract,
-                underlying_token=underlying_token,
-            )
-            balances.append(_get_token_balance(ctoken_data, token_address, block, blockchain, web3, decimals))
+    markets_snapshot = get_markets_snapshot(block, blockchain, web3=web3)
+    ctokens = markets_snapshot["ctokens_by_underlying"].get(token_address, [])
+    wallet_balances = get_wallets_ctoken_balances([wallet], ctokens, block, blockchain, web3=web3)[wallet]
+    for ctoken_address in ctokens:
+        ctoken_data = _get_ctoken_data(markets_snapshot["markets"][ctoken_address], wallet_balances[ctoken_address])
+        balances.append(_get_token_balance(ctoken_data, token_address, block, blockchain, web3, decimals))
 
     return balances
 
@@ -193,11 +361,12 @@ def underlying(wallet, token_address, block, blockchain, web3=None, decimals=Tru
 # 'web3' = web3 (Node) -> Improves performance
 # 'reward' = True -> retrieves the rewards / 'reward' = False or not passed onto the function -> no reward retrieval
 # 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# 'lens' = True -> the balances, with the interest accrued until the block, are read with the Compound Lens (see get_wallets_lens_balances)
 # Output: a list with 2 elements:
 # 1 - List of Tuples: [liquidity_token_address, balance]
 # 2 - List of Tuples: [reward_token_address, balance]
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=False):
+def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=False, lens=False):
     """
     :param wallet:
     :param block:
@@ -205,45 +374,78 @@ def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=F
     :param web3:
     :param decimals:
     :param reward:
+    :param lens:
     :return:
     """
-    balances = []
-
-    if web3 is None:
-        web3 = get_node(blockchain, block=block)
+    return underlying_all_many([wallet], block, blockchain, web3=web3, decimals=decimals, reward=reward, lens=lens)[
+        wallet
+    ]
 
-    wallet = Web3.to_checksum_address(wallet)
 
-    ctoken_list = get_ctokens_contract_list(blockchain, web3, block)
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# underlying_all_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'reward' = True -> retrieves the rewards / 'reward' = False or not passed onto the function -> no reward retrieval
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# 'lens' = True -> the balances, with the interest accrued until the block, are read with the Compound Lens (see get_wallets_lens_balances)
+# Output: a dict with the output of underlying_all for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def underlying_all_many(wallets, block, blockchain, web3=None, decimals=True, reward=False, lens=False):
+    """
+    The markets snapshot (see get_markets_snapshot) is shared by all the wallets, and the balances of all the wallets in
+    all the markets are read in a single batch. With 'lens', the wallets whose balances the lens can't read at the block
+    fall back to balanceOf and borrowBalanceStored.
 
-    for ctoken_address in ctoken_list:
-        if balance_of(wallet, ctoken_address, block, blockchain, web3=web3) > 0:
-            ctoken_contract = get_contract(ctoken_address, blockchain, web3=web3, abi=ABI_CTOKEN, block=block)
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :param reward:
+    :param lens:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
 
-            symbol = const_call(ctoken_contract.functions.symbol())
-            if symbol == "cETH":
-                # cETH does not have the underlying function
-                underlying_token = ZERO_ADDRESS
-            else:
-                underlying_token = ctoken_contract.functions.underlying().call(block_identifier=block)
-
-            ctoken_data = get_ctoken_data(
-                ctoken_address,
-                wallet,
-                block,
-                blockchain,
-                web3=web3,
-                ctoken_contract=ctoken_contract,
-                underlying_token=underlying_token,
-            )
+    markets_snapshot = get_markets_snapshot(block, blockchain, web3=web3)
+    ctokens = list(markets_snapshot["markets"])
 
-            balances.append(_get_token_balance(ctoken_data, underlying_token, block, blockchain, web3, decimals))
+    lens_balances = {}
+    if lens:
+        lens_balances = get_wallets_lens_balances(wallets, ctokens, block, blockchain, web3=web3)
+    fallback_wallets = [wallet for wallet in wallets if lens_balances.get(wallet) is None]
+    wallets_balances = get_wallets_ctoken_balances(fallback_wallets, ctokens, block, blockchain, web3=web3)
 
     if reward is True:
-        all_rewards = all_comp_rewards(wallet, block, blockchain, web3=web3, decimals=decimals)
-        balances = [balances, all_rewards]
+        rewards = all_comp_rewards_many(wallets, block, blockchain, web3=web3, decimals=decimals)
+
+    result = {}
+    for wallet in wallets:
+        balances = []
+        for ctoken_address in ctokens:
+            market = markets_snapshot["markets"][ctoken_address]
+            if wallet in wallets_balances:
+                ctoken_data = _get_ctoken_data(market, wallets_balances[wallet][ctoken_address])
+                if ctoken_data["balanceOf"]:
+                    balances.append(
+                        _get_token_balance(ctoken_data, ctoken_data["underlying"], block, blockchain, web3, decimals)
+                    )
+            else:
+                balance_of, balance_of_underlying, borrow_balance_current = lens_balances[wallet][ctoken_address]
+                if balance_of:
+                    balances.append(
+                        [
+                            market["underlying"],
+                            _to_underlying_amount(
+                                balance_of_underlying - borrow_balance_current, market["underlying_decimals"], decimals
+                            ),
+                        ]
+                    )
+
+        result[wallet] = [balances, rewards[wallet]] if reward is True else balances
 
-    return balances
+    return result
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -288,6 +490,51 @@ def all_comp_rewards(wallet, block, blockchain, web3=None, decimals=True):
     return all_rewards
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# all_comp_rewards_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of all_comp_rewards for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def all_comp_rewards_many(wallets, block, blockchain, web3=None, decimals=True):
+    """
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    compound_lens_address = get_compound_lens_address(blockchain)
+    comp_token_address = get_compound_token_address(blockchain)
+    comptroller_address = get_comptoller_address(blockchain)
+    if not (compound_lens_address and comp_token_address and comptroller_address):
+        return {wallet: [] for wallet in wallets}
+
+    compound_lens_contract = get_contract(
+        compound_lens_address, blockchain, web3=web3, abi=ABI_COMPOUND_LENS, block=block
+    )
+    meta_datas = multicall(
+        [
+            compound_lens_contract.functions.getCompBalanceMetadataExt(
+                comp_token_address, comptroller_address, Web3.to_checksum_address(wallet)
+            )
+            for wallet in wallets
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: [[comp_token_address, to_token_amount(comp_token_address, meta_data[3], blockchain, web3, decimals)]]
+        for wallet, meta_data in zip(wallets, meta_datas)
+    }
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # unwrap
 # 'web3' = web3 (Node) -> Improves performance
@@ -1,8 +1,6 @@
 from dataclasses import dataclass, field
 from decimal import Decimal
 
-from gql import Client, gql  # thegraph queries
-from gql.transport.requests import RequestsHTTPTransport
 from web3 import Web3
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
@@ -64,6 +62,10 @@ def query_assets(subgraph_api_endpoint: str) -> list:
     first = 1000
     status = "true"
 
+    # thegraph queries, gql is only imported when it's used
+    from gql import Client, gql
+    from gql.transport.requests import RequestsHTTPTransport
+
     # Initialize subgraph
     connext_transport = RequestsHTTPTransport(url=subgraph_api_endpoint, verify=True, retries=3)
     client = Client(transport=connext_transport)
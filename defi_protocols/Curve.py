@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Union
 
@@ -10,13 +9,13 @@ from defi_protocols.cache import const_call
 from defi_protocols.constants import CRV_ETH, CRV_XDAI, E_ADDRESS, ETHEREUM, X3CRV_ETH, X3CRV_XDAI, XDAI, ZERO_ADDRESS
 from defi_protocols.functions import (
     balance_of,
-    block_to_date,
-    date_to_block,
+    block_to_timestamp,
     get_contract,
     get_contract_abi,
     get_decimals,
     get_logs_web3,
     get_node,
+    timestamp_to_block,
     to_token_amount,
 )
 from defi_protocols.prices.prices import get_price
@@ -742,13 +741,7 @@ def get_base_apr(
     if web3 is None:
         web3 = get_node(blockchain, block=block_end)
 
-    block_start = date_to_block(
-        datetime.strftime(
-            datetime.strptime(block_to_date(block_end, blockchain), "%Y-%m-%d %H:%M:%S") - timedelta(days=days),
-            "%Y-%m-%d %H:%M:%S",
-        ),
-        blockchain,
-    )
+    block_start = timestamp_to_block(block_to_timestamp(block_end, blockchain) - days * 24 * 3600, blockchain)
     lptoken_address = Web3.to_checksum_address(lptoken_address)
     address_abi = get_contract_abi(lptoken_address, blockchain)
 
@@ -6,6 +6,7 @@ from web3 import Web3
 from defi_protocols.cache import const_call
 from defi_protocols.Curve import unwrap
 from defi_protocols.functions import get_contract, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 from defi_protocols.util.api import RequestFromScan
 from defi_protocols.util.topic import decode_address_hexor
 
@@ -169,6 +170,13 @@ def get_amount(
     pool_totals = pool_token_vault.functions.getPoolTokens(pool_id).call(block_identifier=block)
 
     amount = pt_token_balanceOf + pool_totals[1][0] * pool_share_wallet + pool_totals[1][1] * pool_share_wallet
+
+    return _amount_to_balance(amount, name, underlying_token, pool_address, block, blockchain, web3, decimals)
+
+
+def _amount_to_balance(
+    amount, name: str, underlying_token: str, pool_address: str, block: int, blockchain: str, web3, decimals: bool
+) -> list:
     balance = []
     if amount != 0:
         if "Curve" in name or "crv" in name.lower():
@@ -237,3 +245,71 @@ def underlying_all(wallet: str, block: int, blockchain: str, web3=None, decimals
                 }
             )
     return balances
+
+
+def underlying_all_many(wallets: list, block: int, blockchain: str, web3=None, decimals=True) -> dict:
+    """Returns the output of underlying_all for each wallet, by wallet.
+
+    The tranches and their pools are read once; the balances of all the wallets are read in one batch.
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    checksum_wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+    tranches = get_tranches(block, blockchain, web3)
+
+    pt_token_contracts = []
+    pool_token_contracts = []
+    pool_calls = []
+    for tranche in tranches:
+        pt_token_contracts.append(get_contract(tranche.principal_token, blockchain, web3=web3, abi=PT_ABI, block=block))
+        pool_token_contract = get_contract(
+            tranche.pool_addr, blockchain=blockchain, web3=web3, abi=LP_PYV_ABI, block=block
+        )
+        pool_token_contracts.append(pool_token_contract)
+        pool_token_vault = get_contract(
+            const_call(pool_token_contract.functions.getVault()),
+            blockchain,
+            web3=web3,
+            abi=BALANCER_VAULT_ABI,
+            block=block,
+        )
+        pool_calls += [
+            pool_token_contract.functions.totalSupply(),
+            pool_token_vault.functions.getPoolTokens(tranche.pool_id),
+        ]
+    pool_data = multicall(pool_calls, block, blockchain, web3=web3)
+
+    wallet_balances = multicall(
+        [
+            contract.functions.balanceOf(wallet)
+            for wallet in checksum_wallets
+            for contracts in zip(pt_token_contracts, pool_token_contracts)
+            for contract in contracts
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    results = {wallet: [] for wallet in wallets}
+    wallet_balances = iter(wallet_balances)
+    for wallet in wallets:
+        for tranche, pool_total_supply, pool_totals in zip(tranches, pool_data[::2], pool_data[1::2]):
+            pt_token_balanceOf = next(wallet_balances)
+            pool_share_wallet = next(wallet_balances) / Decimal(pool_total_supply)
+            amount = pt_token_balanceOf + pool_totals[1][0] * pool_share_wallet + pool_totals[1][1] * pool_share_wallet
+            amounts = _amount_to_balance(
+                amount, tranche.name, tranche.underlying, tranche.pool_addr, block, blockchain, web3, decimals
+            )
+            if amounts:
+                results[wallet].append(
+                    {
+                        "protocol": "Element",
+                        "tranche": tranche.name,
+                        "amounts": amounts,
+                        "lptoken_address": tranche.underlying,
+                        "wallet": wallet,
+                    }
+                )
+    return results
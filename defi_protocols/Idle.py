@@ -9,7 +9,7 @@ from web3 import Web3
 
 from defi_protocols.cache import const_call
 from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, ETHEREUM
-from defi_protocols.functions import get_contract, get_node, to_token_amount
+from defi_protocols.functions import get_contract, get_logs_web3, get_node, to_token_amount
 from defi_protocols.util.topic import decode_address_hexor
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -66,7 +66,7 @@ def get_addresses(block: Union[int, str], blockchain: str, web3=None, decimals:
     if web3 is None:
         web3 = get_node(blockchain, block=block)
 
-    cdo_events = web3.eth.get_logs({"fromBlock": 0, "toBlock": block, "address": CDO_PROXY})
+    cdo_events = get_logs_web3(CDO_PROXY, blockchain, block_start=0, block_end=block, web3=web3)
     gauges = get_gauges(block, blockchain, web3=web3)
     for event in cdo_events:
         cdo_address = decode_address_hexor(event["data"])
@@ -3,9 +3,17 @@ from decimal import Decimal
 from web3 import Web3
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
-from defi_protocols.cache import const_call
-from defi_protocols.constants import OPTIMISM, ZERO_ADDRESS
-from defi_protocols.functions import get_contract, get_decimals, get_node, last_block, to_token_amount
+from defi_protocols.cache import cache_call, const_call
+from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, OPTIMISM, ZERO_ADDRESS
+from defi_protocols.functions import (
+    get_contract,
+    get_decimals,
+    get_node,
+    last_block,
+    latest_not_in_params,
+    to_token_amount,
+)
+from defi_protocols.multicall import multicall
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # UNITROLLER
@@ -120,6 +128,113 @@ def get_itoken_data(itoken_address, wallet, block, blockchain, web3=None, underl
     return itoken_data
 
 
+# Output: a dict with 2 elements:
+# 'markets' - dict by iToken address: {'underlying', 'decimals', 'underlying_decimals', 'exchangeRateStored'}
+# 'itokens_by_underlying' - dict by underlying token address: list of iToken addresses
+@cache_call(exclude_args=["web3"], filter=latest_not_in_params)
+def get_markets_snapshot(block, blockchain, web3=None):
+    """The data of all the markets at the block that doesn't depend on the wallet, read in 2 batches and cached by
+    block.
+    """
+    if not web3:
+        web3 = get_node(blockchain, block=block)
+
+    unitroller_contract = get_contract(
+        get_comptoller_address(blockchain), blockchain, web3=web3, abi=ABI_UNITROLLER, block=block
+    )
+    all_markets = unitroller_contract.functions.getAllMarkets().call(block_identifier=block)
+    itoken_contracts = [
+        get_contract(itoken, blockchain, web3=web3, abi=ABI_ITOKEN, block=block) for itoken in all_markets
+    ]
+    markets_data = multicall(
+        [
+            contract_function
+            for itoken_contract in itoken_contracts
+            for contract_function in [
+                itoken_contract.functions.decimals(),
+                itoken_contract.functions.underlying(),
+                itoken_contract.functions.exchangeRateStored(),
+            ]
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    markets = {}
+    itokens_by_underlying = {}
+    for i, itoken in enumerate(all_markets):
+        itoken_decimals, underlying_token, exchange_rate = markets_data[3 * i : 3 * i + 3]
+        underlying_token = ZERO_ADDRESS if underlying_token is None else underlying_token
+        markets[itoken] = {
+            "underlying": underlying_token,
+            "decimals": itoken_decimals,
+            "exchangeRateStored": exchange_rate,
+        }
+        itokens_by_underlying.setdefault(underlying_token, []).append(itoken)
+
+    underlying_tokens = [token for token in itokens_by_underlying if token != ZERO_ADDRESS]
+    underlying_decimals = multicall(
+        [
+            get_contract(token, blockchain, web3=web3, abi=ABI_TOKEN_SIMPLIFIED, block=block).functions.decimals()
+            for token in underlying_tokens
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    underlying_decimals = dict(zip(underlying_tokens, underlying_decimals))
+    for market in markets.values():
+        token_decimals = underlying_decimals.get(market["underlying"])
+        if token_decimals is None:
+            token_decimals = get_decimals(market["underlying"], blockchain, web3=web3, block=block)
+        market["underlying_decimals"] = token_decimals
+
+    return {"markets": markets, "itokens_by_underlying": itokens_by_underlying}
+
+
+# Output: a dict by wallet with a dict by iToken address: [balanceOf, borrowBalanceStored]
+def get_wallets_itoken_balances(wallets, itokens, block, blockchain, web3=None):
+    """Reads the balance and the borrow balance of every wallet in every iToken in a single batch."""
+    if not web3:
+        web3 = get_node(blockchain, block=block)
+
+    itoken_contracts = [get_contract(itoken, blockchain, web3=web3, abi=ABI_ITOKEN, block=block) for itoken in itokens]
+    wallets_data = multicall(
+        [
+            contract_function
+            for wallet in wallets
+            for itoken_contract in itoken_contracts
+            for contract_function in [
+                itoken_contract.functions.balanceOf(Web3.to_checksum_address(wallet)),
+                itoken_contract.functions.borrowBalanceStored(Web3.to_checksum_address(wallet)),
+            ]
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: {itoken: wallets_data[2 * (i * len(itokens) + j) :][:2] for j, itoken in enumerate(itokens)}
+        for i, wallet in enumerate(wallets)
+    }
+
+
+def _get_underlying_token_balance(market, balance_of, borrow_balance_stored, decimals):
+    mantissa = 18 - market["decimals"] + market["underlying_decimals"]
+    exchange_rate = Decimal(market["exchangeRateStored"]) / Decimal(10**mantissa)
+
+    underlying_token_balance = Decimal(balance_of) / Decimal(10 ** market["decimals"]) * exchange_rate - Decimal(
+        borrow_balance_stored
+    ) / Decimal(10 ** market["underlying_decimals"])
+
+    if not decimals:
+        underlying_token_balance = underlying_token_balance * Decimal(10 ** market["underlying_decimals"])
+
+    return underlying_token_balance
+
+
 def get_all_rewards(wallet, itoken, block, blockchain, web3=None, decimals=True, staking_rewards_contract=None):
     all_rewards = []
 
@@ -154,14 +269,8 @@ def get_all_rewards(wallet, itoken, block, blockchain, web3=None, decimals=True,
     return all_rewards
 
 
-def all_rewards(wallet, block, blockchain, web3=None, decimals=True):
-    result = []
-
-    if web3 is None:
-        web3 = get_node(blockchain, block=block)
-
-    wallet = Web3.to_checksum_address(wallet)
-
+def get_rewards_tokens(block, blockchain, web3):
+    """Returns the address of the staking rewards helper and the tokens given as rewards by the staking contracts."""
     staking_rewards_factory_contract = get_contract(
         get_staking_rewards_factory_address(blockchain),
         blockchain,
@@ -189,6 +298,18 @@ def all_rewards(wallet, block, blockchain, web3=None, decimals=True):
             if rewards_token is not [] and rewards_token not in rewards_tokens:
                 rewards_tokens.append(rewards_token)
 
+    return staking_rewards_helper_address, rewards_tokens
+
+
+def all_rewards(wallet, block, blockchain, web3=None, decimals=True):
+    result = []
+
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    wallet = Web3.to_checksum_address(wallet)
+
+    staking_rewards_helper_address, rewards_tokens = get_rewards_tokens(block, blockchain, web3)
     if staking_rewards_helper_address is not ZERO_ADDRESS and rewards_tokens is not []:
         staking_rewards_helper_contract = get_contract(
             staking_rewards_helper_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS_HELPER, block=block
@@ -197,16 +318,50 @@ def all_rewards(wallet, block, blockchain, web3=None, decimals=True):
         user_claimable_rewards = call_contract_method(
             staking_rewards_helper_contract.functions.getUserClaimableRewards(wallet, rewards_tokens), block
         )
-        if user_claimable_rewards is None:
-            for reward_token in rewards_tokens:
-                result.append([reward_token, Decimal("0")])
+        result = _get_claimable_rewards(user_claimable_rewards, rewards_tokens, decimals)
+
+    return result
+
+
+def all_rewards_many(wallets, block, blockchain, web3=None, decimals=True):
+    """Returns all_rewards of each wallet, keyed by wallet. The claimable rewards of all the wallets are read in a batch."""
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    staking_rewards_helper_address, rewards_tokens = get_rewards_tokens(block, blockchain, web3)
+    if staking_rewards_helper_address is ZERO_ADDRESS or rewards_tokens == []:
+        return {wallet: [] for wallet in wallets}
+
+    staking_rewards_helper_contract = get_contract(
+        staking_rewards_helper_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS_HELPER, block=block
+    )
+    users_claimable_rewards = multicall(
+        [
+            staking_rewards_helper_contract.functions.getUserClaimableRewards(
+                Web3.to_checksum_address(wallet), rewards_tokens
+            )
+            for wallet in wallets
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: _get_claimable_rewards(user_claimable_rewards, rewards_tokens, decimals)
+        for wallet, user_claimable_rewards in zip(wallets, users_claimable_rewards)
+    }
+
 
-            return result
+def _get_claimable_rewards(user_claimable_rewards, rewards_tokens, decimals):
+    if user_claimable_rewards is None:
+        return [[reward_token, Decimal("0")] for reward_token in rewards_tokens]
 
-        for user_claimable_reward in user_claimable_rewards:
-            rew_decs = user_claimable_reward[0][2] if decimals else 0
-            reward_amount = Decimal(user_claimable_reward[1]) / Decimal(10**rew_decs)
-            result.append([user_claimable_reward[0][0], reward_amount])
+    result = []
+    for user_claimable_reward in user_claimable_rewards:
+        rew_decs = user_claimable_reward[0][2] if decimals else 0
+        reward_amount = Decimal(user_claimable_reward[1]) / Decimal(10**rew_decs)
+        result.append([user_claimable_reward[0][0], reward_amount])
 
     return result
 
@@ -286,19 +441,9 @@ def underlying(wallet, token_address, block, blockchain, web3=None, decimals=Tru
     if itoken == ZERO_ADDRESS:
         return []
 
-    itoken_data = get_itoken_data(itoken, wallet, block, blockchain, web3=web3, underlying_token=token_address)
-
-    underlying_token_decimals = get_decimals(token_address, block=block, blockchain=blockchain, web3=web3)
-    mantissa = 18 - (itoken_data["decimals"]) + underlying_token_decimals
-
-    exchange_rate = Decimal(itoken_data["exchangeRateStored"]) / Decimal(10**mantissa)
-
-    underlying_token_balance = Decimal(itoken_data["balanceOf"]) / Decimal(
-        10 ** itoken_data["decimals"]
-    ) * exchange_rate - Decimal(itoken_data["borrowBalanceStored"]) / Decimal(10**underlying_token_decimals)
-
-    if not decimals:
-        underlying_token_balance = underlying_token_balance * Decimal(10**underlying_token_decimals)
+    market = get_markets_snapshot(block, blockchain, web3=web3)["markets"][itoken]
+    wallet_balances = get_wallets_itoken_balances([wallet], [itoken], block, blockchain, web3=web3)[wallet]
+    underlying_token_balance = _get_underlying_token_balance(market, *wallet_balances[itoken], decimals)
 
     staking_rewards_address = const_call(staking_rewards_factory_contract.functions.getStakingRewards(itoken))
     staking_rewards_contract = get_contract(
@@ -346,88 +491,90 @@ def underlying(wallet, token_address, block, blockchain, web3=None, decimals=Tru
 # 1 - List of Tuples: [liquidity_token_address, balance, staked_balance]
 # 2 - List of Tuples: [reward_token_address, balance]
 def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=False):
-    balances = []
+    return underlying_all_many([wallet], block, blockchain, web3=web3, decimals=decimals, reward=reward)[wallet]
 
+
+# Output: a dict with the output of underlying_all for each wallet, by wallet
+def underlying_all_many(wallets, block, blockchain, web3=None, decimals=True, reward=False):
+    """The markets snapshot (see get_markets_snapshot) is shared by all the wallets. The balances and borrows of all
+    the wallets are read in a single batch, and their staked iTokens in another.
+    """
     if not web3:
         web3 = get_node(blockchain, block=block)
 
-    wallet = Web3.to_checksum_address(wallet)
+    markets = get_markets_snapshot(block, blockchain, web3=web3)["markets"]
+    all_markets = list(markets)
+    wallets_balances = get_wallets_itoken_balances(wallets, all_markets, block, blockchain, web3=web3)
 
-    unitroller_contract = get_contract(
-        get_comptoller_address(blockchain), blockchain, web3=web3, abi=ABI_UNITROLLER, block=block
-    )
-
-    staking_rewards_factory_contract = get_contract(
-        get_staking_rewards_factory_address(blockchain),
-        blockchain,
-        web3=web3,
-        abi=ABI_STAKING_REWARDS_FACTORY,
-        block=block,
-    )
-
-    user_staked = []
-    all_markets = unitroller_contract.functions.getAllMarkets().call(block_identifier=block)
-    for itoken in all_markets:
-        itoken_data = get_itoken_data(itoken, wallet, block, blockchain, web3=web3)
-
-        underlying_token = itoken_data["underlying"]
+    users_staked = []
+    if all_markets:
+        staking_rewards_factory_contract = get_contract(
+            get_staking_rewards_factory_address(blockchain),
+            blockchain,
+            web3=web3,
+            abi=ABI_STAKING_REWARDS_FACTORY,
+            block=block,
+        )
+        staking_rewards_address = const_call(
+            staking_rewards_factory_contract.functions.getStakingRewards(all_markets[0])
+        )
+        staking_rewards_contract = get_contract(
+            staking_rewards_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS, block=block
+        )
+        staking_rewards_helper_address = const_call(staking_rewards_contract.functions.helperContract())
+        staking_rewards_helper_contract = get_contract(
+            staking_rewards_helper_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS_HELPER, block=block
+        )
+        users_staked = multicall(
+            [
+                staking_rewards_helper_contract.functions.getUserStaked(Web3.to_checksum_address(wallet))
+                for wallet in wallets
+            ],
+            block,
+            blockchain,
+            web3=web3,
+        )
 
-        underlying_token_balance = 0
-        if itoken_data["balanceOf"] > 0 or itoken_data["borrowBalanceStored"] > 0:
-            if underlying_token is not ZERO_ADDRESS:
-                underlying_token_decimals = get_decimals(
-                    underlying_token, block=block, blockchain=blockchain, web3=web3
+    if reward:
+        rewards = all_rewards_many(wallets, block, blockchain, web3=web3, decimals=decimals)
+
+    result = {}
+    for i, wallet in enumerate(wallets):
+        balances = []
+        user_staked = users_staked[i] if users_staked and users_staked[i] else []
+        for itoken, market in markets.items():
+            balance_of, borrow_balance_stored = wallets_balances[wallet][itoken]
+            underlying_token = market["underlying"]
+
+            underlying_token_balance = 0
+            if (balance_of > 0 or borrow_balance_stored > 0) and underlying_token != ZERO_ADDRESS:
+                underlying_token_balance = _get_underlying_token_balance(
+                    market, balance_of, borrow_balance_stored, decimals
                 )
 
-                mantissa = 18 - (itoken_data["decimals"]) + underlying_token_decimals
-
-                exchange_rate = Decimal(itoken_data["exchangeRateStored"]) / Decimal(10**mantissa)
-
-                underlying_token_balance = Decimal(itoken_data["balanceOf"]) / Decimal(
-                    10 ** itoken_data["decimals"]
-                ) * exchange_rate - Decimal(itoken_data["borrowBalanceStored"]) / Decimal(
-                    10**underlying_token_decimals
+            itoken_staked_balance = 0
+            for itoken_staked_data in user_staked:
+                if itoken_staked_data[0] == itoken:
+                    itoken_staked_balance = itoken_staked_data[1]
+                    break
+
+            underlying_staked_balance = 0
+            if itoken_staked_balance > 0:
+                # same as unwrap, with the exchange rate of the snapshot
+                itoken_staked_balance = Decimal(itoken_staked_balance) / Decimal(10 ** market["decimals"])
+                underlying_token_decimals = market["underlying_decimals"] if decimals else 0
+                underlying_staked_balance = (
+                    itoken_staked_balance
+                    * Decimal(market["exchangeRateStored"])
+                    / Decimal(10 ** (18 - market["decimals"] + underlying_token_decimals))
                 )
 
-                if not decimals:
-                    underlying_token_balance = underlying_token_balance * Decimal(10**underlying_token_decimals)
-
-        if user_staked == []:
-            staking_rewards_address = const_call(staking_rewards_factory_contract.functions.getStakingRewards(itoken))
-            staking_rewards_contract = get_contract(
-                staking_rewards_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS, block=block
-            )
-
-            staking_rewards_helper_address = const_call(staking_rewards_contract.functions.helperContract())
-            staking_rewards_helper_contract = get_contract(
-                staking_rewards_helper_address, blockchain, web3=web3, abi=ABI_STAKING_REWARDS_HELPER, block=block
-            )
-            user_staked = call_contract_method(staking_rewards_helper_contract.functions.getUserStaked(wallet), block)
-            user_staked = user_staked if user_staked else []
-
-        itoken_staked_balance = 0
-        for itoken_staked_data in user_staked:
-            if itoken_staked_data[0] == itoken:
-                itoken_staked_balance = itoken_staked_data[1]
-                break
-
-        underlying_staked_balance = 0
-        if itoken_staked_balance > 0:
-            itoken_staked_balance = Decimal(itoken_staked_balance) / Decimal(
-                10 ** get_decimals(itoken, blockchain, web3=web3)
-            )
-            underlying_staked_balance = unwrap(
-                itoken_staked_balance, itoken, block, blockchain, web3=web3, decimals=decimals
-            )[1]
-
-        if underlying_token_balance != 0 or underlying_staked_balance > 0:
-            balances.append([underlying_token, underlying_token_balance, underlying_staked_balance])
-
-    result = balances
-    if reward:
-        rewards = all_rewards(wallet, block, blockchain, web3=web3, decimals=decimals)
+            if underlying_token_balance != 0 or underlying_staked_balance > 0:
+                balances.append([underlying_token, underlying_token_balance, underlying_staked_balance])
 
-        result.extend(rewards)
+        if reward:
+            balances.extend(rewards[wallet])
+        result[wallet] = balances
 
     return result
 
@@ -5,6 +5,7 @@ from web3 import Web3
 from defi_protocols.cache import const_call
 from defi_protocols.constants import ETHEREUM, SNOTE_ETH
 from defi_protocols.functions import block_to_timestamp, get_contract, get_node, to_token_amount
+from defi_protocols.multicall import multicall
 
 NPROXY_ETHEREUM = "0x1344A36A1B56144C3Bc62E7757377D288fDE0369"
 
@@ -53,15 +54,51 @@ def get_markets_data(block, blockchain, web3=None, decimals=True, nproxy_contrac
         nproxy_address = get_nproxy_address(blockchain)
         nproxy_contract = get_contract(nproxy_address, blockchain, web3=web3, abi=ABI_NPROXY, block=block)
 
-    for i in range(nproxy_contract.functions.getMaxCurrencyId().call(block_identifier=block)):
-        market_data = {}
-
-        currency_rates = nproxy_contract.functions.getCurrencyAndRates(i + 1).call(block_identifier=block)
+    # the currencies and their rates, then the nTokens of the ones kept, and then their values, are read in batches
+    currency_ids = range(1, nproxy_contract.functions.getMaxCurrencyId().call(block_identifier=block) + 1)
+    currencies_rates = multicall(
+        [nproxy_contract.functions.getCurrencyAndRates(currency_id) for currency_id in currency_ids],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    currencies = [
+        (currency_id, currency_rates)
+        for currency_id, currency_rates in zip(currency_ids, currencies_rates)
+        if token_address is None or currency_rates[1][0] == token_address
+    ]
+    if token_address is not None:
+        currencies = currencies[:1]
+
+    # TODO: check if const_call can be used
+    ntoken_addresses = multicall(
+        [nproxy_contract.functions.nTokenAddress(currency_id) for currency_id, _ in currencies],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    ntoken_contracts = [
+        get_contract(ntoken_address, blockchain, web3=web3, abi=ABI_NTOKEN, block=block)
+        for ntoken_address in ntoken_addresses
+    ]
+    ntokens_values = multicall(
+        [
+            contract_function
+            for ntoken_contract in ntoken_contracts
+            for contract_function in [
+                ntoken_contract.functions.getPresentValueUnderlyingDenominated(),
+                ntoken_contract.functions.totalSupply(),
+            ]
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
 
-        if token_address is not None and currency_rates[1][0] != token_address:
-            continue
+    for i, (currency_id, currency_rates) in enumerate(currencies):
+        market_data = {}
 
-        market_data["currencyId"] = i + 1
+        market_data["currencyId"] = currency_id
         market_data["underlyingToken"] = {
             "address": currency_rates[1][0],
             # in 10^decimals format
@@ -75,22 +112,16 @@ def get_markets_data(block, blockchain, web3=None, decimals=True, nproxy_contrac
             / (1000000000000000000 * Decimal(currency_rates[1][2]) / Decimal(currency_rates[0][2])),
         }
 
-        # TODO: check if const_call can be used
-        ntoken_address = nproxy_contract.functions.nTokenAddress(i + 1).call(block_identifier=block)
-        ntoken_contract = get_contract(ntoken_address, blockchain, web3=web3, abi=ABI_NTOKEN, block=block)
+        present_value, total_supply = ntokens_values[2 * i : 2 * i + 2]
         market_data["nToken"] = {
-            "address": ntoken_address,
+            "address": ntoken_addresses[i],
             # in 10^decimals format
-            "decimals": 10 ** const_call(ntoken_contract.functions.decimals()),
-            "rate": ntoken_contract.functions.getPresentValueUnderlyingDenominated().call(block_identifier=block)
-            / Decimal(ntoken_contract.functions.totalSupply().call(block_identifier=block)),
+            "decimals": 10 ** const_call(ntoken_contracts[i].functions.decimals()),
+            "rate": present_value / Decimal(total_supply),
         }
 
         markets_data.append(market_data)
 
-        if token_address is not None:
-            break
-
     return markets_data
 
 
@@ -136,6 +167,48 @@ def all_note_rewards(wallet, block, blockchain, web3=None, decimals=True, nproxy
     return all_rewards
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# all_note_rewards_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# 'nproxy_contract' = nproxy_contract -> Improves performance
+# Output: a dict with the output of all_note_rewards for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def all_note_rewards_many(wallets, block, blockchain, web3=None, decimals=True, nproxy_contract=None):
+    """
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :param nproxy_contract:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    if nproxy_contract is None:
+        nproxy_address = get_nproxy_address(blockchain)
+        nproxy_contract = get_contract(nproxy_address, blockchain, web3=web3, abi=ABI_NPROXY, block=block)
+
+    note_token_address = const_call(nproxy_contract.functions.getNoteToken())
+    timestamp = block_to_timestamp(block, blockchain)
+    wallets_note_rewards = multicall(
+        [
+            nproxy_contract.functions.nTokenGetClaimableIncentives(Web3.to_checksum_address(wallet), timestamp)
+            for wallet in wallets
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    return {
+        wallet: [[note_token_address, to_token_amount(note_token_address, note_rewards, blockchain, web3, decimals)]]
+        for wallet, note_rewards in zip(wallets, wallets_note_rewards)
+    }
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # get_staked
 # 'execution' = the current iteration, as the function goes through the different Full/Archival nodes of the blockchain attempting a successfull execution
@@ -269,6 +342,52 @@ def underlying_all(wallet, block, blockchain, web3=None, decimals=True, reward=F
     return result
 
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# underlying_all_many
+# 'web3' = web3 (Node) -> Improves performance
+# 'reward' = True -> retrieves the rewards / 'reward' = False or not passed onto the function -> no reward retrieval
+# 'decimals' = True -> retrieves the results considering the decimals / 'decimals' = False or not passed onto the function -> decimals are not considered
+# Output: a dict with the output of underlying_all for each wallet, by wallet
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def underlying_all_many(wallets, block, blockchain, web3=None, decimals=True, reward=False):
+    """
+    The markets data is read once for all the wallets, and the accounts of all the wallets in a single batch.
+
+    :param wallets:
+    :param block:
+    :param blockchain:
+    :param web3:
+    :param decimals:
+    :param reward:
+    :return:
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    nproxy_address = get_nproxy_address(blockchain)
+    nproxy_contract = get_contract(nproxy_address, blockchain, web3=web3, abi=ABI_NPROXY, block=block)
+
+    markets_data = get_markets_data(block, blockchain, web3=web3, nproxy_contract=nproxy_contract)
+    accounts_data = multicall(
+        [nproxy_contract.functions.getAccount(Web3.to_checksum_address(wallet)) for wallet in wallets],
+        block,
+        blockchain,
+        web3=web3,
+    )
+
+    if reward is True:
+        all_rewards = all_note_rewards_many(
+            wallets, block, blockchain, web3=web3, decimals=decimals, nproxy_contract=nproxy_contract
+        )
+
+    result = {}
+    for wallet, account_data in zip(wallets, accounts_data):
+        balances = _get_balances(markets_data, account_data, decimals)
+        result[wallet] = [balances, all_rewards[wallet]] if reward is True else balances
+
+    return result
+
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # underlying
 # 'web3' = web3 (Node) -> Improves performance
@@ -1,7 +1,6 @@
 import json
 import logging
 import os
-from datetime import datetime, timedelta
 from decimal import Decimal
 from pathlib import Path
 from typing import Union
@@ -12,15 +11,15 @@ from web3.exceptions import ABIFunctionNotFound
 from defi_protocols.cache import const_call
 from defi_protocols.constants import ETHEREUM, POLYGON, XDAI, ZERO_ADDRESS
 from defi_protocols.functions import (
-    block_to_date,
-    date_to_block,
+    block_to_timestamp,
     get_contract,
     get_decimals,
     get_logs_web3,
     get_node,
-    get_token_tx,
-    get_tx_list,
+    iter_token_tx,
+    iter_tx_list,
     last_block,
+    timestamp_to_block,
     to_token_amount,
 )
 from defi_protocols.prices.prices import get_price
@@ -615,10 +614,11 @@ def get_wallet_by_tx(lptoken_address, block, blockchain, web3=None, signature=DE
         while True:
             block_start = block_start - 1000000
 
-            lptoken_txs = get_token_tx(lptoken_address, chef_contract.address, block_start, block, blockchain)
+            # the transfers and transactions are read a page at a time, and only until the wallet is found
+            lptoken_txs = iter_token_tx(lptoken_address, chef_contract.address, block_start, block, blockchain)
 
             for lptoken_tx in lptoken_txs:
-                txs = get_tx_list(lptoken_tx["from"], block_start, block, blockchain)
+                txs = iter_tx_list(lptoken_tx["from"], block_start, block, blockchain)
 
                 for tx in txs:
                     if tx["input"][0:10] == tx_hex_bytes:
@@ -764,13 +764,7 @@ def get_swap_fees_APR(
     days: int = 1,
     apy: bool = False,
 ) -> int:
-    block_start = date_to_block(
-        datetime.strftime(
-            datetime.strptime(block_to_date(block_end, blockchain), "%Y-%m-%d %H:%M:%S") - timedelta(days=days),
-            "%Y-%m-%d %H:%M:%S",
-        ),
-        blockchain,
-    )
+    block_start = timestamp_to_block(block_to_timestamp(block_end, blockchain) - days * 24 * 3600, blockchain)
     fees = swap_fees(lptoken_address, block_start, block_end, blockchain, web3)
     token0 = fees["swaps"][0]["token"]
     token0_fees = [0]
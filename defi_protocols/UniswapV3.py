@@ -7,6 +7,7 @@ from typing import ClassVar, Union
 from web3 import Web3
 
 from defi_protocols.functions import get_contract, get_decimals, get_node
+from defi_protocols.multicall import multicall
 
 logger = logging.getLogger(__name__)
 
@@ -116,6 +117,8 @@ class NFTPosition:
     block: Union[int | str]
     web3: object
     decimals: bool
+    # output of positions(nftid) when it was already read, e.g. in a batch with other positions
+    position: tuple = field(default=None, repr=False)
     token0: str = field(init=False)
     token1: str = field(init=False)
     fee: int = field(init=False)
@@ -131,6 +134,8 @@ class NFTPosition:
         self._nft_contract = get_contract(
             POSITIONS_NFT, self.blockchain, web3=self.web3, abi=ABI_POSITIONS_NFT, block=self.block
         )
+        if self.position is None:
+            self.position = self._nft_contract.functions.positions(self.nftid).call(block_identifier=self.block)
         (
             self.token0,
             self.token1,
@@ -140,7 +145,7 @@ class NFTPosition:
             liquidity,
             self.fr0,
             self.fr1,
-        ) = self._nft_contract.functions.positions(self.nftid).call(block_identifier=self.block)[2:10]
+        ) = self.position[2:10]
         self.liquidity = Decimal(liquidity)
         if self.decimals:
             self.decimals0 = get_decimals(self.token0, self.blockchain, self.web3)
@@ -353,16 +358,17 @@ def allnfts(wallet: str, block: Union[int, str], blockchain: str, web3=None) ->
     list
         a list where each element is the nft id that is owned by the wallet (open and closed nfts)
     """
-    nftids = []
-
     if web3 is None:
         web3 = get_node(blockchain, block=block)
 
     nft_contract = get_contract(POSITIONS_NFT, blockchain, web3=web3, abi=ABI_POSITIONS_NFT, block=block)
     nfts = nft_contract.functions.balanceOf(wallet).call(block_identifier=block)
-    for nft_index in range(nfts):
-        nft_id = nft_contract.functions.tokenOfOwnerByIndex(wallet, nft_index).call(block_identifier=block)
-        nftids.append(nft_id)
+    nftids = multicall(
+        [nft_contract.functions.tokenOfOwnerByIndex(wallet, nft_index) for nft_index in range(nfts)],
+        block,
+        blockchain,
+        web3=web3,
+    )
     return nftids
 
 
@@ -392,3 +398,70 @@ def underlying_all(wallet: str, block: Union[int, str], blockchain: str, decimal
     for nft in allnfts(wallet, block, blockchain):
         balances.append(underlying(wallet, nft, block, blockchain, decimals=decimals, fee=fee))
     return list(filter(None, balances))
+
+
+def underlying_all_many(
+    wallets: list, block: Union[int, str], blockchain: str, web3=None, decimals: bool = True, fee: bool = False
+) -> dict:
+    """Returns the balances of the underlying assets corresponding to all positions held by each wallet.
+    Parameters
+    ----------
+    wallets : list
+        addresses of the wallets holding the positions
+    block : int or 'latest'
+        block number at which the data is queried
+    blockchain : str
+        blockchain in which the positions are held
+    web3: obj
+        optional, already instantiated web3 object
+    decimals: bool
+        specifies whether balances are returned as int if set to False, or float with the appropriate decimals if set
+        to True
+    fee: bool
+
+    Returns
+    ----------
+    dict
+        the output of underlying_all for each wallet, by wallet. The nft ids and positions of all the wallets are read
+        in batches, and each pool only once.
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    checksum_wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+    nft_contract = get_contract(POSITIONS_NFT, blockchain, web3=web3, abi=ABI_POSITIONS_NFT, block=block)
+    nfts = multicall(
+        [nft_contract.functions.balanceOf(wallet) for wallet in checksum_wallets], block, blockchain, web3=web3
+    )
+    owners = [i for i, wallet in enumerate(checksum_wallets) for _ in range(nfts[i] or 0)]
+    nftids = multicall(
+        [
+            nft_contract.functions.tokenOfOwnerByIndex(wallet, nft_index)
+            for wallet, wallet_nfts in zip(checksum_wallets, nfts)
+            for nft_index in range(wallet_nfts or 0)
+        ],
+        block,
+        blockchain,
+        web3=web3,
+    )
+    positions = multicall([nft_contract.functions.positions(nftid) for nftid in nftids], block, blockchain, web3=web3)
+
+    pools = {}
+    balances = [[] for _ in wallets]
+    for owner, nftid, position in zip(owners, nftids, positions):
+        # the nfts are owned by the wallet: they were listed by owner
+        nft_position = NFTPosition(nftid, blockchain, block, web3, decimals, position=position)
+        pool_key = (nft_position.token0, nft_position.token1, nft_position.fee)
+        if pool_key not in pools:
+            pools[pool_key] = Pool(blockchain, block, web3, *pool_key)
+        pool = pools[pool_key]
+
+        if fee:
+            growth_indexes = pool.get_fee_growth_indexes(nft_position.il, nft_position.iu)
+            fa, fb = nft_position.get_fees(pool.ic, *growth_indexes)
+            balance = nft_position.get_balance(pool.ic, pool.sqrt_price, fa, fb)
+        else:
+            balance = nft_position.get_balance(pool.ic, pool.sqrt_price)
+        balances[owner].append(balance)
+
+    return {wallet: list(filter(None, wallet_balances)) for wallet, wallet_balances in zip(wallets, balances)}
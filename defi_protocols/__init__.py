@@ -1,3 +1,5 @@
+import importlib
+import importlib.util
 import logging
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -17,3 +19,13 @@ def add_stderr_logger(level: int = logging.DEBUG) -> logging.StreamHandler:
     logger.setLevel(level)
     logger.debug("Added a stderr logging handler to logger: %s", __name__)
     return handler
+
+
+def __getattr__(name: str):
+    """Imports the protocol and helper submodules when they are first accessed, e.g. defi_protocols.Aave.
+
+    Importing the package itself doesn't import any of them: only the ones used are loaded.
+    """
+    if name.startswith("_") or importlib.util.find_spec(f"{__name__}.{name}") is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return importlib.import_module(f"{__name__}.{name}")
@@ -0,0 +1,320 @@
+"""Local store of the contract ABIs.
+
+The ABIs are stored in a SQLite file, compressed and addressed by the hash of their canonical JSON, so an ABI shared by
+many contracts (tokens, pools, proxies of the same implementation) is stored once. Each (blockchain, address) points
+to the hash of its ABI, or to none if the explorer doesn't have it verified. The function selectors and event topics
+of the stored ABIs are indexed, so calldata and logs can be decoded without knowing the contract.
+
+The store can be warmed in bulk with the ABIs of all the addresses referenced by the protocol modules and databases:
+
+    python -m defi_protocols.abi_store prefetch --blockchain ethereum xdai
+
+    store = ABIStore("/tmp/defi_protocols/abi_store/abis.sqlite")
+    store.add(ETHEREUM, address, abi)
+    store.get_abi(ETHEREUM, address)
+    store.get_function_signatures("0xa9059cbb")  # ['transfer(address,uint256)']
+"""
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Set, Tuple
+
+from eth_utils import keccak
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+
+from defi_protocols.chains import CHAINS, get_chain
+from defi_protocols.util.explorer_client import get_explorer_client
+
+logger = logging.getLogger(__name__)
+
+ABI_STORE_DIR = os.environ.get(
+    "DEFI_PROTO_ABI_STORE_DIR",
+    os.path.join(os.environ.get("DEFI_PROTO_CACHE_DIR", "/tmp/defi_protocols/"), "abi_store"),
+)
+ABI_STORE_PATH = os.path.join(ABI_STORE_DIR, "abis.sqlite")
+
+NOT_VERIFIED = "Contract source code not verified"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS abis (
+    hash TEXT PRIMARY KEY,
+    abi BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS contracts (
+    blockchain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (blockchain, address)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS selectors (
+    selector TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (selector, signature)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (topic, signature)
+) WITHOUT ROWID;
+"""
+
+
+def get_signature(abi_entry: dict) -> str:
+    """Returns the canonical signature of a function or event of an ABI, e.g. 'swap((bytes32,uint8),address)'."""
+    return f"{abi_entry['name']}({','.join(collapse_if_tuple(input) for input in abi_entry.get('inputs', []))})"
+
+
+class ABIStore:
+    """ABIs of the contracts of all the blockchains. Without a path the store is only kept in memory."""
+
+    def __init__(self, path: str = None):
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=60)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def contains(self, blockchain: str, address: str) -> bool:
+        """Whether the contract is in the store, verified or not."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM contracts WHERE blockchain = ? AND address = ?", (blockchain, address.lower())
+            ).fetchone()
+        return row is not None
+
+    def get_abi(self, blockchain: str, address: str) -> str | None:
+        """Returns the ABI of the contract as JSON, or None if it isn't stored or isn't verified."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT abis.abi FROM contracts JOIN abis ON abis.hash = contracts.hash "
+                "WHERE contracts.blockchain = ? AND contracts.address = ?",
+                (blockchain, address.lower()),
+            ).fetchone()
+        return zlib.decompress(row[0]).decode() if row is not None else None
+
+    def add(self, blockchain: str, address: str, abi: str | list | None) -> str | None:
+        """Stores the ABI of the contract (None if it isn't verified) and returns its hash."""
+        if abi is None:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO contracts VALUES (?, ?, NULL)", (blockchain, address.lower())
+                )
+            return None
+
+        if isinstance(abi, str):
+            abi = json.loads(abi)
+        canonical = json.dumps(abi, separators=(",", ":"), sort_keys=True)
+        abi_hash = hashlib.sha256(canonical.encode()).hexdigest()
+
+        with self._lock, self._connection:
+            new = self._connection.execute(
+                "INSERT OR IGNORE INTO abis VALUES (?, ?)", (abi_hash, zlib.compress(canonical.encode(), 9))
+            ).rowcount
+            if new:
+                # the ABIs already stored are already indexed
+                self._index(abi)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO contracts VALUES (?, ?, ?)", (blockchain, address.lower(), abi_hash)
+            )
+        return abi_hash
+
+    def _index(self, abi: list) -> None:
+        selectors, topics = [], []
+        for entry in abi:
+            if entry.get("type") == "function":
+                signature = get_signature(entry)
+                selectors.append((HexBytes(keccak(text=signature)[:4]).hex(), signature))
+            elif entry.get("type") == "event":
+                signature = get_signature(entry)
+                topics.append((HexBytes(keccak(text=signature)).hex(), signature))
+        self._connection.executemany("INSERT OR IGNORE INTO selectors VALUES (?, ?)", selectors)
+        self._connection.executemany("INSERT OR IGNORE INTO topics VALUES (?, ?)", topics)
+
+    def get_function_signatures(self, selector: str | bytes) -> List[str]:
+        """Returns the signatures of the stored functions with the 4 bytes selector (several if they collide)."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT signature FROM selectors WHERE selector = ? ORDER BY signature", (HexBytes(selector).hex(),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_event_signatures(self, topic: str | bytes) -> List[str]:
+        """Returns the signatures of the stored events with the topic."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT signature FROM topics WHERE topic = ? ORDER BY signature", (HexBytes(topic).hex(),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+# PREFETCH
+ADDRESS_PATTERN = re.compile(r"0x[0-9a-fA-F]{40}")
+
+# Suffixes of the names of the module constants that tell their blockchain (e.g. VAULT_XDAI, USDC_ETH)
+BLOCKCHAIN_SUFFIXES = {
+    "ETH": "ethereum",
+    "ETHEREUM": "ethereum",
+    "XDAI": "xdai",
+    "GC": "xdai",
+    "POL": "polygon",
+    "POLYGON": "polygon",
+    "BINANCE": "binance",
+    "AVALANCHE": "avalanche",
+    "FANTOM": "fantom",
+    "OPTIMISM": "optimism",
+    "ARB": "arbitrum",
+    "ARBITRUM": "arbitrum",
+}
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_module_addresses(source: str) -> Iterable[Tuple[str | None, str]]:
+    """Yields the (blockchain, address) pairs of the addresses in the source of a module.
+
+    The blockchain is the one in the name of the constant the address is assigned to, or None if it doesn't tell.
+    """
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            blockchain = None
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    blockchain = BLOCKCHAIN_SUFFIXES.get(target.id.rsplit("_", 1)[-1].upper(), blockchain)
+            if blockchain is not None and ADDRESS_PATTERN.fullmatch(node.value.value):
+                yield blockchain, node.value.value
+
+    for address in ADDRESS_PATTERN.findall(source):
+        yield None, address
+
+
+def find_db_addresses(data, blockchain: str = None) -> Iterable[Tuple[str | None, str]]:
+    """Yields the (blockchain, address) pairs of the addresses in a protocol database.
+
+    The keys of the database that are blockchain names tell the blockchain of the addresses under them.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in CHAINS:
+                yield from find_db_addresses(value, key)
+            else:
+                yield from find_db_addresses(key, blockchain)
+                yield from find_db_addresses(value, blockchain)
+    elif isinstance(data, list):
+        for item in data:
+            yield from find_db_addresses(item, blockchain)
+    elif isinstance(data, str) and ADDRESS_PATTERN.fullmatch(data):
+        yield blockchain, data
+
+
+def find_addresses(blockchains: List[str]) -> Dict[str, Set[str]]:
+    """Returns the addresses referenced by the protocol modules and databases, by blockchain.
+
+    The addresses whose blockchain is unknown everywhere they appear are skipped, instead of querying every explorer.
+    """
+    found = []
+    for path in sorted(glob.glob(os.path.join(PACKAGE_DIR, "*.py"))):
+        with open(path) as file:
+            found.extend(find_module_addresses(file.read()))
+    for path in sorted(glob.glob(os.path.join(PACKAGE_DIR, "db", "*.json"))):
+        with open(path) as file:
+            found.extend(find_db_addresses(json.load(file)))
+
+    addresses = {blockchain: set() for blockchain in blockchains}
+    for blockchain, address in found:
+        if blockchain in addresses:
+            addresses[blockchain].add(address.lower())
+    return addresses
+
+
+def prefetch(store: ABIStore, blockchain: str, addresses: Iterable[str], refresh: bool = False) -> int:
+    """Fetches the ABIs of the addresses that aren't in the store yet, and returns how many were stored.
+
+    Each ABI is stored as soon as it arrives. The addresses that fail are logged and skipped, so they are queried
+    again next time. Contracts that weren't verified are queried again with refresh.
+    """
+    chain = get_chain(blockchain)
+    if chain.getabi_api is None:
+        return 0
+    addresses = sorted(
+        address
+        for address in addresses
+        if not store.contains(blockchain, address) or (refresh and store.get_abi(blockchain, address) is None)
+    )
+
+    client = get_explorer_client()
+
+    def fetch_abi(address):
+        data = client.get(chain.getabi_api % (address, chain.explorer_api_key), headers=chain.explorer_headers)
+        if data["result"] == NOT_VERIFIED and chain.getabi_fallback_api is not None:
+            data = client.get(chain.getabi_fallback_api % address)
+        return data["result"]
+
+    stored = 0
+    with ThreadPoolExecutor(max_workers=client.pool_size) as executor:
+        futures = {executor.submit(fetch_abi, address): address for address in addresses}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning("ABI of %s in %s not fetched: %s", address, blockchain, e)
+                continue
+
+            if result == NOT_VERIFIED:
+                store.add(blockchain, address, None)
+            elif isinstance(result, str) and result.startswith("["):
+                store.add(blockchain, address, result)
+            else:
+                # invalid key, unknown address...: nothing is stored so the address is queried again next time
+                logger.warning("ABI of %s in %s not available: %s", address, blockchain, result)
+                continue
+            stored += 1
+    return stored
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m defi_protocols.abi_store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prefetch_parser = subparsers.add_parser(
+        "prefetch", help="store the ABIs of the addresses referenced by the protocol modules and databases"
+    )
+    prefetch_parser.add_argument(
+        "--blockchain",
+        nargs="+",
+        default=[blockchain for blockchain, chain in CHAINS.items() if chain.explorer_headers is None],
+        choices=list(CHAINS),
+    )
+    prefetch_parser.add_argument("--refresh", action="store_true", help="query again the contracts not verified")
+    prefetch_parser.add_argument("--path", default=ABI_STORE_PATH)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    store = ABIStore(args.path)
+    # each explorer has its own rate limit: the blockchains are prefetched concurrently
+    with ThreadPoolExecutor(max_workers=len(args.blockchain)) as executor:
+        futures = {
+            executor.submit(prefetch, store, blockchain, addresses, args.refresh): (blockchain, len(addresses))
+            for blockchain, addresses in find_addresses(args.blockchain).items()
+        }
+        for future in as_completed(futures):
+            blockchain, count = futures[future]
+            try:
+                logger.info("%s: %d addresses, %d ABIs stored", blockchain, count, future.result())
+            except Exception:
+                logger.exception("%s: prefetch failed", blockchain)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Asyncio counterparts of the node functions in ``defi_protocols.functions``.
+
+The nodes are ``AsyncWeb3`` instances backed by an ``AsyncProviderManager``, which picks endpoints by their health
+the same way ``ProviderManager`` does and bounds the number of in-flight requests per endpoint. A single event loop can keep many
+reads in flight across blockchains:
+
+    balances = await asyncio.gather(*[balance_of(wallet, token, block, ETHEREUM) for wallet in wallets])
+"""
+import asyncio
+import logging
+import time
+import weakref
+from decimal import Decimal
+from typing import List
+
+import aiohttp
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+from web3.exceptions import ContractLogicError
+from web3.providers.async_base import AsyncJSONBaseProvider
+
+from defi_protocols import cache
+from defi_protocols.cache import async_const_call
+from defi_protocols.chains import get_chain
+from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, E_ADDRESS, MAX_EXECUTIONS, ZERO_ADDRESS
+from defi_protocols.functions import (
+    RETRY_BACKOFF,
+    AllProvidersDownError,
+    EndpointHealth,
+    get_block_intervals,
+    get_cached_contract,
+    get_logs_block_interval,
+    rank_providers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of requests in flight to a single endpoint
+MAX_CONCURRENCY_PER_PROVIDER = 32
+
+
+class AsyncProviderManager(AsyncJSONBaseProvider):
+    def __init__(
+        self,
+        endpoints: List,
+        max_fails_per_provider: int = 2,
+        max_executions: int = MAX_EXECUTIONS,
+        retry_backoff: float = RETRY_BACKOFF,
+        max_concurrency_per_provider: int = MAX_CONCURRENCY_PER_PROVIDER,
+    ):
+        super().__init__()
+        self.endpoints = endpoints
+        self.max_fails_per_provider = max_fails_per_provider
+        self.max_executions = max_executions
+        self.retry_backoff = retry_backoff
+        self.max_concurrency_per_provider = max_concurrency_per_provider
+        self.providers = []
+        # asyncio semaphores can only be used from one event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        for url in endpoints:
+            if "://" not in url:
+                logger.warning(f"Skipping invalid endpoint URI '{url}'.")
+                continue
+            # AsyncHTTPProvider reuses a keep-alive aiohttp session per endpoint
+            provider = AsyncHTTPProvider(url)
+            health = EndpointHealth(max_fails_per_provider)
+            self.providers.append((provider, health))
+
+    def get_semaphore(self, provider) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(self.max_concurrency_per_provider)
+        return semaphores[provider]
+
+    async def make_request(self, method, params):
+        for execution in range(self.max_executions):
+            if execution > 0:
+                await asyncio.sleep(self.retry_backoff * 2 ** (execution - 1))
+            for provider, health in rank_providers(self.providers):
+                try:
+                    async with self.get_semaphore(provider):
+                        # the time waiting for the semaphore is not part of the endpoint's latency
+                        start = time.monotonic()
+                        response = await provider.make_request(method, params)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    health.record_error(e)
+                    logger.error("Error when making request: %s", e)
+                except Exception as e:
+                    health.record_error(e)
+                    logger.exception("Unexpected exception when making request.")
+                else:
+                    health.record_success(time.monotonic() - start)
+                    return response
+        raise AllProvidersDownError(f"No working provider available. Endpoints {self.endpoints}")
+
+
+def get_async_web3_provider(provider) -> AsyncWeb3:
+    web3 = AsyncWeb3(provider)
+    if cache.is_enabled():
+        web3.middleware_onion.add(cache.async_disk_cache_middleware, "disk_cache")
+    return web3
+
+
+# store latest and archival AsyncProviderManagers as they are used
+_async_nodes_providers = dict()
+# store the AsyncWeb3 instances built on top of them
+_async_nodes_web3 = dict()
+
+
+def get_node_async(blockchain, block="latest") -> AsyncWeb3:
+    """
+    If block is 'latest'  it retrieves a Full Node, in other case it retrieves an Archival Node.
+    The AsyncWeb3 instances are created once and reused.
+    """
+    node = get_chain(blockchain).nodes
+
+    if isinstance(block, str):
+        if block != "latest":
+            raise ValueError("Incorrect block.")
+        node_type = "latest"
+    else:
+        node_type = "archival"
+
+    web3 = _async_nodes_web3.get((blockchain, node_type, cache.is_enabled()), None)
+    if web3 is not None:
+        return web3
+
+    providers = _async_nodes_providers.get((blockchain, node_type), None)
+    if not providers:
+        if node_type == "latest":
+            providers = AsyncProviderManager(endpoints=node["latest"] + node["archival"])
+        else:
+            providers = AsyncProviderManager(endpoints=node["archival"])
+        _async_nodes_providers[(blockchain, node_type)] = providers
+
+    web3 = get_async_web3_provider(providers)
+    web3._network_name = blockchain
+    _async_nodes_web3[(blockchain, node_type, cache.is_enabled())] = web3
+    return web3
+
+
+async def to_token_amount(
+    token_address: str, amount: int | Decimal, blockchain: str, web3: AsyncWeb3, decimals: bool = True
+) -> Decimal:
+    decimals = await get_decimals(token_address, blockchain=blockchain, web3=web3) if decimals else 0
+    return amount / Decimal(10**decimals)
+
+
+async def balance_of(address, contract_address, block, blockchain, web3=None, decimals=True) -> Decimal:
+    if web3 is None:
+        web3 = get_node_async(blockchain, block=block)
+
+    address = Web3.to_checksum_address(address)
+    contract_address = Web3.to_checksum_address(contract_address)
+
+    balance = 0
+    if contract_address == ZERO_ADDRESS:
+        balance = await web3.eth.get_balance(address, block)
+    else:
+        token_contract = get_cached_contract(web3, contract_address, ABI_TOKEN_SIMPLIFIED)
+        try:
+            balance = await token_contract.functions.balanceOf(address).call(block_identifier=block)
+        except ContractLogicError:
+            pass
+
+    return await to_token_amount(contract_address, balance, blockchain, web3, decimals)
+
+
+async def total_supply(
+    token_address: str, block: int | str, blockchain: str, web3: AsyncWeb3 = None, decimals: bool = True
+) -> Decimal:
+    if web3 is None:
+        web3 = get_node_async(blockchain, block=block)
+
+    token_address = Web3.to_checksum_address(token_address)
+
+    token_contract = get_cached_contract(web3, token_address, ABI_TOKEN_SIMPLIFIED)
+    total_supply_v = await token_contract.functions.totalSupply().call(block_identifier=block)
+
+    return await to_token_amount(token_address, total_supply_v, blockchain, web3, decimals)
+
+
+async def get_decimals(token_address, blockchain, web3=None, block="latest"):
+    if web3 is None:
+        web3 = get_node_async(blockchain, block=block)
+
+    token_address = Web3.to_checksum_address(token_address)
+
+    if token_address == ZERO_ADDRESS or token_address == E_ADDRESS:
+        decimals = 18
+    else:
+        token_contract = get_cached_contract(web3, token_address, ABI_TOKEN_SIMPLIFIED)
+        decimals = await async_const_call(token_contract.functions.decimals())
+
+    return decimals
+
+
+async def get_logs_web3(
+    address: str,
+    blockchain: str,
+    block_start: int | str = None,
+    block_end: int | str = None,
+    topics: list = None,
+    block_hash: str = None,
+    web3: AsyncWeb3 = None,
+) -> list:
+    """Async version of ``functions.get_logs_web3``.
+
+    When the node rejects the range because of the number of results, the smaller ranges are fetched concurrently.
+    """
+    if web3 is None:
+        web3 = get_node_async(blockchain, block=block_end)
+
+    address = Web3.to_checksum_address(address)
+    try:
+        params = {"address": address, "fromBlock": block_start, "toBlock": None, "topics": topics}
+        if block_hash is not None:
+            params.update({"blockHash": block_hash})
+        logs = await web3.eth.get_logs(params)
+
+        if not isinstance(block_end, str) and block_end is not None:
+            for n in range(len(logs)):
+                if logs[n]["blockNumber"] > block_end:
+                    logs = logs[:n]
+                    break
+    except ValueError as error:
+        block_interval = get_logs_block_interval(error)
+
+        logger.debug(
+            f"Web3.eth.get_logs: query returned more than 10000 results. Trying with a {block_interval} block range."
+        )
+        if block_end == "latest":
+            block_end = await web3.eth.block_number
+
+        requests = []
+        for from_block, to_block in get_block_intervals(blockchain, block_start, block_end, block_interval):
+            params = {"address": address, "topics": topics, "fromBlock": from_block, "toBlock": to_block}
+            if block_hash is not None:
+                params.update({"blockHash": block_hash})
+            requests.append(web3.eth.get_logs(params))
+
+        logs = [log for interval_logs in await asyncio.gather(*requests) for log in interval_logs]
+
+    return logs
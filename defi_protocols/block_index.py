@@ -0,0 +1,224 @@
+"""Local index of block timestamps.
+
+The index keeps (block, timestamp) samples of a blockchain, sorted by block, in two arrays of int64 stored in a file:
+first the blocks and then the timestamps. The file is memory mapped, so loading it is instant and processes share the
+pages. Both directions are answered by binary search over the samples. Only when the answer is not in the index yet, the
+blocks are fetched from the node: a block's timestamp directly, and the block of a timestamp by narrowing the gap
+between the two closest samples, several probes per round. Every fetched block is added to the index, so the gaps get
+smaller with every search. Blocks that could still be reorganized are only kept in memory, not written to the file.
+
+    index = BlockTimestampIndex(fetch_blocks, path="/tmp/defi_protocols/block_index/ethereum.bin")
+    index.get_block(1676917800)  # last block with a timestamp <= 1676917800
+"""
+import math
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, List, Tuple
+
+INDEX_DIR = os.environ.get(
+    "DEFI_PROTO_BLOCK_INDEX_DIR",
+    os.path.join(os.environ.get("DEFI_PROTO_CACHE_DIR", "/tmp/defi_protocols/"), "block_index"),
+)
+
+# Blocks fetched from the node in each round of a search
+PROBES_PER_ROUND = 8
+
+# Blocks behind the head of the chain that can still be reorganized
+UNCONFIRMED_BLOCKS = 128
+
+
+def get_probes(low_block: int, low_timestamp: int, high_block: int, high_timestamp: int, timestamp: int) -> List[int]:
+    """Returns the blocks to fetch to narrow the gap between two samples around the timestamp.
+
+    The block interpolated from the timestamps and the next one, plus a block on each side of them. The error of the
+    interpolation grows with the square root of the gap (block times vary randomly), so the side blocks are placed twice
+    as far: the next gap is most likely one of the two around the guess. The middle block is always fetched too: when
+    the block rate changes and the interpolation is off, the gap is still halved, as in a binary search.
+    """
+    gap = high_block - low_block
+    if gap <= PROBES_PER_ROUND:
+        return list(range(low_block + 1, high_block))
+
+    guess = low_block + (timestamp - low_timestamp) * gap // max(high_timestamp - low_timestamp, 1)
+    margin = max(2, int(2 * math.sqrt(gap)))
+    probes = {guess - margin, guess, guess + 1, guess + 1 + margin, low_block + gap // 2}
+    return sorted(probe for probe in probes if low_block < probe < high_block)
+
+
+class BlockTimestampIndex:
+    """(block, timestamp) samples of a blockchain.
+
+    fetch_blocks receives a list of block numbers (or 'latest') and returns their (block, timestamp) pairs.
+    Without a path the index is only kept in memory. Samples newer than unconfirmed_blocks behind the head of the chain
+    are not saved.
+    """
+
+    def __init__(
+        self,
+        fetch_blocks: Callable[[List], List[Tuple[int, int]]],
+        path: str = None,
+        unconfirmed_blocks: int = UNCONFIRMED_BLOCKS,
+    ):
+        self.fetch_blocks = fetch_blocks
+        self.path = path
+        self.unconfirmed_blocks = unconfirmed_blocks
+        self._lock = threading.RLock()
+        self._unsaved = False
+        self.blocks, self.timestamps = self._load()
+        # the samples in the file were confirmed when they were saved
+        self.confirmed_block = self.blocks[-1] if len(self.blocks) > 0 else -1
+
+    def update_head(self, block: int) -> None:
+        """Records the latest block of the chain: the blocks unconfirmed_blocks behind it are confirmed."""
+        self.confirmed_block = max(self.confirmed_block, block - self.unconfirmed_blocks)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return array("q"), array("q")
+
+        with open(self.path, "rb") as file:
+            samples = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).cast("q")
+        count = len(samples) // 2
+        return samples[:count], samples[count:]
+
+    def add(self, samples: Iterable[Tuple[int, int]]) -> None:
+        """Adds the (block, timestamp) samples to the index."""
+        with self._lock:
+            if not isinstance(self.blocks, array):
+                # the samples are a read only memory map until the first ones are added
+                self.blocks, self.timestamps = array("q", self.blocks), array("q", self.timestamps)
+
+            samples = list(samples)
+            if len(samples) > 64:
+                self._merge(samples)
+                return
+
+            for block, timestamp in samples:
+                i = bisect_left(self.blocks, block)
+                if i < len(self.blocks) and self.blocks[i] == block:
+                    continue
+                self.blocks.insert(i, block)
+                self.timestamps.insert(i, timestamp)
+                self._unsaved = True
+
+    def _merge(self, samples: List[Tuple[int, int]]) -> None:
+        # many samples at once (a round of a bulk search, the file of another process): inserting them one by one
+        # would move the arrays once per sample
+        merged = dict(zip(self.blocks, self.timestamps))
+        count = len(merged)
+        for block, timestamp in samples:
+            merged.setdefault(block, timestamp)
+        if len(merged) == count:
+            return
+        blocks = sorted(merged)
+        self.blocks, self.timestamps = array("q", blocks), array("q", [merged[block] for block in blocks])
+        self._unsaved = True
+
+    def save(self) -> None:
+        """Writes the samples to the file, merged with the ones written by other processes since it was loaded."""
+        if self.path is None or not self._unsaved:
+            return
+
+        with self._lock:
+            stored_blocks, stored_timestamps = self._load()
+            self.add(zip(stored_blocks, stored_timestamps))
+
+            confirmed = bisect_right(self.blocks, self.confirmed_block)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                self.blocks[:confirmed].tofile(file)
+                self.timestamps[:confirmed].tofile(file)
+            os.replace(tmp_path, self.path)
+            self._unsaved = False
+
+    def find_timestamp(self, block: int) -> int | None:
+        with self._lock:
+            i = bisect_left(self.blocks, block)
+            if i < len(self.blocks) and self.blocks[i] == block:
+                return self.timestamps[i]
+        return None
+
+    def get_timestamp(self, block: int) -> int:
+        return self.get_timestamps([block])[0]
+
+    def get_timestamps(self, blocks: Iterable[int]) -> List[int]:
+        """Returns the timestamps of the blocks. The ones that are not in the index are fetched together."""
+        blocks = list(blocks)
+        missing = sorted({block for block in blocks if self.find_timestamp(block) is None})
+        if missing:
+            if self.path is not None and missing[-1] > self.confirmed_block:
+                # the head of the chain tells whether the blocks can be saved
+                *samples, latest = self.fetch_blocks(missing + ["latest"])
+                self.update_head(latest[0])
+            else:
+                samples = self.fetch_blocks(missing)
+            self.add(samples)
+            self.save()
+        return [self.find_timestamp(block) for block in blocks]
+
+    def find_gap(self, timestamp: int):
+        """Returns the block of the timestamp if it's in the index, else the blocks to fetch to narrow its gap."""
+        i = bisect_right(self.timestamps, timestamp)
+        if i == len(self.blocks):
+            return None, ["latest"]
+        if i == 0:
+            if self.blocks[0] == 0:
+                raise ValueError(f"Timestamp {timestamp} is before the first block")
+            return None, [0]
+        if self.blocks[i] == self.blocks[i - 1] + 1:
+            return self.blocks[i - 1], None
+        return None, get_probes(
+            self.blocks[i - 1], self.timestamps[i - 1], self.blocks[i], self.timestamps[i], timestamp
+        )
+
+    def get_block(self, timestamp: int) -> int:
+        """Returns the last block with a timestamp lower than or equal to the timestamp."""
+        return self.get_blocks([timestamp])[0]
+
+    def get_blocks(self, timestamps: Iterable[int]) -> List[int]:
+        """Returns the last block with a timestamp lower than or equal to each of the timestamps.
+
+        All the searches advance together: the probes of every round are fetched at once, and timestamps in the same
+        gap share them.
+        """
+        timestamps = list(timestamps)
+        found = {}
+        pending = set(timestamps)
+        latest = None
+        try:
+            while pending:
+                probes = set()
+                with self._lock:
+                    for timestamp in list(pending):
+                        if latest is not None and latest[1] <= timestamp:
+                            found[timestamp] = latest[0]
+                            pending.discard(timestamp)
+                            continue
+                        block, timestamp_probes = self.find_gap(timestamp)
+                        if block is not None:
+                            found[timestamp] = block
+                            pending.discard(timestamp)
+                        else:
+                            probes.update(timestamp_probes)
+
+                if not probes:
+                    break
+                if "latest" in probes:
+                    probes.discard("latest")
+                    latest = self.fetch_blocks(["latest"])[0]
+                    self.update_head(latest[0])
+                    # the latest block is only added when it bounds the search of older timestamps
+                    if any(timestamp < latest[1] for timestamp in pending):
+                        self.add([latest])
+                if probes:
+                    self.add(self.fetch_blocks(sorted(probes)))
+        finally:
+            self.save()
+        return [found[timestamp] for timestamp in timestamps]
@@ -1,49 +1,427 @@
 import functools
+import hashlib
+import inspect
+import json
 import logging
+import math
+import numbers
 import os
+import sqlite3
+import sys
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from decimal import Decimal
 from inspect import getcallargs
 
 import diskcache
-from web3.middleware.cache import generate_cache_key
+
+from defi_protocols import serializer
 
 logger = logging.getLogger(__name__)
 
-VERSION = 4
+VERSION = 6
 VERSION_CACHE_KEY = "VERSION"
 
-_cache = None
+# Limits of the in-memory tier, in number of entries and approximate size in bytes
+MEMORY_CACHE_MAX_ENTRIES = int(os.environ.get("DEFI_PROTO_MEMORY_CACHE_ENTRIES", 100_000))
+MEMORY_CACHE_MAX_BYTES = int(os.environ.get("DEFI_PROTO_MEMORY_CACHE_BYTES", 128 * 1024 * 1024))
+
+_MISSING = object()
+
+# values of these types are kept as they are in memory, any other is kept serialized so that callers can't modify it
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, Decimal, type(None))
+
+
+def is_immutable(value):
+    if isinstance(value, tuple):
+        return all(is_immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE_TYPES)
+
+
+class MemoryCache:
+    """Thread safe LRU cache bounded by the number of entries and their approximate size."""
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES, max_bytes=MEMORY_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evictions_by_namespace = Counter()
+        # key -> (serialized, value, size, namespace)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        serialized, value, _, _ = entry
+        return serializer.loads(value) if serialized else value
+
+    def set(self, key, value, namespace=None):
+        if is_immutable(value):
+            entry = (False, value, sys.getsizeof(value), namespace)
+        else:
+            data = serializer.dumps(value)
+            entry = (True, data, len(data), namespace)
+
+        with self._lock:
+            self._pop(key)
+            if entry[2] > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry[2]
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, _, size, evicted_namespace) = self._entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+                self.evictions_by_namespace[evicted_namespace] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+@dataclass
+class CachePolicy:
+    """Policy for the entries of a cache namespace.
+
+    ttl: seconds until the entries expire. None keeps them forever. Entries with a ttl are not kept in memory.
+    max_size: maximum size in bytes of the namespace's storage. The least recently stored entries are evicted when
+    it's exceeded. Only supported by the disk backend.
+    """
 
+    ttl: float | None = None
+    max_size: int | None = None
 
-def check_version():
-    version = _cache.get(VERSION_CACHE_KEY, 0)
-    if version != VERSION:
-        _cache.clear()
-        _cache[VERSION_CACHE_KEY] = VERSION
-        logger.info(f"Old cache version! Creating new cache with version: {VERSION}")
 
+# Policies by namespace. The namespaces are 'rpc.<method>' for RPC responses, 'call.<function>' for cache_call,
+# 'method.<method>' for cache_contract_method and 'const' for const_call. Namespaces without a policy are kept forever
+# in the main storage.
+CACHE_POLICIES = {
+    # explorers may still add transactions to recent block ranges
+    "call.get_tx_list": CachePolicy(ttl=24 * 3600),
+    "call.get_token_tx": CachePolicy(ttl=24 * 3600),
+}
+
+
+class TwoTierCache:
+    """Cache with an in-memory LRU tier in front of a persistent backend (diskcache, Redis...).
+
+    Hot keys are served from memory. Values read from the backend are promoted to the memory tier.
+    Entries belong to namespaces, which have their own policy and hit, miss and eviction counters.
+    """
+
+    def __init__(self, backend, memory=None, policies=None):
+        self.backend = backend
+        self.memory = MemoryCache() if memory is None else memory
+        self.policies = CACHE_POLICIES if policies is None else policies
+        self.counters = defaultdict(Counter)
+        self._namespace_backends = {}
+        self._lock = threading.Lock()
+
+    def get_backend(self, namespace):
+        """Returns the storage of the namespace: its own one if the namespace has a max_size, else the main one."""
+        policy = self.policies.get(namespace)
+        if policy is None or policy.max_size is None:
+            return self.backend
+
+        backend = self._namespace_backends.get(namespace)
+        if backend is None:
+            with self._lock:
+                backend = self._namespace_backends.get(namespace)
+                if backend is None:
+                    backend = self.backend.open_namespace(namespace, policy.max_size)
+                    self._namespace_backends[namespace] = backend
+        return backend
+
+    @staticmethod
+    def namespaced_key(key, namespace):
+        """Key of the entry in the memory tier and the backend: namespaces sharing a storage don't share keys."""
+        return key if namespace is None else f"{namespace}:{key}"
+
+    def get(self, key, default=None, namespace=None):
+        key = self.namespaced_key(key, namespace)
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.get_backend(namespace).get(key, _MISSING)
+            if value is _MISSING:
+                self.counters[namespace]["misses"] += 1
+                return default
+            policy = self.policies.get(namespace)
+            if policy is None or policy.ttl is None:
+                self.memory.set(key, value, namespace)
+        self.counters[namespace]["hits"] += 1
+        return value
+
+    def set(self, key, value, namespace=None):
+        key = self.namespaced_key(key, namespace)
+        policy = self.policies.get(namespace)
+        ttl = policy.ttl if policy is not None else None
+        backend = self.get_backend(namespace)
+        if backend is not self.backend and hasattr(backend, "__len__"):
+            # the storages with a max_size evict entries when they're full: count them
+            entries = len(backend) + (key not in backend)
+            backend.set(key, value, expire=ttl)
+            self.counters[namespace]["disk_evictions"] += max(entries - len(backend), 0)
+        else:
+            backend.set(key, value, expire=ttl)
+        if ttl is None:
+            self.memory.set(key, value, namespace)
+        self.counters[namespace]["sets"] += 1
+
+    def contains(self, key, namespace=None):
+        key = self.namespaced_key(key, namespace)
+        return key in self.memory or self.get_backend(namespace).get(key, _MISSING) is not _MISSING
+
+    def delete(self, key, namespace=None):
+        key = self.namespaced_key(key, namespace)
+        self.memory.delete(key)
+        del self.get_backend(namespace)[key]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        return self.contains(key)
+
+    def clear(self):
+        self.memory.clear()
+        for backend in self._namespace_backends.values():
+            backend.clear()
+        return self.backend.clear()
+
+    def stats(self):
+        """Returns the counters of the in-memory tier and, by namespace, the hits, misses, sets, evictions from
+        memory and from the storage (for namespaces with a max_size), and the size of the storage (if the backend
+        reports it)."""
+        namespaces = {}
+        for namespace in set(self.counters) | set(self.memory.evictions_by_namespace):
+            namespaces[namespace or "default"] = {
+                "hits": self.counters[namespace]["hits"],
+                "misses": self.counters[namespace]["misses"],
+                "sets": self.counters[namespace]["sets"],
+                "evictions": self.memory.evictions_by_namespace[namespace],
+                "disk_evictions": self.counters[namespace]["disk_evictions"],
+            }
+
+        volumes = {"default": self.backend.volume()} if hasattr(self.backend, "volume") else {}
+        for namespace, backend in list(self._namespace_backends.items()):
+            if hasattr(backend, "volume"):
+                volumes[namespace] = backend.volume()
+
+        return {"memory": self.memory.stats(), "namespaces": namespaces, "volume": volumes}
+
+
+class CompactDisk(diskcache.Disk):
+    """diskcache storage that serializes the values with ``serializer`` instead of pickle.
+
+    Strings, bytes and numbers are still stored natively by SQLite.
+    """
+
+    def store(self, value, read, key=diskcache.UNKNOWN):
+        if read or type(value) in (str, bytes, int, float):
+            return super().store(value, read, key=key)
+        data = serializer.dumps(value)
+        if len(data) >= self.min_file_size:
+            return super().store(value, read, key=key)
+        return 0, diskcache.core.MODE_PICKLE, None, sqlite3.Binary(data)
+
+    def fetch(self, mode, filename, value, read):
+        if mode == diskcache.core.MODE_PICKLE and value is not None:
+            return serializer.loads(value)
+        return super().fetch(mode, filename, value, read)
+
+
+class DiskCache(diskcache.Cache):
+    """diskcache store whose namespaces with a max_size are kept in their own store, in a subdirectory."""
+
+    def open_namespace(self, namespace, max_size):
+        return DiskCache(
+            directory=os.path.join(self.directory, "namespaces", namespace),
+            disk=CompactDisk,
+            size_limit=max_size,
+            eviction_policy="least-recently-stored",
+        )
+
+    def clear(self, *args, **kwargs):
+        namespaces_dir = os.path.join(self.directory, "namespaces")
+        if os.path.isdir(namespaces_dir):
+            for namespace in os.listdir(namespaces_dir):
+                with DiskCache(directory=os.path.join(namespaces_dir, namespace), disk=CompactDisk) as namespace_cache:
+                    namespace_cache.clear(*args, **kwargs)
+        return super().clear(*args, **kwargs)
+
+
+class RedisCache:
+    """Cache backend that stores the values in a Redis server.
+
+    All the processes, in any host, using the same URL share the cached values. The values are serialized with pickle:
+    only use servers that you trust. Keys are prefixed so that clear() doesn't remove other applications' keys.
+    """
+
+    def __init__(self, url, prefix="defi_protocols:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The 'redis' cache backend requires the redis package: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        data = self.client.get(self.prefix + key)
+        return default if data is None else serializer.loads(data)
+
+    def set(self, key, value, expire=None):
+        self.client.set(self.prefix + key, serializer.dumps(value), ex=math.ceil(expire) if expire else None)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def open_namespace(self, namespace, max_size):
+        logger.warning(f"The redis cache backend doesn't support a max_size for namespace '{namespace}'.")
+        return self
 
-if not os.environ.get("DEFI_PROTO_CACHE_DISABLE"):
+    def __delitem__(self, key):
+        if not self.client.delete(self.prefix + key):
+            raise KeyError(key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.client.delete(*keys[i : i + 1000])
+        return len(keys)
+
+
+def open_disk_cache():
     cache_dir = os.environ.get("DEFI_PROTO_CACHE_DIR", "/tmp/defi_protocols/")
     logger.debug(f"Cache enabled. Storage is at '{cache_dir}'.")
 
     # If a value serialized size is great than disk_min_file_size then it will be
     # saved into a file and not into the sqlite cache.db
     MIN_FILE_SIZE_BYTES = 250 * 1024 * 1024
-    _cache = diskcache.Cache(directory=cache_dir, disk_min_file_size=MIN_FILE_SIZE_BYTES)
-    check_version()
+    return DiskCache(directory=cache_dir, disk=CompactDisk, disk_min_file_size=MIN_FILE_SIZE_BYTES)
+
+
+def open_redis_cache():
+    url = os.environ.get("DEFI_PROTO_CACHE_URL", "redis://localhost:6379/0")
+    logger.debug(f"Cache enabled. Storage is at '{url}'.")
+    return RedisCache(url)
+
+
+# Persistent backends, selected with DEFI_PROTO_CACHE_BACKEND. A backend needs get(key, default),
+# set(key, value, expire), item assignment and deletion, clear() and open_namespace(namespace, max_size).
+CACHE_BACKENDS = {
+    "disk": open_disk_cache,
+    "redis": open_redis_cache,
+}
+
+
+def open_backend(name):
+    if name not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache backend '{name}'. Available backends: {', '.join(CACHE_BACKENDS)}")
+    return CACHE_BACKENDS[name]()
+
+
+# The cache is opened the first time it's used, not when the module is imported
+_cache = None
+_cache_opened = False
+_cache_lock = threading.Lock()
+
+
+def check_version(backend):
+    version = backend.get(VERSION_CACHE_KEY, 0)
+    if version != VERSION:
+        backend.clear()
+        backend[VERSION_CACHE_KEY] = VERSION
+        logger.info(f"Old cache version! Creating new cache with version: {VERSION}")
+
+
+def open_cache():
+    if os.environ.get("DEFI_PROTO_CACHE_DISABLE"):
+        logger.debug("Cache is disabled")
+        return None
+    backend = open_backend(os.environ.get("DEFI_PROTO_CACHE_BACKEND", "disk"))
+    check_version(backend)
     if os.environ.get("DEFI_PROTO_CLEAN_CACHE"):
-        _cache.clear()
-else:
-    logger.debug("Cache is disabled")
+        backend.clear()
+    return TwoTierCache(backend)
+
+
+def get_cache():
+    """Returns the cache, opening it the first time. None if the cache is disabled."""
+    global _cache, _cache_opened
+    if not _cache_opened:
+        with _cache_lock:
+            if not _cache_opened:
+                _cache = open_cache()
+                _cache_opened = True
+    return _cache
 
 
 def is_enabled():
+    if not _cache_opened:
+        # known without opening the cache
+        return not os.environ.get("DEFI_PROTO_CACHE_DISABLE")
     return _cache is not None
 
 
 def clear():
     if is_enabled():
-        _cache.clear()
+        get_cache().clear()
+
+
+def stats():
+    """Returns the statistics of the cache (see TwoTierCache.stats), or None if the cache is disabled."""
+    return get_cache().stats() if is_enabled() else None
+
+
+def dump_stats(file=None):
+    """Writes the statistics of the cache as JSON to the file (stdout by default)."""
+    json.dump(stats(), file or sys.stdout, indent=2, sort_keys=True)
 
 
 class TemporaryCache:
@@ -53,16 +431,120 @@ class TemporaryCache:
     """
 
     def __init__(self):
-        self.original_cache = _cache
+        self.original_cache = (_cache, _cache_opened)
 
     def __enter__(self):
-        global _cache
-        _cache = diskcache.Cache()
+        global _cache, _cache_opened
+        _cache, _cache_opened = TwoTierCache(DiskCache(disk=CompactDisk)), True
         return _cache
 
     def __exit__(self, *args, **kwargs):
-        global _cache
-        _cache = self.original_cache
+        global _cache, _cache_opened
+        _cache, _cache_opened = self.original_cache
+
+
+# RPC methods whose responses are cached as long as they are not made against the 'latest' block. Logs are kept in the
+# log store instead (see get_logs_web3)
+RPC_WHITELIST = {
+    "eth_chainId",
+    "eth_call",
+    "eth_getTransactionReceipt",
+    "eth_getTransactionByHash",
+    "eth_getBalance",
+    "eth_getStorageAt",
+    "eth_getCode",
+}
+
+
+KEY_SCALAR_TYPES = (str, int, float, bool, Decimal, bytes, type(None))
+
+
+def normalize_key(value):
+    value_type = type(value)
+    if value_type is str or value_type is int or value_type is bool or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_key(item) for item in value)
+    if isinstance(value, Mapping):
+        # the dict class tags the items, so that a dict and a tuple of pairs have different keys
+        return (dict,) + tuple((key, normalize_key(value[key])) for key in sorted(value))
+    if isinstance(value, bytes):
+        return bytes(value)
+    if isinstance(value, numbers.Integral):
+        # e.g. numpy integers, as returned by timestamps_to_blocks
+        return int(value)
+    if isinstance(value, KEY_SCALAR_TYPES):
+        return value
+    raise TypeError(f"Cannot generate cache key for value {value} of type {type(value)}")
+
+
+def generate_cache_key(value) -> str:
+    """Hashes the value (made of strings, numbers, bytes, lists, tuples and dicts) into a cache key.
+
+    It's equivalent to web3's generate_cache_key, but the value is hashed only once instead of hashing every item.
+    """
+    return hashlib.blake2b(repr(normalize_key(value)).encode(), digest_size=16).hexdigest()
+
+
+def bind_call_args(f):
+    """Returns a function that maps the args and kwargs of a call to f to its arguments by name, as getcallargs does.
+
+    The signature is inspected only once. Calls that don't fit the simple case are bound by getcallargs.
+    """
+    parameters = inspect.signature(f).parameters
+    names = tuple(parameters)
+    names_set = frozenset(names)
+    defaults = {
+        name: parameter.default for name, parameter in parameters.items() if parameter.default is not parameter.empty
+    }
+
+    if any(parameter.kind is not parameter.POSITIONAL_OR_KEYWORD for parameter in parameters.values()):
+        return lambda args, kwargs: getcallargs(f, *args, **kwargs)
+
+    def bind(args, kwargs):
+        call_args = dict(defaults)
+        call_args.update(zip(names, args))
+        if kwargs:
+            if not names_set.issuperset(kwargs) or any(name in kwargs for name in names[: len(args)]):
+                return getcallargs(f, *args, **kwargs)
+            call_args.update(kwargs)
+        if len(args) > len(names) or len(call_args) != len(names):
+            # raises the TypeError
+            return getcallargs(f, *args, **kwargs)
+        return call_args
+
+    return bind
+
+
+def is_rpc_cacheable(method, params):
+    return (method in RPC_WHITELIST and "latest" not in params) or method == "eth_chainId"
+
+
+def rpc_cache_key(network_name, method, params):
+    params_hash = generate_cache_key(params)
+    return f"{network_name}.{method}.{params_hash}"
+
+
+def rpc_namespace(method):
+    return f"rpc.{method}"
+
+
+def get_rpc_response(cache_key, method):
+    """Returns the cached RPC response for the key or None if it's not cached."""
+    cached = get_cache().get(cache_key, namespace=rpc_namespace(method))
+    if cached is None:
+        return None
+    key, data = cached
+    return {"jsonrpc": "2.0", "id": 11, key: data}
+
+
+def set_rpc_response(cache_key, response, method):
+    """Caches the RPC response if it has a result or if it's a deterministic error."""
+    if "error" not in response and "result" in response and response["result"] is not None:
+        get_cache().set(cache_key, ("result", response["result"]), namespace=rpc_namespace(method))
+    elif "error" in response:
+        if response["error"]["code"] in [-32000, -32015]:
+            get_cache().set(cache_key, ("error", response["error"]), namespace=rpc_namespace(method))
 
 
 def disk_cache_middleware(make_request, web3):
@@ -71,29 +553,14 @@ def disk_cache_middleware(make_request, web3):
     It also do not caches if block='latest'.
     """
 
-    RPC_WHITELIST = {"eth_chainId", "eth_call", "eth_getTransactionReceipt", "eth_getLogs", "eth_getTransactionByHash"}
-
     def middleware(method, params):
-        do_cache = False
-        if method in RPC_WHITELIST and "latest" not in params:
-            do_cache = True
-        if method == "eth_chainId":
-            do_cache = True
-
-        if do_cache:
-            params_hash = generate_cache_key(params)
-            cache_key = f"{web3._network_name}.{method}.{params_hash}"
-            if cache_key not in _cache:
+        if is_rpc_cacheable(method, params):
+            cache_key = rpc_cache_key(web3._network_name, method, params)
+            response = get_rpc_response(cache_key, method)
+            if response is None:
                 response = make_request(method, params)
-                if "error" not in response and "result" in response and response["result"] is not None:
-                    _cache[cache_key] = ("result", response["result"])
-                elif "error" in response:
-                    if response["error"]["code"] in [-32000, -32015]:
-                        _cache[cache_key] = ("error", response["error"])
-                return response
-            else:
-                key, data = _cache[cache_key]
-                return {"jsonrpc": "2.0", "id": 11, key: data}
+                set_rpc_response(cache_key, response, method)
+            return response
         else:
             logger.debug(f"Not caching '{method}' with params: '{params}'")
             return make_request(method, params)
@@ -101,24 +568,41 @@ def disk_cache_middleware(make_request, web3):
     return middleware
 
 
+async def async_disk_cache_middleware(make_request, web3):
+    """Async version of disk_cache_middleware, for AsyncWeb3 instances."""
+
+    async def middleware(method, params):
+        if is_rpc_cacheable(method, params):
+            cache_key = rpc_cache_key(web3._network_name, method, params)
+            response = get_rpc_response(cache_key, method)
+            if response is None:
+                response = await make_request(method, params)
+                set_rpc_response(cache_key, response, method)
+            return response
+        else:
+            logger.debug(f"Not caching '{method}' with params: '{params}'")
+            return await make_request(method, params)
+
+    return middleware
+
+
 def cache_contract_method(exclude_args=None, validator=None):
     def decorator(f):
+        bind = bind_call_args(f)
+        namespace = f"method.{f.__qualname__}"
+
         @functools.wraps(f)
         def method_wrapper(*args, **kwargs):
-            cache_args = getcallargs(f, *args, **kwargs)
+            cache_args = bind(args, kwargs)
             contract = cache_args.pop("self")
             if exclude_args:
                 for arg in exclude_args:
                     cache_args.pop(arg)
             cache_key = generate_cache_key((contract.address, f.__qualname__, cache_args))
-            if cache_key not in _cache or validator is None:
+            result = get_cache().get(cache_key, _MISSING, namespace=namespace) if validator is not None else _MISSING
+            if result is _MISSING or not validator(contract, **result):
                 result = f(*args, **kwargs)
-                _cache[cache_key] = result
-            else:
-                result = _cache[cache_key]
-                if not validator(contract, **result):
-                    result = f(*args, **kwargs)
-                    _cache[cache_key] = result
+                get_cache().set(cache_key, result, namespace=namespace)
             return result
 
         return method_wrapper
@@ -143,19 +627,21 @@ def cache_call(exclude_args=None, filter=None):
     """
 
     def decorator(f):
+        bind = bind_call_args(f)
+        namespace = f"call.{f.__qualname__}"
+
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            cache_args = getcallargs(f, *args, **kwargs)
-            if filter is None or filter(cache_args):
+            cache_args = bind(args, kwargs)
+            if is_enabled() and (filter is None or filter(cache_args)):
                 if exclude_args:
                     for arg in exclude_args:
                         cache_args.pop(arg)
                 cache_key = generate_cache_key((f.__qualname__, cache_args))
-                if cache_key not in _cache:
+                result = get_cache().get(cache_key, _MISSING, namespace=namespace)
+                if result is _MISSING:
                     result = f(*args, **kwargs)
-                    _cache[cache_key] = result
-                else:
-                    result = _cache[cache_key]
+                    get_cache().set(cache_key, result, namespace=namespace)
             else:
                 result = f(*args, **kwargs)
             return result
@@ -168,10 +654,22 @@ def cache_call(exclude_args=None, filter=None):
 def const_call(f):
     """Utility to do .call() on web3 contracts that are known to be cacheable"""
     cache_key = generate_cache_key((f.w3._network_name, f.address, f.function_identifier, f.args, f.kwargs))
-    if not is_enabled() or cache_key not in _cache:
+    if not is_enabled():
+        return f.call()
+    result = get_cache().get(cache_key, _MISSING, namespace="const")
+    if result is _MISSING:
         result = f.call()
-        if is_enabled():
-            _cache[cache_key] = result
-    else:
-        result = _cache[cache_key]
+        get_cache().set(cache_key, result, namespace="const")
+    return result
+
+
+async def async_const_call(f):
+    """Async version of const_call, for contract functions of AsyncWeb3 instances"""
+    cache_key = generate_cache_key((f.w3._network_name, f.address, f.function_identifier, f.args, f.kwargs))
+    if not is_enabled():
+        return await f.call()
+    result = get_cache().get(cache_key, _MISSING, namespace="const")
+    if result is _MISSING:
+        result = await f.call()
+        get_cache().set(cache_key, result, namespace="const")
     return result
@@ -0,0 +1,254 @@
+"""Registry of the supported blockchains.
+
+Everything that differs from one blockchain to another (node endpoints, explorer APIs and key, native token, block
+time, Multicall3 deployment) is described once per blockchain in CHAINS, instead of in an if/elif chain per function.
+
+    chain = get_chain(ETHEREUM)
+    url = chain.getabi_api % (address, chain.explorer_api_key)
+"""
+from dataclasses import dataclass
+
+from defi_protocols import constants
+from defi_protocols.constants import (
+    API_ARBITRUM_GETABI,
+    API_ARBITRUM_GETLOGS,
+    API_ARBITRUM_TOKENTX,
+    API_ARBITRUM_TXLIST,
+    API_AVALANCHE_GETABI,
+    API_AVALANCHE_GETLOGS,
+    API_AVALANCHE_TOKENTX,
+    API_AVALANCHE_TXLIST,
+    API_BINANCE_GETABI,
+    API_BINANCE_GETLOGS,
+    API_BINANCE_TOKENTX,
+    API_BINANCE_TXLIST,
+    API_BLOCKSCOUT_GETABI,
+    API_BLOCKSCOUT_GETTOKENCONTRACT,
+    API_ETHERSCAN_GETABI,
+    API_ETHERSCAN_GETCONTRACTCREATION,
+    API_ETHERSCAN_GETLOGS,
+    API_ETHERSCAN_TOKENTX,
+    API_ETHERSCAN_TXLIST,
+    API_ETHPLORER_GETTOKENINFO,
+    API_FANTOM_GETABI,
+    API_FANTOM_GETLOGS,
+    API_FANTOM_TOKENTX,
+    API_FANTOM_TXLIST,
+    API_GNOSISSCAN_GETABI,
+    API_GNOSISSCAN_GETLOGS,
+    API_GNOSISSCAN_TOKENTX,
+    API_GNOSISSCAN_TXLIST,
+    API_GOERLI_GETABI,
+    API_GOERLI_GETLOGS,
+    API_GOERLI_TOKENTX,
+    API_GOERLI_TXLIST,
+    API_KOVAN_GETABI,
+    API_KOVAN_GETLOGS,
+    API_KOVAN_TOKENTX,
+    API_KOVAN_TXLIST,
+    API_OPTIMISM_GETABI,
+    API_OPTIMISM_GETLOGS,
+    API_OPTIMISM_TOKENTX,
+    API_OPTIMISM_TXLIST,
+    API_POLYGONSCAN_GETABI,
+    API_POLYGONSCAN_GETLOGS,
+    API_POLYGONSCAN_TOKENTX,
+    API_POLYGONSCAN_TXLIST,
+    API_ROPSTEN_GETABI,
+    API_ROPSTEN_GETLOGS,
+    API_ROPSTEN_TOKENTX,
+    API_ROPSTEN_TXLIST,
+    ARBITRUM,
+    AVALANCHE,
+    BINANCE,
+    ETHEREUM,
+    FANTOM,
+    GOERLI,
+    KOVAN,
+    MULTICALL3_ADDRESS,
+    MULTICALL3_DEPLOYMENT_BLOCKS,
+    OPTIMISM,
+    POLYGON,
+    ROPSTEN,
+    TESTNET_HEADER,
+    XDAI,
+)
+
+
+@dataclass(frozen=True)
+class Chain:
+    """A blockchain and the APIs used to query it.
+
+    The explorer API templates take the same arguments as the constants they come from, followed by the API key.
+    The ones a blockchain doesn't have are None.
+    """
+
+    name: str
+    native_token: str
+    # average seconds between blocks
+    block_time: float
+    # name of the constant with the explorer API key: the keys are read from the configuration when first used
+    explorer_api_key_name: str = None
+    # headers of the explorer requests
+    explorer_headers: dict = None
+    getabi_api: str = None
+    # keyless API queried for the ABIs the explorer doesn't have verified
+    getabi_fallback_api: str = None
+    tokentx_api: str = None
+    txlist_api: str = None
+    getlogs_api: str = None
+    getcontractcreation_api: str = None
+    tokeninfo_api: str = None
+    # the token info API is not the explorer's, it has its own key (None if it's keyless)
+    tokeninfo_api_key_name: str = None
+    multicall_address: str = MULTICALL3_ADDRESS
+
+    @property
+    def nodes(self) -> dict:
+        """The 'latest' and 'archival' node endpoints of the configuration."""
+        return constants.NODES_ENDPOINTS[self.name]
+
+    @property
+    def explorer_api_key(self) -> str | None:
+        return None if self.explorer_api_key_name is None else getattr(constants, self.explorer_api_key_name)
+
+    @property
+    def tokeninfo_api_key(self) -> str | None:
+        return None if self.tokeninfo_api_key_name is None else getattr(constants, self.tokeninfo_api_key_name)
+
+    @property
+    def multicall_deployment_block(self) -> int | None:
+        """Block in which Multicall3 was deployed, None if it isn't."""
+        return MULTICALL3_DEPLOYMENT_BLOCKS.get(self.name)
+
+
+CHAINS = {
+    chain.name: chain
+    for chain in [
+        Chain(
+            name=ETHEREUM,
+            native_token="ETH",
+            block_time=12,
+            explorer_api_key_name="API_KEY_ETHERSCAN",
+            getabi_api=API_ETHERSCAN_GETABI,
+            tokentx_api=API_ETHERSCAN_TOKENTX,
+            txlist_api=API_ETHERSCAN_TXLIST,
+            getlogs_api=API_ETHERSCAN_GETLOGS,
+            getcontractcreation_api=API_ETHERSCAN_GETCONTRACTCREATION,
+            tokeninfo_api=API_ETHPLORER_GETTOKENINFO,
+            tokeninfo_api_key_name="API_KEY_ETHPLORER",
+        ),
+        Chain(
+            name=POLYGON,
+            native_token="MATIC",
+            block_time=2,
+            explorer_api_key_name="API_KEY_POLSCAN",
+            getabi_api=API_POLYGONSCAN_GETABI,
+            tokentx_api=API_POLYGONSCAN_TOKENTX,
+            txlist_api=API_POLYGONSCAN_TXLIST,
+            getlogs_api=API_POLYGONSCAN_GETLOGS,
+        ),
+        Chain(
+            name=XDAI,
+            native_token="XDAI",
+            block_time=5,
+            explorer_api_key_name="API_KEY_GNOSISSCAN",
+            getabi_api=API_GNOSISSCAN_GETABI,
+            getabi_fallback_api=API_BLOCKSCOUT_GETABI,
+            tokentx_api=API_GNOSISSCAN_TOKENTX,
+            txlist_api=API_GNOSISSCAN_TXLIST,
+            getlogs_api=API_GNOSISSCAN_GETLOGS,
+            tokeninfo_api=API_BLOCKSCOUT_GETTOKENCONTRACT,
+        ),
+        Chain(
+            name=BINANCE,
+            native_token="BNB",
+            block_time=3,
+            explorer_api_key_name="API_KEY_BINANCE",
+            getabi_api=API_BINANCE_GETABI,
+            tokentx_api=API_BINANCE_TOKENTX,
+            txlist_api=API_BINANCE_TXLIST,
+            getlogs_api=API_BINANCE_GETLOGS,
+        ),
+        Chain(
+            name=AVALANCHE,
+            native_token="AVAX",
+            block_time=2,
+            explorer_api_key_name="API_KEY_AVALANCHE",
+            getabi_api=API_AVALANCHE_GETABI,
+            tokentx_api=API_AVALANCHE_TOKENTX,
+            txlist_api=API_AVALANCHE_TXLIST,
+            getlogs_api=API_AVALANCHE_GETLOGS,
+        ),
+        Chain(
+            name=FANTOM,
+            native_token="FTM",
+            block_time=1,
+            explorer_api_key_name="API_KEY_FANTOM",
+            getabi_api=API_FANTOM_GETABI,
+            tokentx_api=API_FANTOM_TOKENTX,
+            txlist_api=API_FANTOM_TXLIST,
+            getlogs_api=API_FANTOM_GETLOGS,
+        ),
+        Chain(
+            name=OPTIMISM,
+            native_token="ETH",
+            block_time=2,
+            explorer_api_key_name="API_KEY_OPTIMISM",
+            getabi_api=API_OPTIMISM_GETABI,
+            tokentx_api=API_OPTIMISM_TOKENTX,
+            txlist_api=API_OPTIMISM_TXLIST,
+            getlogs_api=API_OPTIMISM_GETLOGS,
+        ),
+        Chain(
+            name=ARBITRUM,
+            native_token="ETH",
+            block_time=0.25,
+            explorer_api_key_name="API_KEY_ARBITRUM",
+            getabi_api=API_ARBITRUM_GETABI,
+            tokentx_api=API_ARBITRUM_TOKENTX,
+            txlist_api=API_ARBITRUM_TXLIST,
+            getlogs_api=API_ARBITRUM_GETLOGS,
+        ),
+        Chain(
+            name=ROPSTEN,
+            native_token="ETH",
+            block_time=12,
+            explorer_api_key_name="API_KEY_ETHERSCAN",
+            explorer_headers=TESTNET_HEADER,
+            getabi_api=API_ROPSTEN_GETABI,
+            tokentx_api=API_ROPSTEN_TOKENTX,
+            txlist_api=API_ROPSTEN_TXLIST,
+            getlogs_api=API_ROPSTEN_GETLOGS,
+        ),
+        Chain(
+            name=KOVAN,
+            native_token="ETH",
+            block_time=4,
+            explorer_api_key_name="API_KEY_ETHERSCAN",
+            explorer_headers=TESTNET_HEADER,
+            getabi_api=API_KOVAN_GETABI,
+            tokentx_api=API_KOVAN_TOKENTX,
+            txlist_api=API_KOVAN_TXLIST,
+            getlogs_api=API_KOVAN_GETLOGS,
+        ),
+        Chain(
+            name=GOERLI,
+            native_token="ETH",
+            block_time=12,
+            explorer_api_key_name="API_KEY_ETHERSCAN",
+            explorer_headers=TESTNET_HEADER,
+            getabi_api=API_GOERLI_GETABI,
+            tokentx_api=API_GOERLI_TOKENTX,
+            txlist_api=API_GOERLI_TXLIST,
+            getlogs_api=API_GOERLI_GETLOGS,
+        ),
+    ]
+}
+
+
+def get_chain(blockchain: str) -> Chain:
+    try:
+        return CHAINS[blockchain]
+    except KeyError:
+        raise ValueError(f"Unknown blockchain '{blockchain}'") from None
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 from pathlib import Path
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -26,67 +27,33 @@ GOERLI = "goerli"
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-if "CONFIG_PATH" in os.environ:
-    config_path = os.environ["CONFIG_PATH"]
-    with open(config_path, "r") as config_file:
-        config_data = json.load(config_file)
-else:
-    with open(str(Path(os.path.abspath(__file__)).resolve().parents[0]) + "/config.json", "r") as config_file:
-        config_data = json.load(config_file)
-
-NODE_ETH = {"latest": config_data["nodes"][ETHEREUM]["latest"], "archival": config_data["nodes"][ETHEREUM]["archival"]}
-
-NODE_POL = {"latest": config_data["nodes"][POLYGON]["latest"], "archival": config_data["nodes"][POLYGON]["archival"]}
-
-NODE_XDAI = {"latest": config_data["nodes"][XDAI]["latest"], "archival": config_data["nodes"][XDAI]["archival"]}
-
-NODE_BINANCE = {
-    "latest": config_data["nodes"][BINANCE]["latest"],
-    "archival": config_data["nodes"][BINANCE]["archival"],
-}
 
-NODE_AVALANCHE = {
-    "latest": config_data["nodes"][AVALANCHE]["latest"],
-    "archival": config_data["nodes"][AVALANCHE]["archival"],
-}
-
-NODE_FANTOM = {"latest": config_data["nodes"][FANTOM]["latest"], "archival": config_data["nodes"][FANTOM]["archival"]}
-
-NODE_OPTIMISM = {
-    "latest": config_data["nodes"][OPTIMISM]["latest"],
-    "archival": config_data["nodes"][OPTIMISM]["archival"],
-}
-
-NODE_ARBITRUM = {
-    "latest": config_data["nodes"][ARBITRUM]["latest"],
-    "archival": config_data["nodes"][ARBITRUM]["archival"],
-}
-
-# ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-# TESTNETS
-# ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-NODE_ROPSTEN = {
-    "latest": config_data["nodes"][ROPSTEN]["latest"],
-    "archival": config_data["nodes"][ROPSTEN]["archival"],
+# The configuration is read the first time one of the names that come from it is used (see __getattr__ at the end):
+# config_data, the NODE_* endpoints, NODES_ENDPOINTS and the API_KEY_* keys.
+def load_config() -> dict:
+    if "CONFIG_PATH" in os.environ:
+        config_path = os.environ["CONFIG_PATH"]
+    else:
+        config_path = str(Path(os.path.abspath(__file__)).resolve().parents[0]) + "/config.json"
+    with open(config_path, "r") as config_file:
+        return json.load(config_file)
+
+
+# Node endpoints of the configuration, by name: NODE_ETH = {"latest": [...], "archival": [...]}
+CONFIG_NODES = {
+    "NODE_ETH": ETHEREUM,
+    "NODE_POL": POLYGON,
+    "NODE_XDAI": XDAI,
+    "NODE_BINANCE": BINANCE,
+    "NODE_AVALANCHE": AVALANCHE,
+    "NODE_FANTOM": FANTOM,
+    "NODE_OPTIMISM": OPTIMISM,
+    "NODE_ROPSTEN": ROPSTEN,
+    "NODE_KOVAN": KOVAN,
+    "NODE_GOERLI": GOERLI,
+    "NODE_ARBITRUM": ARBITRUM,
 }
 
-NODE_KOVAN = {"latest": config_data["nodes"][KOVAN]["latest"], "archival": config_data["nodes"][KOVAN]["archival"]}
-
-NODE_GOERLI = {"latest": config_data["nodes"][GOERLI]["latest"], "archival": config_data["nodes"][GOERLI]["archival"]}
-
-NODES_ENDPOINTS = {
-    ETHEREUM: NODE_ETH,
-    POLYGON: NODE_POL,
-    XDAI: NODE_XDAI,
-    BINANCE: NODE_BINANCE,
-    AVALANCHE: NODE_AVALANCHE,
-    FANTOM: NODE_FANTOM,
-    OPTIMISM: NODE_OPTIMISM,
-    ROPSTEN: NODE_ROPSTEN,
-    KOVAN: NODE_KOVAN,
-    GOERLI: NODE_GOERLI,
-    ARBITRUM: NODE_ARBITRUM,
-}
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # MAX EXECUTIONS
@@ -280,16 +247,19 @@ UNIT = "Unit"
 # API KEYS
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-API_KEY_ETHERSCAN = config_data["apikeys"]["etherscan"]
-API_KEY_POLSCAN = config_data["apikeys"]["polscan"]
-API_KEY_GNOSISSCAN = config_data["apikeys"]["gnosisscan"]
-API_KEY_BINANCE = config_data["apikeys"]["binance"]
-API_KEY_AVALANCHE = config_data["apikeys"]["avalanche"]
-API_KEY_FANTOM = config_data["apikeys"]["fantom"]
-API_KEY_OPTIMISM = config_data["apikeys"]["optimism"]
-API_KEY_ARBITRUM = config_data["apikeys"]["arbitrum"]
-API_KEY_ZAPPER = config_data["apikeys"]["zapper"]
-API_KEY_ETHPLORER = config_data["apikeys"]["ethplorer"]
+# API keys of the configuration, by name: API_KEY_ETHERSCAN = config_data["apikeys"]["etherscan"]
+CONFIG_API_KEYS = {
+    "API_KEY_ETHERSCAN": "etherscan",
+    "API_KEY_POLSCAN": "polscan",
+    "API_KEY_GNOSISSCAN": "gnosisscan",
+    "API_KEY_BINANCE": "binance",
+    "API_KEY_AVALANCHE": "avalanche",
+    "API_KEY_FANTOM": "fantom",
+    "API_KEY_OPTIMISM": "optimism",
+    "API_KEY_ARBITRUM": "arbitrum",
+    "API_KEY_ZAPPER": "zapper",
+    "API_KEY_ETHPLORER": "ethplorer",
+}
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -469,3 +439,40 @@ API_BLOCKSCOUT_GETTOKENCONTRACT = (
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 IMPLEMENTATION_SLOT_EIP_1967 = "0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc"
 IMPLEMENTATION_SLOT_UNSTRUCTURED = "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# MULTICALL3
+# ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Multicall3 is deployed at the same address in every supported blockchain
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+# Block in which Multicall3 was deployed in each blockchain. Calls to older blocks can't be aggregated.
+MULTICALL3_DEPLOYMENT_BLOCKS = {
+    ETHEREUM: 14353601,
+    POLYGON: 25770160,
+    XDAI: 21022491,
+    BINANCE: 15921452,
+    AVALANCHE: 11907934,
+    FANTOM: 33001987,
+    OPTIMISM: 4286263,
+    ARBITRUM: 7654707,
+    GOERLI: 6584098,
+}
+
+
+def __getattr__(name):
+    """Returns the names that come from the configuration, reading it the first time one of them is used."""
+    module = sys.modules[__name__]
+    if name == "config_data":
+        value = load_config()
+    elif name in CONFIG_NODES:
+        nodes = module.config_data["nodes"][CONFIG_NODES[name]]
+        value = {"latest": nodes["latest"], "archival": nodes["archival"]}
+    elif name == "NODES_ENDPOINTS":
+        value = {blockchain: getattr(module, node_name) for node_name, blockchain in CONFIG_NODES.items()}
+    elif name in CONFIG_API_KEYS:
+        value = module.config_data["apikeys"][CONFIG_API_KEYS[name]]
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # the next times the name is found in the module
+    globals()[name] = value
+    return value
@@ -1,10 +1,8 @@
-import json
-
 from web3 import Web3
 from web3.contract import Contract
 
 from defi_protocols.cache import const_call
-from defi_protocols.functions import get_node
+from defi_protocols.functions import get_cached_contract, get_node, parse_abi
 
 
 class ContractFunction:
@@ -35,10 +33,8 @@ class DefiContract:
     def __init__(self, blockchain: str, address: str) -> None:
         self.blockchain = blockchain
         self.address = Web3.to_checksum_address(address)
-        self.node = None
-        self.contract = None
 
-        for method_name in [func["name"] for func in json.loads(self.ABI)]:
+        for method_name in [func["name"] for func in parse_abi(self.ABI)]:
             setattr(self, method_name, self.create_method(method_name))
 
     def create_method(self, method_name):
@@ -47,16 +43,8 @@ class DefiContract:
 
         return method
 
-    def must_update(self, block) -> None:
-        return self.node is None or block != self.node._called_with_block
-
     def get_node(self, block) -> Web3:
-        if self.must_update(block):
-            self.node = get_node(self.blockchain, block)
-        return self.node
+        return get_node(self.blockchain, block)
 
     def get_contract(self, block) -> Contract:
-        if self.must_update(block) or self.contract is None:
-            self.node = get_node(self.blockchain, block)
-            self.contract = self.node.eth.contract(address=self.address, abi=self.ABI)
-        return self.contract
+        return get_cached_contract(self.get_node(block), self.address, self.ABI)
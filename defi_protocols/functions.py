@@ -2,124 +2,64 @@ import calendar
 import json
 import logging
 import math
+import os
 import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Iterator, List, Tuple
 
 import requests
+from eth_utils import to_bytes
+from hexbytes import HexBytes
 from web3 import Web3
+from web3._utils.encoding import FriendlyJsonSerde, Web3JsonEncoder
+from web3._utils.request import make_post_request
+from web3.contract import Contract
 from web3.exceptions import ABIFunctionNotFound, BadFunctionCallOutput, ContractLogicError
 from web3.providers import HTTPProvider, JSONBaseProvider
 
 from defi_protocols import cache
+from defi_protocols.abi_store import ABI_STORE_PATH, NOT_VERIFIED, ABIStore
+from defi_protocols.block_index import INDEX_DIR, UNCONFIRMED_BLOCKS, BlockTimestampIndex
 from defi_protocols.cache import cache_call, const_call
-from defi_protocols.constants import (
+from defi_protocols.chains import CHAINS, get_chain
+
+# the blockchain names are exported too, `from defi_protocols.functions import *` is how the README imports them
+from defi_protocols.constants import (  # noqa: F401
     ABI_TOKEN_SIMPLIFIED,
-    API_ARBITRUM_GETABI,
-    API_ARBITRUM_GETBLOCKNOBYTIME,
-    API_ARBITRUM_GETBLOCKREWARD,
-    API_ARBITRUM_GETLOGS,
-    API_ARBITRUM_TOKENTX,
-    API_ARBITRUM_TXLIST,
-    API_AVALANCHE_GETABI,
-    API_AVALANCHE_GETBLOCKNOBYTIME,
-    API_AVALANCHE_GETBLOCKREWARD,
-    API_AVALANCHE_GETLOGS,
-    API_AVALANCHE_TOKENTX,
-    API_AVALANCHE_TXLIST,
-    API_BINANCE_GETABI,
-    API_BINANCE_GETBLOCKNOBYTIME,
-    API_BINANCE_GETBLOCKREWARD,
-    API_BINANCE_GETLOGS,
-    API_BINANCE_TOKENTX,
-    API_BINANCE_TXLIST,
-    API_BLOCKSCOUT_GETABI,
-    API_BLOCKSCOUT_GETTOKENCONTRACT,
-    API_ETHERSCAN_GETABI,
-    API_ETHERSCAN_GETBLOCKNOBYTIME,
-    API_ETHERSCAN_GETBLOCKREWARD,
-    API_ETHERSCAN_GETCONTRACTCREATION,
-    API_ETHERSCAN_GETLOGS,
-    API_ETHERSCAN_TOKENTX,
-    API_ETHERSCAN_TXLIST,
-    API_ETHPLORER_GETTOKENINFO,
-    API_FANTOM_GETABI,
-    API_FANTOM_GETBLOCKNOBYTIME,
-    API_FANTOM_GETBLOCKREWARD,
-    API_FANTOM_GETLOGS,
-    API_FANTOM_TOKENTX,
-    API_FANTOM_TXLIST,
-    API_GNOSISSCAN_GETABI,
-    API_GNOSISSCAN_GETBLOCKNOBYTIME,
-    API_GNOSISSCAN_GETBLOCKREWARD,
-    API_GNOSISSCAN_GETLOGS,
-    API_GNOSISSCAN_TOKENTX,
-    API_GNOSISSCAN_TXLIST,
-    API_GOERLI_GETABI,
-    API_GOERLI_GETBLOCKNOBYTIME,
-    API_GOERLI_GETBLOCKREWARD,
-    API_GOERLI_GETLOGS,
-    API_GOERLI_TOKENTX,
-    API_GOERLI_TXLIST,
-    API_KEY_ARBITRUM,
-    API_KEY_AVALANCHE,
-    API_KEY_BINANCE,
-    API_KEY_ETHERSCAN,
-    API_KEY_ETHPLORER,
-    API_KEY_FANTOM,
-    API_KEY_GNOSISSCAN,
-    API_KEY_OPTIMISM,
-    API_KEY_POLSCAN,
-    API_KOVAN_GETABI,
-    API_KOVAN_GETBLOCKNOBYTIME,
-    API_KOVAN_GETBLOCKREWARD,
-    API_KOVAN_GETLOGS,
-    API_KOVAN_TOKENTX,
-    API_KOVAN_TXLIST,
-    API_OPTIMISM_GETABI,
-    API_OPTIMISM_GETBLOCKNOBYTIME,
-    API_OPTIMISM_GETBLOCKREWARD,
-    API_OPTIMISM_GETLOGS,
-    API_OPTIMISM_TOKENTX,
-    API_OPTIMISM_TXLIST,
-    API_POLYGONSCAN_GETABI,
-    API_POLYGONSCAN_GETBLOCKNOBYTIME,
-    API_POLYGONSCAN_GETBLOCKREWARD,
-    API_POLYGONSCAN_GETLOGS,
-    API_POLYGONSCAN_TOKENTX,
-    API_POLYGONSCAN_TXLIST,
-    API_ROPSTEN_GETABI,
-    API_ROPSTEN_GETBLOCKNOBYTIME,
-    API_ROPSTEN_GETBLOCKREWARD,
-    API_ROPSTEN_GETLOGS,
-    API_ROPSTEN_TOKENTX,
-    API_ROPSTEN_TXLIST,
     ARBITRUM,
     AVALANCHE,
     BINANCE,
     E_ADDRESS,
     ETHEREUM,
     FANTOM,
-    GOERLI,
     IMPLEMENTATION_SLOT_EIP_1967,
     IMPLEMENTATION_SLOT_UNSTRUCTURED,
-    KOVAN,
     MAX_EXECUTIONS,
-    NODES_ENDPOINTS,
     OPTIMISM,
     POLYGON,
-    ROPSTEN,
-    TESTNET_HEADER,
     XDAI,
     ZERO_ADDRESS,
 )
+from defi_protocols.log_scanner import INITIAL_BLOCK_RANGE, LogScanner
+from defi_protocols.log_store import LOG_STORE_DIR, LOG_STORE_MAX_SIZE, LogStore
+from defi_protocols.proxy_resolver import ProxyResolver
+from defi_protocols.util.explorer_client import get_explorer_client
+
+if TYPE_CHECKING:
+    # numpy is only imported by the vectorized functions that use it
+    import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
 def latest_not_in_params(args):
-    return "latest" not in args
+    return "latest" not in args.values()
 
 
 # CUSTOM EXCEPTIONS
@@ -145,6 +85,10 @@ class AllProvidersDownError(Exception):
     pass
 
 
+class BatchNotSupportedError(Exception):
+    pass
+
+
 def to_token_amount(
     token_address: str, amount: int | Decimal, blockchain: str, web3: Web3, decimals: bool = True
 ) -> Decimal:
@@ -153,38 +97,246 @@ def to_token_amount(
     return amount / Decimal(10**decimals)
 
 
+# Smoothing factor of the rolling latency and error rate of the endpoints
+HEALTH_EWMA_ALPHA = 0.2
+# How much slower an endpoint that always fails is considered, relative to its latency
+ERROR_RATE_PENALTY = 4
+# Seconds a tripped endpoint is skipped. It doubles every time the endpoint trips again without recovering.
+ENDPOINT_COOLDOWN = 30
+MAX_ENDPOINT_COOLDOWN = 600
+# Seconds to wait before going through the endpoints again. It doubles with every new round.
+RETRY_BACKOFF = 0.5
+# Number of recent latencies kept per endpoint to estimate its percentiles
+LATENCY_SAMPLES = 100
+# Hedged requests: seconds to wait for the primary endpoint when there aren't enough latencies to compute its p95
+DEFAULT_HEDGE_AFTER = 1.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_WORKERS = 32
+
+
+class EndpointHealth:
+    """Rolling latency and error rate of a node endpoint.
+
+    An endpoint trips after failing more than max_consecutive_errors times in a row and is skipped until its
+    cool-down expires.
+    """
+
+    def __init__(self, max_consecutive_errors: int):
+        self.max_consecutive_errors = max_consecutive_errors
+        self.latency = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.error_rate = 0.0
+        self.errors = deque(maxlen=10)
+        self.consecutive_errors = 0
+        self.trips = 0
+        self.tripped_until = 0.0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += HEALTH_EWMA_ALPHA * (latency - self.latency)
+            self.latencies.append(latency)
+            self.error_rate -= HEALTH_EWMA_ALPHA * self.error_rate
+            self.consecutive_errors = 0
+            self.trips = 0
+
+    def record_error(self, error: Exception) -> None:
+        with self._lock:
+            self.errors.append(error)
+            self.error_rate += HEALTH_EWMA_ALPHA * (1 - self.error_rate)
+            self.consecutive_errors += 1
+            if self.consecutive_errors > self.max_consecutive_errors:
+                cooldown = min(ENDPOINT_COOLDOWN * 2**self.trips, MAX_ENDPOINT_COOLDOWN)
+                self.tripped_until = time.monotonic() + cooldown
+                self.trips += 1
+                self.consecutive_errors = 0
+                logger.warning(
+                    "Endpoint tripped after %d errors. Skipping it for %d seconds.", len(self.errors), cooldown
+                )
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self.tripped_until
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        """Returns the percentile (between 0 and 1) of the recent latencies, or None if there are none."""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(percentile * len(latencies)), len(latencies) - 1)]
+
+    def score(self) -> float:
+        """Expected cost of a request to the endpoint. Endpoints without measurements go first, to measure them.
+
+        Requests in flight count as queued ahead, so concurrent requests spread over the healthy endpoints.
+        """
+        if self.latency is None:
+            return float(self.in_flight)
+        return self.latency * (1 + ERROR_RATE_PENALTY * self.error_rate) * (1 + self.in_flight)
+
+
+def rank_providers(providers: List[Tuple[Any, EndpointHealth]]) -> List[Tuple[Any, EndpointHealth]]:
+    """Returns the available (provider, health) pairs, the fastest and healthiest first."""
+    return sorted([item for item in providers if item[1].is_available()], key=lambda item: item[1].score())
+
+
 class ProviderManager(JSONBaseProvider):
-    def __init__(self, endpoints: List, max_fails_per_provider: int = 2, max_executions: int = 2):
+    """JSON-RPC provider that spreads the requests over several endpoints.
+
+    With hedge=True, a request that the best endpoint hasn't answered after hedge_after seconds (by default its
+    p95 latency) is also sent to the next best endpoint, and the first successful response wins.
+    """
+
+    def __init__(
+        self,
+        endpoints: List,
+        max_fails_per_provider: int = 2,
+        max_executions: int = MAX_EXECUTIONS,
+        retry_backoff: float = RETRY_BACKOFF,
+        hedge: bool = False,
+        hedge_after: float = None,
+    ):
         super().__init__()
         self.endpoints = endpoints
         self.max_fails_per_provider = max_fails_per_provider
         self.max_executions = max_executions
+        self.retry_backoff = retry_backoff
+        self.hedge = hedge
+        self.hedge_after = hedge_after
         self.providers = []
+        # providers that answered a batch with a single error: they get one request per item
+        self.batch_unsupported = set()
+        self._hedge_executor = None
 
         for url in endpoints:
             if "://" not in url:
                 logger.warning(f"Skipping invalid endpoint URI '{url}'.")
                 continue
             provider = HTTPProvider(url)
-            errors = []
-            self.providers.append((provider, errors))
+            health = EndpointHealth(max_fails_per_provider)
+            self.providers.append((provider, health))
 
     def make_request(self, method, params):
-        for _ in range(MAX_EXECUTIONS):
-            for provider, errors in self.providers:
-                if len(errors) > self.max_fails_per_provider:
-                    continue
+        if self.hedge:
+            return self._make_hedged_request(lambda provider: provider.make_request(method, params))
+        return self._make_request_with_failover(lambda provider: provider.make_request(method, params))
+
+    def make_batch_request(self, rpc_requests: List[Tuple[str, Any]]) -> List[dict]:
+        """Sends all the (method, params) requests in a single JSON-RPC batch.
+
+        Returns the responses in the same order as the requests. Errors are reported per response. Providers that
+        don't support batches get one request per item, without counting it as an error of the endpoint.
+        """
+        return self._make_request_with_failover(lambda provider: self._send_batch(provider, rpc_requests))
+
+    def _send_batch(self, provider, rpc_requests):
+        if provider not in self.batch_unsupported:
+            try:
+                return make_provider_batch_request(provider, rpc_requests)
+            except BatchNotSupportedError as e:
+                logger.info("%s Sending the requests one at a time.", e)
+                self.batch_unsupported.add(provider)
+        return [provider.make_request(method, params) for method, params in rpc_requests]
+
+    def get_hedge_after(self, health: EndpointHealth) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return DEFAULT_HEDGE_AFTER
+        return health.latency_percentile(0.95)
+
+    def _send(self, send, provider, health):
+        start = time.monotonic()
+        with health._lock:
+            health.in_flight += 1
+        try:
+            response = send(provider)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            health.record_error(e)
+            logger.error("Error when making request: %s", e)
+            raise
+        except Exception as e:
+            health.record_error(e)
+            logger.exception("Unexpected exception when making request.")
+            raise
+        finally:
+            with health._lock:
+                health.in_flight -= 1
+        health.record_success(time.monotonic() - start)
+        return response
+
+    def _make_request_with_failover(self, send):
+        for execution in range(self.max_executions):
+            if execution > 0:
+                time.sleep(self.retry_backoff * 2 ** (execution - 1))
+            for provider, health in rank_providers(self.providers):
                 try:
-                    response = provider.make_request(method, params)
-                    return response
-                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-                    errors.append(e)
-                    logger.error("Error when making request: %s", e)
-                except Exception as e:
-                    errors.append(e)
-                    logger.exception("Unexpected exception when making request.")
+                    return self._send(send, provider, health)
+                except Exception:
+                    continue
         raise AllProvidersDownError(f"No working provider available. Endpoints {self.endpoints}")
 
+    def _make_hedged_request(self, send):
+        ranked = rank_providers(self.providers)
+        if len(ranked) < 2:
+            return self._make_request_with_failover(send)
+
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS)
+
+        (primary, primary_health), (secondary, secondary_health) = ranked[:2]
+        futures = [self._hedge_executor.submit(self._send, send, primary, primary_health)]
+        done, _ = wait(futures, timeout=self.get_hedge_after(primary_health))
+        if done and futures[0].exception() is None:
+            # a JSON-RPC error (e.g. a revert) is returned as is, the next endpoint would answer the same
+            return futures[0].result()
+        if not done:
+            logger.debug("Primary endpoint is slow. Hedging the request to the next endpoint.")
+        futures.append(self._hedge_executor.submit(self._send, send, secondary, secondary_health))
+
+        # in the race, a JSON-RPC error only wins if no endpoint returns a result
+        error_response = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception:
+                continue
+            if "error" in response:
+                error_response = error_response or response
+                continue
+            return response
+
+        if error_response is not None:
+            return error_response
+
+        # both endpoints failed: go through all of them
+        return self._make_request_with_failover(send)
+
+
+def make_provider_batch_request(provider: HTTPProvider, rpc_requests: List[Tuple[str, Any]]) -> List[dict]:
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": request_id}
+        for request_id, (method, params) in enumerate(rpc_requests)
+    ]
+    encoded = FriendlyJsonSerde().json_encode(payload, Web3JsonEncoder)
+    raw_response = make_post_request(provider.endpoint_uri, to_bytes(text=encoded), **provider.get_request_kwargs())
+    responses = provider.decode_rpc_response(raw_response)
+    if not isinstance(responses, list):
+        # nodes that do not support batches answer with a single error
+        raise BatchNotSupportedError(f"Batch request not supported by {provider.endpoint_uri}: {responses}")
+
+    responses_by_id = {response.get("id"): response for response in responses}
+    return [
+        responses_by_id.get(
+            request_id,
+            {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "Missing response in batch"}},
+        )
+        for request_id in range(len(rpc_requests))
+    ]
+
 
 def get_web3_provider(provider):
     web3 = Web3(provider)
@@ -214,39 +366,97 @@ def get_web3_provider(provider):
 
 
 def get_web3_call_count(web3):
-    """Obtain the total number of calls that have been made by a web3 instance."""
+    """Obtain the total number of calls that have been made by a web3 instance.
+
+    The instances returned by get_node are shared by the whole process: reset the count with reset_web3_call_count
+    to count only the calls made from then on.
+    """
     return web3.middleware_onion["call_counter"].call_count
 
 
+def reset_web3_call_count(web3):
+    """Sets the number of calls made by a web3 instance back to 0."""
+    web3.middleware_onion["call_counter"].call_count = 0
+
+
+def make_batch_request(web3: Web3, rpc_requests: List[Tuple[str, Any]]) -> List[dict]:
+    """Makes several raw JSON-RPC requests in a single round trip.
+
+    The requests are (method, params) tuples, with params formatted as the node expects them
+    (e.g. ``("eth_getBalance", [address, hex(block)])``). Returns the raw response of each request, in order,
+    with either a 'result' or an 'error' key. Responses are read from and stored in the cache, as the
+    disk_cache_middleware does for single requests. Providers that don't support batches get one request
+    per item.
+    """
+    responses = [None] * len(rpc_requests)
+    cache_keys = [None] * len(rpc_requests)
+    if cache.is_enabled() and "disk_cache" in web3.middleware_onion:
+        for i, (method, params) in enumerate(rpc_requests):
+            if cache.is_rpc_cacheable(method, params):
+                cache_keys[i] = cache.rpc_cache_key(web3._network_name, method, params)
+                responses[i] = cache.get_rpc_response(cache_keys[i], method)
+
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if pending:
+        if "call_counter" in web3.middleware_onion:
+            web3.middleware_onion["call_counter"].increment()
+
+        pending_requests = [rpc_requests[i] for i in pending]
+        if hasattr(web3.provider, "make_batch_request"):
+            pending_responses = web3.provider.make_batch_request(pending_requests)
+        else:
+            pending_responses = [web3.provider.make_request(method, params) for method, params in pending_requests]
+
+        for i, response in zip(pending, pending_responses):
+            responses[i] = response
+            if cache_keys[i] is not None:
+                cache.set_rpc_response(cache_keys[i], response, rpc_requests[i][0])
+
+    return responses
+
+
 # store latest and archival ProviderManagers as they are used
 _nodes_providers = dict()
+# store the web3 instances built on top of them
+_nodes_web3 = dict()
 
 
 def get_node(blockchain, block="latest"):
     """
     If block is 'latest'  it retrieves a Full Node, in other case it retrieves an Archival Node.
+    The web3 instances are created once and reused.
     """
-    if blockchain not in NODES_ENDPOINTS:
-        raise ValueError(f"Unknown blockchain '{blockchain}'")
-    node = NODES_ENDPOINTS[blockchain]
+    node = get_chain(blockchain).nodes
 
     if isinstance(block, str):
         if block != "latest":
             raise ValueError("Incorrect block.")
+        node_type = "latest"
+    else:
+        node_type = "archival"
 
-        providers = _nodes_providers.get((blockchain, "latest"), None)
-        if not providers:
+    # the cache middleware is only added when the cache is enabled
+    web3 = _nodes_web3.get((blockchain, node_type, cache.is_enabled()), None)
+    if web3 is not None:
+        return web3
+
+    providers = _nodes_providers.get((blockchain, node_type), None)
+    if not providers:
+        if node_type == "latest":
             providers = ProviderManager(endpoints=node["latest"] + node["archival"])
-            _nodes_providers[(blockchain, "latest")] = providers
-    else:
-        providers = _nodes_providers.get((blockchain, "archival"), None)
-        if not providers:
-            providers = ProviderManager(endpoints=node["archival"])
-            _nodes_providers[(blockchain, "archival")] = providers
+        else:
+            # archival nodes have long tail latencies for old blocks: hedging trades extra requests for lower latency
+            hedge_after = os.environ.get("DEFI_PROTO_HEDGE_AFTER")
+            providers = ProviderManager(
+                endpoints=node["archival"],
+                hedge=bool(os.environ.get("DEFI_PROTO_HEDGE_REQUESTS")),
+                hedge_after=float(hedge_after) if hedge_after else None,
+            )
+        _nodes_providers[(blockchain, node_type)] = providers
 
     web3 = get_web3_provider(providers)
     web3._network_name = blockchain
-    web3._called_with_block = block
+    _nodes_web3[(blockchain, node_type, cache.is_enabled())] = web3
     return web3
 
 
@@ -261,56 +471,75 @@ def timestamp_to_date(timestamp, utc=0):
     return datetime.utcfromtimestamp(timestamp + 3600 * utc).strftime("%Y-%m-%d %H:%M:%S")
 
 
-@cache_call()
-def timestamp_to_block(timestamp, blockchain) -> int:
-    data = None
+# Maximum number of blocks requested in a single JSON-RPC batch, and batches sent at the same time
+BLOCKS_PER_BATCH = 100
+MAX_CONCURRENT_BATCHES = 8
 
-    while data is None:
-        if blockchain == ETHEREUM:
-            data = requests.get(API_ETHERSCAN_GETBLOCKNOBYTIME % (timestamp, API_KEY_ETHERSCAN)).json()["result"]
 
-        elif blockchain == POLYGON:
-            data = requests.get(API_POLYGONSCAN_GETBLOCKNOBYTIME % (timestamp, API_KEY_POLSCAN)).json()["result"]
+def get_blocks_from_node(blockchain, blocks: List) -> List[Tuple[int, int]]:
+    """Returns the (block, timestamp) of the blocks (numbers or 'latest'), fetched from the node in JSON-RPC batches."""
+    web3 = get_node(blockchain)
 
-        elif blockchain == XDAI:
-            data = requests.get(API_GNOSISSCAN_GETBLOCKNOBYTIME % (timestamp, API_KEY_GNOSISSCAN)).json()["result"]
-            # For BLOCKSCOUT
-            # if data is None:
-            #     time.sleep(0.1)
-            # else:
-            #     data = data['blockNumber']
+    def fetch(chunk):
+        return make_batch_request(
+            web3,
+            [("eth_getBlockByNumber", [block if isinstance(block, str) else hex(block), False]) for block in chunk],
+        )
+
+    chunks = [blocks[i : i + BLOCKS_PER_BATCH] for i in range(0, len(blocks), BLOCKS_PER_BATCH)]
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            responses = [response for chunk_responses in executor.map(fetch, chunks) for response in chunk_responses]
+    else:
+        responses = fetch(blocks)
+
+    samples = []
+    for block, response in zip(blocks, responses):
+        if response.get("result") is None:
+            raise ValueError(f"Block {block} not found in {blockchain}: {response.get('error')}")
+        samples.append((int(response["result"]["number"], 16), int(response["result"]["timestamp"], 16)))
+    return samples
+
+
+# store the block timestamp indexes as they are used
+_block_indexes = dict()
+
+
+def get_block_index(blockchain) -> BlockTimestampIndex:
+    block_index = _block_indexes.get(blockchain, None)
+    if block_index is None:
+        path = None if not cache.is_enabled() else os.path.join(INDEX_DIR, f"{blockchain}.bin")
+        block_index = BlockTimestampIndex(lambda blocks: get_blocks_from_node(blockchain, blocks), path=path)
+        _block_indexes[blockchain] = block_index
+    return block_index
 
-        elif blockchain == BINANCE:
-            data = requests.get(API_BINANCE_GETBLOCKNOBYTIME % (timestamp, API_KEY_BINANCE)).json()["result"]
 
-        elif blockchain == AVALANCHE:
-            data = requests.get(API_AVALANCHE_GETBLOCKNOBYTIME % (timestamp, API_KEY_AVALANCHE)).json()["result"]
+def timestamp_to_block(timestamp, blockchain) -> int:
+    """Returns the last block with a timestamp lower than or equal to the timestamp."""
+    return get_block_index(blockchain).get_block(timestamp)
 
-        elif blockchain == FANTOM:
-            data = requests.get(API_FANTOM_GETBLOCKNOBYTIME % (timestamp, API_KEY_FANTOM)).json()["result"]
 
-        elif blockchain == OPTIMISM:
-            data = requests.get(API_OPTIMISM_GETBLOCKNOBYTIME % (timestamp, API_KEY_OPTIMISM)).json()["result"]
+def timestamps_to_blocks(timestamps, blockchain) -> "np.ndarray":
+    """Vectorized timestamp_to_block: returns an array with the block of each timestamp (a list or array).
 
-        elif blockchain == ARBITRUM:
-            data = requests.get(API_ARBITRUM_GETBLOCKNOBYTIME % (timestamp, API_KEY_ARBITRUM)).json()["result"]
+    The searches of all the timestamps are done together, with the blocks of each round fetched in batches.
+    """
+    import numpy as np
 
-        elif blockchain == ROPSTEN:
-            data = requests.get(
-                API_ROPSTEN_GETBLOCKNOBYTIME % (timestamp, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    unique_timestamps, inverse = np.unique(timestamps, return_inverse=True)
+    blocks = get_block_index(blockchain).get_blocks(unique_timestamps.tolist())
+    return np.asarray(blocks, dtype=np.int64)[inverse].reshape(timestamps.shape)
 
-        elif blockchain == KOVAN:
-            data = requests.get(
-                API_KOVAN_GETBLOCKNOBYTIME % (timestamp, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
 
-        elif blockchain == GOERLI:
-            data = requests.get(
-                API_GOERLI_GETBLOCKNOBYTIME % (timestamp, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
+def blocks_to_timestamps(blocks, blockchain) -> "np.ndarray":
+    """Vectorized block_to_timestamp: returns an array with the timestamp of each block number (a list or array)."""
+    import numpy as np
 
-    return int(data)
+    blocks = np.asarray(blocks, dtype=np.int64)
+    unique_blocks, inverse = np.unique(blocks, return_inverse=True)
+    timestamps = get_block_index(blockchain).get_timestamps(unique_blocks.tolist())
+    return np.asarray(timestamps, dtype=np.int64)[inverse].reshape(blocks.shape)
 
 
 def date_to_timestamp(datestring, utc=0):
@@ -337,57 +566,12 @@ def date_to_block(datestring, blockchain, utc=0) -> int:
     return timestamp_to_block(timestamp, blockchain)
 
 
-@cache_call()
 def block_to_timestamp(block, blockchain):
-    data = None
-
     if isinstance(block, str):
         if block == "latest":
             return math.floor(datetime.now().timestamp())
 
-    while data is None:
-        if blockchain == ETHEREUM:
-            data = requests.get(API_ETHERSCAN_GETBLOCKREWARD % (block, API_KEY_ETHERSCAN)).json()["result"]["timeStamp"]
-
-        elif blockchain == POLYGON:
-            data = requests.get(API_POLYGONSCAN_GETBLOCKREWARD % (block, API_KEY_POLSCAN)).json()["result"]["timeStamp"]
-
-        elif blockchain == XDAI:
-            data = requests.get(API_GNOSISSCAN_GETBLOCKREWARD % (block, API_KEY_GNOSISSCAN)).json()["result"][
-                "timeStamp"
-            ]
-
-        elif blockchain == BINANCE:
-            data = requests.get(API_BINANCE_GETBLOCKREWARD % (block, API_KEY_BINANCE)).json()["result"]["timeStamp"]
-
-        elif blockchain == AVALANCHE:
-            data = requests.get(API_AVALANCHE_GETBLOCKREWARD % (block, API_KEY_AVALANCHE)).json()["result"]["timeStamp"]
-
-        elif blockchain == FANTOM:
-            data = requests.get(API_FANTOM_GETBLOCKREWARD % (block, API_KEY_FANTOM)).json()["result"]["timeStamp"]
-
-        elif blockchain == OPTIMISM:
-            data = requests.get(API_OPTIMISM_GETBLOCKREWARD % (block, API_KEY_OPTIMISM)).json()["result"]["timeStamp"]
-
-        elif blockchain == ARBITRUM:
-            data = requests.get(API_ARBITRUM_GETBLOCKREWARD % (block, API_KEY_ARBITRUM)).json()["result"]["timeStamp"]
-
-        elif blockchain == ROPSTEN:
-            data = requests.get(API_ROPSTEN_GETBLOCKREWARD % (block, API_KEY_ETHERSCAN), headers=TESTNET_HEADER).json()[
-                "result"
-            ]["timeStamp"]
-
-        elif blockchain == KOVAN:
-            data = requests.get(API_KOVAN_GETBLOCKREWARD % (block, API_KEY_ETHERSCAN), headers=TESTNET_HEADER).json()[
-                "result"
-            ]["timeStamp"]
-
-        elif blockchain == GOERLI:
-            data = requests.get(API_GOERLI_GETBLOCKREWARD % (block, API_KEY_ETHERSCAN), headers=TESTNET_HEADER).json()[
-                "result"
-            ]["timeStamp"]
-
-    return int(data)
+    return get_block_index(blockchain).get_timestamp(block)
 
 
 def block_to_date(block, blockchain, utc=0):
@@ -408,13 +592,13 @@ def get_blocks_per_year(blockchain):
 # token_info
 @cache_call()
 def token_info(token_address, blockchain):  # NO ESTÁ POLYGON
-    if blockchain.lower() == ETHEREUM:
-        data = requests.get(API_ETHPLORER_GETTOKENINFO % (token_address, API_KEY_ETHPLORER)).json()
-
-    elif blockchain.lower() == XDAI:
-        data = requests.get(API_BLOCKSCOUT_GETTOKENCONTRACT % token_address).json()["result"]
+    chain = CHAINS.get(blockchain.lower())
+    if chain is None or chain.tokeninfo_api is None:
+        return None
 
-    return data
+    if chain.tokeninfo_api_key is not None:
+        return get_explorer_client().get(chain.tokeninfo_api % (token_address, chain.tokeninfo_api_key))
+    return get_explorer_client().get(chain.tokeninfo_api % token_address)["result"]
 
 
 def balance_of(address, contract_address, block, blockchain, web3=None, decimals=True) -> Decimal:
@@ -428,7 +612,7 @@ def balance_of(address, contract_address, block, blockchain, web3=None, decimals
     if contract_address == ZERO_ADDRESS:
         balance = web3.eth.get_balance(address, block)
     else:
-        token_contract = web3.eth.contract(address=contract_address, abi=json.loads(ABI_TOKEN_SIMPLIFIED))
+        token_contract = get_cached_contract(web3, contract_address, ABI_TOKEN_SIMPLIFIED)
         try:
             balance = token_contract.functions.balanceOf(address).call(block_identifier=block)
         except ContractLogicError:
@@ -445,7 +629,7 @@ def total_supply(
 
     token_address = Web3.to_checksum_address(token_address)
 
-    token_contract = web3.eth.contract(address=token_address, abi=json.loads(ABI_TOKEN_SIMPLIFIED))
+    token_contract = get_cached_contract(web3, token_address, ABI_TOKEN_SIMPLIFIED)
     total_supply_v = token_contract.functions.totalSupply().call(block_identifier=block)
 
     return to_token_amount(token_address, total_supply_v, blockchain, web3, decimals)
@@ -460,7 +644,7 @@ def get_decimals(token_address, blockchain, web3=None, block="latest"):
     if token_address == ZERO_ADDRESS or token_address == E_ADDRESS:
         decimals = 18
     else:
-        token_contract = web3.eth.contract(address=token_address, abi=json.loads(ABI_TOKEN_SIMPLIFIED))
+        token_contract = get_cached_contract(web3, token_address, ABI_TOKEN_SIMPLIFIED)
         decimals = const_call(token_contract.functions.decimals())
 
     return decimals
@@ -473,20 +657,9 @@ def get_symbol(token_address, blockchain, web3=None, block="latest") -> str:
     token_address = Web3.to_checksum_address(token_address)
 
     if token_address == ZERO_ADDRESS or token_address == E_ADDRESS:
-        if blockchain is ETHEREUM or blockchain is OPTIMISM or blockchain is ARBITRUM:
-            symbol = "ETH"
-        elif blockchain is POLYGON:
-            symbol = "MATIC"
-        elif blockchain is XDAI:
-            symbol = "XDAI"
-        elif blockchain is FANTOM:
-            symbol = "FTM"
-        elif blockchain is AVALANCHE:
-            symbol = "AVAX"
-        elif blockchain is BINANCE:
-            symbol = "BNB"
+        symbol = get_chain(blockchain).native_token
     else:
-        token_contract = web3.eth.contract(address=token_address, abi=ABI_TOKEN_SIMPLIFIED)
+        token_contract = get_cached_contract(web3, token_address, ABI_TOKEN_SIMPLIFIED)
 
         try:
             symbol = const_call(token_contract.functions.symbol())
@@ -495,8 +668,8 @@ def get_symbol(token_address, blockchain, web3=None, block="latest") -> str:
                 symbol = const_call(token_contract.functions.SYMBOL())
             except:
                 try:
-                    token_contract = web3.eth.contract(
-                        address=token_address, abi=get_contract_abi(token_address, blockchain)
+                    token_contract = get_cached_contract(
+                        web3, token_address, get_contract_abi(token_address, blockchain)
                     )
                     symbol = const_call(token_contract.functions.symbol())
                 except:
@@ -510,77 +683,84 @@ def get_symbol(token_address, blockchain, web3=None, block="latest") -> str:
 
 
 # CONTRACTS AND ABIS
-@cache_call()
+_abi_store = None
+
+
+def get_abi_store() -> ABIStore | None:
+    """Returns the ABI store, or None if the cache is disabled."""
+    global _abi_store
+    if not cache.is_enabled():
+        return None
+    if _abi_store is None:
+        _abi_store = ABIStore(ABI_STORE_PATH)
+    return _abi_store
+
+
 def get_contract_abi(contract_address, blockchain):
-    data = None
+    """Returns the ABI of the contract as JSON. The ABIs are kept in the ABI store, not in the cache."""
+    chain = CHAINS.get(blockchain)
+    if chain is None or chain.getabi_api is None:
+        return None
+
+    abi_store = get_abi_store()
+    if abi_store is not None:
+        abi = abi_store.get_abi(blockchain, contract_address)
+        if abi is not None:
+            return abi
 
-    while data is None:
-        if blockchain == ETHEREUM:
-            data = requests.get(API_ETHERSCAN_GETABI % (contract_address, API_KEY_ETHERSCAN)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == POLYGON:
-            data = requests.get(API_POLYGONSCAN_GETABI % (contract_address, API_KEY_POLSCAN)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == XDAI:
-            data = requests.get(API_GNOSISSCAN_GETABI % (contract_address, API_KEY_GNOSISSCAN)).json()["result"]
-            if data == "Contract source code not verified":
-                data = requests.get(API_BLOCKSCOUT_GETABI % contract_address).json()["result"]
-                if data == "Contract source code not verified":
-                    raise abiNotVerified
-
-        elif blockchain == BINANCE:
-            data = requests.get(API_BINANCE_GETABI % (contract_address, API_KEY_BINANCE)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == AVALANCHE:
-            data = requests.get(API_AVALANCHE_GETABI % (contract_address, API_KEY_AVALANCHE)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == FANTOM:
-            data = requests.get(API_FANTOM_GETABI % (contract_address, API_KEY_FANTOM)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == OPTIMISM:
-            data = requests.get(API_OPTIMISM_GETABI % (contract_address, API_KEY_OPTIMISM)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == ARBITRUM:
-            data = requests.get(API_ARBITRUM_GETABI % (contract_address, API_KEY_ARBITRUM)).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == ROPSTEN:
-            data = requests.get(
-                API_ROPSTEN_GETABI % (contract_address, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == KOVAN:
-            data = requests.get(
-                API_KOVAN_GETABI % (contract_address, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
-
-        elif blockchain == GOERLI:
-            data = requests.get(
-                API_GOERLI_GETABI % (contract_address, API_KEY_ETHERSCAN), headers=TESTNET_HEADER
-            ).json()["result"]
-            if data == "Contract source code not verified":
-                raise abiNotVerified
+    client = get_explorer_client()
 
+    data = client.get(chain.getabi_api % (contract_address, chain.explorer_api_key), headers=chain.explorer_headers)[
+        "result"
+    ]
+    if data == NOT_VERIFIED and chain.getabi_fallback_api is not None:
+        data = client.get(chain.getabi_fallback_api % contract_address)["result"]
+    if data == NOT_VERIFIED:
+        raise abiNotVerified
+
+    if abi_store is not None and isinstance(data, str) and data.startswith("["):
+        abi_store.add(blockchain, contract_address, data)
     return data
 
 
+# Contract objects kept per web3 instance, the least recently used are dropped first
+MAX_CACHED_CONTRACTS = 1024
+_contracts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def parse_abi(abi: str) -> list:
+    """Parses a JSON ABI only once. The returned list is shared and must not be modified."""
+    return json.loads(abi)
+
+
+def get_cached_contract(web3: Web3, contract_address: str, abi: str | list) -> Contract:
+    """Returns the contract object for the address and ABI, creating it only the first time for each web3 instance."""
+    if isinstance(abi, str):
+        abi_key = abi
+        abi = parse_abi(abi)
+    else:
+        abi_key = json.dumps(abi, sort_keys=True)
+
+    # the contracts are stored in the web3 instance, so they are released with it
+    with _contracts_lock:
+        contracts = getattr(web3, "_contracts", None)
+        if contracts is None:
+            contracts = web3._contracts = OrderedDict()
+
+        contract = contracts.get((contract_address, abi_key), None)
+        if contract is not None:
+            contracts.move_to_end((contract_address, abi_key))
+            return contract
+
+    contract = web3.eth.contract(address=contract_address, abi=abi)
+    with _contracts_lock:
+        contracts[(contract_address, abi_key)] = contract
+        if len(contracts) > MAX_CACHED_CONTRACTS:
+            contracts.popitem(last=False)
+    return contract
+
+
 def get_contract(contract_address, blockchain, web3=None, abi=None, block="latest"):
     if web3 is None:
         web3 = get_node(blockchain, block=block)
@@ -590,12 +770,12 @@ def get_contract(contract_address, blockchain, web3=None, abi=None, block="lates
     if abi is None:
         try:
             abi = get_contract_abi(contract_address, blockchain)
-            return web3.eth.contract(address=contract_address, abi=abi)
+            return get_cached_contract(web3, contract_address, abi)
         except abiNotVerified:
             logger.exception("ABI not verified")
             return None
     else:
-        return web3.eth.contract(address=contract_address, abi=abi)
+        return get_cached_contract(web3, contract_address, abi)
 
 
 def get_contract_proxy_abi(contract_address, abi_contract_address, blockchain, web3=None, block="latest"):
@@ -606,79 +786,104 @@ def get_contract_proxy_abi(contract_address, abi_contract_address, blockchain, w
 
     try:
         abi = get_contract_abi(abi_contract_address, blockchain)
-        return web3.eth.contract(address=address, abi=abi)
+        return get_cached_contract(web3, address, abi)
     except abiNotVerified as Ex:
         logger.exception(Ex)
         return None
 
 
-def search_proxy_impl_address(contract_address, blockchain, web3=None, block="latest"):
-    if web3 is None:
-        web3 = get_node(blockchain)
+UPGRADED_TOPIC = Web3.keccak(text="Upgraded(address)").hex()
 
-    proxy_impl_address = ZERO_ADDRESS
 
-    contract_address = Web3.to_checksum_address(contract_address)
-
-    # OpenZeppelins' EIP-1967 - Example in mainnet: 0xE95A203B1a91a908F9B9CE46459d101078c2c3cb
-    proxy_impl_address = Web3.to_hex(
-        web3.eth.get_storage_at(contract_address, IMPLEMENTATION_SLOT_EIP_1967, block_identifier=block)
+def get_proxy_state(web3, contract_address, block="latest") -> Tuple[bytes, bytes, bytes]:
+    """Returns the code, the EIP-1967 slot and the unstructured storage slot of the contract, in a single batch."""
+    block_identifier = block if isinstance(block, str) else hex(block)
+    responses = make_batch_request(
+        web3,
+        [
+            ("eth_getCode", [contract_address, block_identifier]),
+            ("eth_getStorageAt", [contract_address, IMPLEMENTATION_SLOT_EIP_1967, block_identifier]),
+            ("eth_getStorageAt", [contract_address, IMPLEMENTATION_SLOT_UNSTRUCTURED, block_identifier]),
+        ],
     )
-    proxy_impl_address = Web3.to_checksum_address("0x" + proxy_impl_address[-40:])
-
-    # OpenZeppelins' EIP-1167 - Example in GC: 0x793fAF861a78B07c0C8c0ed1450D3919F3473226)
-    if proxy_impl_address == ZERO_ADDRESS:
-        bytecode = web3.eth.get_code(contract_address, block_identifier=block).hex()
-        if bytecode[2:22] == "363d3d373d3d3d363d73" and bytecode[62:] == "5af43d82803e903d91602b57fd5bf3":
-            proxy_impl_address = Web3.to_checksum_address("0x" + bytecode[22:62])
-
-    # Custom proxy implementation (similar to EIP-1167) -
-    # Examples: mainnet: 0x09cabEC1eAd1c0Ba254B09efb3EE13841712bE14 / GC: 0x7B7DA887E0c18e631e175532C06221761Db30A24
-    if proxy_impl_address == ZERO_ADDRESS:
-        bytecode = web3.eth.get_code(contract_address, block_identifier=block).hex()
-        if bytecode[2:32] == "366000600037611000600036600073" and bytecode[72:] == "5af41558576110006000f3":
-            proxy_impl_address = Web3.to_checksum_address("0x" + bytecode[32:72])
-
-    # OpenZeppelins' Unstructured Storage proxy pattern - Example: USDC in mainnet (0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48)
-    if proxy_impl_address == ZERO_ADDRESS:
-        proxy_impl_address = Web3.to_hex(
-            web3.eth.get_storage_at(contract_address, IMPLEMENTATION_SLOT_UNSTRUCTURED, block_identifier=block)
-        )
-        proxy_impl_address = Web3.to_checksum_address("0x" + proxy_impl_address[-40:])
+    for response in responses:
+        if "error" in response:
+            raise ValueError(response["error"])
+    return tuple(HexBytes(response["result"]) for response in responses)
+
+
+def search_proxy_impl_address_by_calls(contract_address, blockchain, web3, block, code) -> str:
+    """Returns the implementation of the proxies that keep it neither in their code nor in the standard slots."""
+    if len(code) == 0:
+        # accounts and contracts not deployed yet
+        return ZERO_ADDRESS
 
     # OpenZeppelins' EIP-897 DelegateProxy - Examples: stETH in mainnet (0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84)
     # It also includes the custom proxy implementation of the Comptroller: 0x3d9819210A31b4961b30EF54bE2aeD79B9c9Cd3B
-    if proxy_impl_address == ZERO_ADDRESS:
-        contract = get_contract(contract_address, blockchain, web3=web3)
-        if contract is not None:
-            for func in [obj for obj in contract.abi if obj["type"] == "function"]:
-                name = str(func["name"].lower())
-                if "implementation" in name:
-                    output_types = [output["type"] for output in func["outputs"]]
-                    if output_types == ["address"]:
-                        try:
-                            proxy_impl_address_func = getattr(contract.functions, func["name"])
-                            proxy_impl_address = proxy_impl_address_func().call(block_identifier=block)
-                            break
-                        except Exception as e:
-                            if type(e) == ContractLogicError or type(e) == BadFunctionCallOutput:
-                                continue
+    contract = get_contract(contract_address, blockchain, web3=web3)
+    if contract is not None:
+        for func in [obj for obj in contract.abi if obj["type"] == "function"]:
+            name = str(func["name"].lower())
+            if "implementation" in name:
+                output_types = [output["type"] for output in func["outputs"]]
+                if output_types == ["address"]:
+                    try:
+                        proxy_impl_address_func = getattr(contract.functions, func["name"])
+                        proxy_impl_address = proxy_impl_address_func().call(block_identifier=block)
+                        if proxy_impl_address != ZERO_ADDRESS:
+                            return proxy_impl_address
+                    except Exception as e:
+                        if type(e) == ContractLogicError or type(e) == BadFunctionCallOutput:
+                            continue
 
     # Custom proxy implementation (used by Safes) - Example: mainnet: 0x4F2083f5fBede34C2714aFfb3105539775f7FE64
-    if proxy_impl_address == ZERO_ADDRESS:
-        contract_custom_abi = get_contract(
-            contract_address,
-            ETHEREUM,
-            abi='[{"inputs":[{"internalType":"uint256","name":"offset","type":"uint256"},{"internalType":"uint256","name":"length","type":"uint256"}],"name":"getStorageAt","outputs":[{"internalType":"bytes","name":"","type":"bytes"}],"stateMutability":"view","type":"function"}]',
+    contract_custom_abi = get_contract(
+        contract_address,
+        blockchain,
+        web3=web3,
+        abi='[{"inputs":[{"internalType":"uint256","name":"offset","type":"uint256"},{"internalType":"uint256","name":"length","type":"uint256"}],"name":"getStorageAt","outputs":[{"internalType":"bytes","name":"","type":"bytes"}],"stateMutability":"view","type":"function"}]',
+    )
+    try:
+        proxy_impl_address = Web3.to_hex(contract_custom_abi.functions.getStorageAt(0, 1).call(block_identifier=block))
+        return Web3.to_checksum_address("0x" + proxy_impl_address[-40:])
+    except Exception as e:
+        if type(e) == ContractLogicError or type(e) == BadFunctionCallOutput:
+            pass
+
+    return ZERO_ADDRESS
+
+
+def get_proxy_resolver(web3, blockchain) -> ProxyResolver:
+    """Returns the proxy resolver of the web3 instance, creating it the first time.
+
+    The resolver is stored in the web3 instance, as the contracts, so its cache is released with it.
+    """
+    proxy_resolver = getattr(web3, "_proxy_resolver", None)
+    if proxy_resolver is None:
+        proxy_resolver = web3._proxy_resolver = ProxyResolver(
+            lambda address, block: get_proxy_state(web3, address, block),
+            lambda address, from_block, to_block: len(
+                get_logs_web3(address, blockchain, from_block, to_block, topics=[UPGRADED_TOPIC], web3=web3)
+            )
+            > 0,
+            lambda address, block, code: search_proxy_impl_address_by_calls(address, blockchain, web3, block, code),
         )
-        try:
-            proxy_impl_address = Web3.to_hex(contract_custom_abi.functions.getStorageAt(0, 1).call())
-            proxy_impl_address = Web3.to_checksum_address("0x" + proxy_impl_address[-40:])
-        except Exception as e:
-            if type(e) == ContractLogicError or type(e) == BadFunctionCallOutput:
-                pass
+    return proxy_resolver
+
+
+def search_proxy_impl_address(contract_address, blockchain, web3=None, block="latest"):
+    """Returns the implementation of the proxy at the block, ZERO_ADDRESS if it isn't a proxy.
 
-    return proxy_impl_address
+    Supported patterns: OpenZeppelins' EIP-1967 (e.g. mainnet: 0xE95A203B1a91a908F9B9CE46459d101078c2c3cb), EIP-1167
+    (e.g. GC: 0x793fAF861a78B07c0C8c0ed1450D3919F3473226) and a similar custom one (e.g. mainnet:
+    0x09cabEC1eAd1c0Ba254B09efb3EE13841712bE14), OpenZeppelins' Unstructured Storage (e.g. USDC in mainnet), EIP-897
+    implementation functions and Safes. The implementations are cached per block range, see proxy_resolver.
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block)
+
+    contract_address = Web3.to_checksum_address(contract_address)
+    return Web3.to_checksum_address(get_proxy_resolver(web3, blockchain).resolve(contract_address, block))
 
 
 def get_abi_function_signatures(contract_address, blockchain, web3=None, abi_address=None, block="latest"):
@@ -766,66 +971,98 @@ def get_data(contract_address, function_name, parameters, blockchain, web3=None,
 
 
 # ACCOUNTS
-@cache_call(filter=latest_not_in_params)
-def get_token_tx(token_address, contract_address, block_start, block_end, blockchain):
-    data = None
+# Records per page of the explorer APIs, and records reachable by paging a query (page * offset <= 10000)
+EXPLORER_PAGE_SIZE = 1000
+EXPLORER_MAX_RESULTS = 10000
 
-    if blockchain == ETHEREUM:
-        data = requests.get(
-            API_ETHERSCAN_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_ETHERSCAN)
-        ).json()["result"]
-
-    elif blockchain == POLYGON:
-        data = requests.get(
-            API_POLYGONSCAN_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_POLSCAN)
-        ).json()["result"]
-
-    elif blockchain == XDAI:
-        data = requests.get(
-            API_GNOSISSCAN_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_GNOSISSCAN)
-        ).json()["result"]
-
-    elif blockchain == BINANCE:
-        data = requests.get(
-            API_BINANCE_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_BINANCE)
-        ).json()["result"]
-
-    elif blockchain == AVALANCHE:
-        data = requests.get(
-            API_AVALANCHE_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_AVALANCHE)
-        ).json()["result"]
-
-    elif blockchain == FANTOM:
-        data = requests.get(
-            API_FANTOM_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_FANTOM)
-        ).json()["result"]
-
-    elif blockchain == OPTIMISM:
-        data = requests.get(
-            API_OPTIMISM_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_OPTIMISM)
-        ).json()["result"]
-
-    elif blockchain == ARBITRUM:
-        data = requests.get(
-            API_ARBITRUM_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_ARBITRUM)
-        ).json()["result"]
-
-    elif blockchain == ROPSTEN:
-        data = requests.get(
-            API_ROPSTEN_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_ETHERSCAN)
-        ).json()["result"]
-
-    elif blockchain == KOVAN:
-        data = requests.get(
-            API_KOVAN_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_ETHERSCAN)
-        ).json()["result"]
-
-    elif blockchain == GOERLI:
-        data = requests.get(
-            API_GOERLI_TOKENTX % (token_address, contract_address, block_start, block_end, API_KEY_ETHERSCAN)
-        ).json()["result"]
 
-    return data
+# Fields that identify an explorer record. Not the whole record: 'confirmations' changes between queries.
+EXPLORER_RECORD_FIELDS = ("hash", "logIndex", "from", "to", "value", "contractAddress", "tokenID", "input")
+
+
+def get_explorer_record_key(record: dict) -> tuple:
+    return tuple(record.get(field) for field in EXPLORER_RECORD_FIELDS)
+
+
+def iter_explorer_pages(build_url, block_start, block_end, headers: dict = None) -> Iterator[list]:
+    """Yields the pages of records of an explorer query sorted by descending block.
+
+    build_url receives the block range of the query and returns its URL. Explorers only page through the first
+    10000 records of a query: the next ones are queried again up to the block of the last record, skipping the
+    records of that block that were already yielded.
+    """
+    last_block = None
+    # records of the last block yielded so far, and the ones to skip when it's queried again
+    last_block_records = Counter()
+    skipped_records = Counter()
+    while True:
+        url = build_url(block_start, block_end)
+        for page in range(1, EXPLORER_MAX_RESULTS // EXPLORER_PAGE_SIZE + 1):
+            result = get_explorer_client().get(f"{url}&page={page}&offset={EXPLORER_PAGE_SIZE}", headers=headers)[
+                "result"
+            ]
+            if not isinstance(result, list):
+                raise ValueError(f"Explorer error: {result}")
+
+            records = []
+            for record in result:
+                key = get_explorer_record_key(record)
+                if int(record["blockNumber"]) != last_block:
+                    last_block = int(record["blockNumber"])
+                    last_block_records = Counter()
+                    skipped_records = Counter()
+                elif skipped_records[key] > 0:
+                    # already yielded before querying again from this block
+                    skipped_records[key] -= 1
+                    continue
+                last_block_records[key] += 1
+                records.append(record)
+            if records:
+                yield records
+
+            if len(result) < EXPLORER_PAGE_SIZE:
+                return
+
+        if last_block == block_end:
+            logger.warning(
+                f"More than {EXPLORER_MAX_RESULTS} explorer records in block {last_block}. Skipping the rest."
+            )
+            return
+        block_end = last_block
+        skipped_records = Counter(last_block_records)
+
+
+def iter_token_tx(token_address, contract_address, block_start, block_end, blockchain) -> Iterator[dict]:
+    """Yields the transfers of the token from or to the contract, the most recent first, a page at a time."""
+    chain = get_chain(blockchain)
+    if chain.tokentx_api is None:
+        raise ValueError(f"Token transfers not available for '{blockchain}'")
+
+    def build_url(start, end):
+        return chain.tokentx_api % (token_address, contract_address, start, end, chain.explorer_api_key)
+
+    for records in iter_explorer_pages(build_url, block_start, block_end, headers=chain.explorer_headers):
+        yield from records
+
+
+def iter_tx_list(contract_address, block_start, block_end, blockchain) -> Iterator[dict]:
+    """Yields the transactions of the address, the most recent first, a page at a time."""
+    chain = get_chain(blockchain)
+    if chain.txlist_api is None:
+        raise ValueError(f"Transactions not available for '{blockchain}'")
+
+    def build_url(start, end):
+        return chain.txlist_api % (contract_address, start, end, chain.explorer_api_key)
+
+    for records in iter_explorer_pages(build_url, block_start, block_end, headers=chain.explorer_headers):
+        yield from records
+
+
+@cache_call(filter=latest_not_in_params)
+def get_token_tx(token_address, contract_address, block_start, block_end, blockchain):
+    if blockchain not in CHAINS or CHAINS[blockchain].tokentx_api is None:
+        return None
+    return list(iter_token_tx(token_address, contract_address, block_start, block_end, blockchain))
 
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -833,64 +1070,9 @@ def get_token_tx(token_address, contract_address, block_start, block_end, blockc
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 @cache_call(filter=latest_not_in_params)
 def get_tx_list(contract_address, block_start, block_end, blockchain):
-    data = None
-
-    if blockchain == ETHEREUM:
-        data = requests.get(
-            API_ETHERSCAN_TXLIST % (contract_address, block_start, block_end, API_KEY_ETHERSCAN)
-        ).json()["result"]
-
-    elif blockchain == POLYGON:
-        data = requests.get(
-            API_POLYGONSCAN_TXLIST % (contract_address, block_start, block_end, API_KEY_POLSCAN)
-        ).json()["result"]
-
-    elif blockchain == XDAI:
-        data = requests.get(
-            API_GNOSISSCAN_TXLIST % (contract_address, block_start, block_end, API_KEY_GNOSISSCAN)
-        ).json()["result"]
-
-    elif blockchain == BINANCE:
-        data = requests.get(API_BINANCE_TXLIST % (contract_address, block_start, block_end, API_KEY_BINANCE)).json()[
-            "result"
-        ]
-
-    elif blockchain == AVALANCHE:
-        data = requests.get(
-            API_AVALANCHE_TXLIST % (contract_address, block_start, block_end, API_KEY_AVALANCHE)
-        ).json()["result"]
-
-    elif blockchain == FANTOM:
-        data = requests.get(API_FANTOM_TXLIST % (contract_address, block_start, block_end, API_KEY_FANTOM)).json()[
-            "result"
-        ]
-
-    elif blockchain == OPTIMISM:
-        data = requests.get(API_OPTIMISM_TXLIST % (contract_address, block_start, block_end, API_KEY_OPTIMISM)).json()[
-            "result"
-        ]
-
-    elif blockchain == ARBITRUM:
-        data = requests.get(API_ARBITRUM_TXLIST % (contract_address, block_start, block_end, API_KEY_ARBITRUM)).json()[
-            "result"
-        ]
-
-    elif blockchain == ROPSTEN:
-        data = requests.get(API_ROPSTEN_TXLIST % (contract_address, block_start, block_end, API_KEY_ETHERSCAN)).json()[
-            "result"
-        ]
-
-    elif blockchain == KOVAN:
-        data = requests.get(API_KOVAN_TXLIST % (contract_address, block_start, block_end, API_KEY_ETHERSCAN)).json()[
-            "result"
-        ]
-
-    elif blockchain == GOERLI:
-        data = requests.get(API_GOERLI_TXLIST % (contract_address, block_start, block_end, API_KEY_ETHERSCAN)).json()[
-            "result"
-        ]
-
-    return data
+    if blockchain not in CHAINS or CHAINS[blockchain].txlist_api is None:
+        return None
+    return list(iter_tx_list(contract_address, block_start, block_end, blockchain))
 
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -898,14 +1080,12 @@ def get_tx_list(contract_address, block_start, block_end, blockchain):
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 @cache_call(filter=latest_not_in_params)
 def get_contract_creation(contract_addresses, blockchain):
-    data = None
-
-    if blockchain == ETHEREUM:
-        data = requests.get(API_ETHERSCAN_GETCONTRACTCREATION % (contract_addresses, API_KEY_ETHERSCAN)).json()[
-            "result"
-        ]
-
-    return data
+    chain = CHAINS.get(blockchain)
+    if chain is None or chain.getcontractcreation_api is None:
+        return None
+    return get_explorer_client().get(chain.getcontractcreation_api % (contract_addresses, chain.explorer_api_key))[
+        "result"
+    ]
 
 
 # LOGS
@@ -941,64 +1121,61 @@ def get_logs_http(block_start, block_end, address, topic0, blockchain, **kwargs)
         if key in KEYS_WHITELIST and value:
             optional_parameters += f"&{key}={value}"
 
-    if blockchain == ETHEREUM:
-        data = requests.get(
-            API_ETHERSCAN_GETLOGS % (block_start, block_end, address, topic0, API_KEY_ETHERSCAN) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == POLYGON:
-        data = requests.get(
-            API_POLYGONSCAN_GETLOGS % (block_start, block_end, address, topic0, API_KEY_POLSCAN) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == XDAI:
-        data = requests.get(
-            API_GNOSISSCAN_GETLOGS % (block_start, block_end, address, topic0, API_KEY_GNOSISSCAN) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == AVALANCHE:
-        data = requests.get(
-            API_AVALANCHE_GETLOGS % (block_start, block_end, address, topic0, API_KEY_AVALANCHE) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == BINANCE:
-        data = requests.get(
-            API_BINANCE_GETLOGS % (block_start, block_end, address, topic0, API_KEY_BINANCE) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == FANTOM:
-        data = requests.get(
-            API_FANTOM_GETLOGS % (block_start, block_end, address, topic0, API_KEY_FANTOM) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == OPTIMISM:
-        data = requests.get(
-            API_OPTIMISM_GETLOGS % (block_start, block_end, address, topic0, API_KEY_OPTIMISM) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == ARBITRUM:
-        data = requests.get(
-            API_ARBITRUM_GETLOGS % (block_start, block_end, address, topic0, API_KEY_ARBITRUM) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == ROPSTEN:
-        data = requests.get(
-            API_ROPSTEN_GETLOGS % (block_start, block_end, address, topic0, API_KEY_ETHERSCAN) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == KOVAN:
-        data = requests.get(
-            API_KOVAN_GETLOGS % (block_start, block_end, address, topic0, API_KEY_ETHERSCAN) + optional_parameters
-        ).json()["result"]
-
-    elif blockchain == GOERLI:
-        data = requests.get(
-            API_GOERLI_GETLOGS % (block_start, block_end, address, topic0, API_KEY_ETHERSCAN) + optional_parameters
-        ).json()["result"]
+    chain = CHAINS.get(blockchain)
+    if chain is not None and chain.getlogs_api is not None:
+        data = get_explorer_client().get(
+            chain.getlogs_api % (block_start, block_end, address, topic0, chain.explorer_api_key) + optional_parameters,
+            headers=chain.explorer_headers,
+        )["result"]
 
     return data
 
 
+def get_logs_block_interval(error: ValueError) -> int:
+    """Returns the block range suggested by the node when a get_logs query returns too many results.
+
+    Re-raises the error if it's not caused by the size of the query.
+    """
+    error_info = error.args[0]
+
+    if error_info["code"] == -32005:  # error code in infura
+        block_interval = int(error_info["data"]["to"], 16) - int(error_info["data"]["from"], 16)
+    elif error_info["code"] == -32602:  # error code in alchemy
+        blocks = [int(block, 16) for block in re.findall(r"0x[0-9a-fA-F]+", error_info["message"])]
+        block_interval = blocks[1] - blocks[0]
+    else:
+        raise ValueError(error_info)
+
+    return block_interval
+
+
+def get_logs_range_hint(error: Exception) -> int | None:
+    """Returns the block range suggested by the node if the error is caused by the size of a get_logs query."""
+    if not isinstance(error, ValueError):
+        return None
+    try:
+        return get_logs_block_interval(error)
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+# store the log stores as they are used
+_log_stores = dict()
+# last block of each blockchain that can't be reorganized anymore, as of the last head requested
+_confirmed_blocks = dict()
+
+
+def get_log_store(blockchain) -> LogStore | None:
+    """Returns the log store of the blockchain, or None if the cache is disabled."""
+    if not cache.is_enabled():
+        return None
+    log_store = _log_stores.get(blockchain, None)
+    if log_store is None:
+        log_store = LogStore(os.path.join(LOG_STORE_DIR, f"{blockchain}.sqlite"), max_size=LOG_STORE_MAX_SIZE)
+        _log_stores[blockchain] = log_store
+    return log_store
+
+
 # get_logs_web3
 def get_logs_web3(
     address: str,
@@ -1009,46 +1186,100 @@ def get_logs_web3(
     block_hash: str = None,
     web3: Web3 = None,
 ) -> dict:
-    # FIXME: Add documentation
+    """Returns the logs of the address from block_start to block_end (both included).
+
+    Logs of a block range are kept in the log store of the blockchain: only the parts of the range that weren't
+    requested before are fetched from the node.
+    """
     if web3 is None:
         web3 = get_node(blockchain, block=block_end)
 
     address = Web3.to_checksum_address(address)
+    log_store = get_log_store(blockchain)
+    if (
+        log_store is None
+        or block_hash is not None
+        or not isinstance(block_start, int)
+        or not (isinstance(block_end, int) or block_end in (None, "latest"))
+    ):
+        return get_logs_from_node(address, blockchain, block_start, block_end, topics, block_hash, web3)
+
+    # the most recent blocks can still be reorganized: they are fetched but not stored. The head is only requested
+    # when the range goes past the last block known to be confirmed
+    confirmed_block = _confirmed_blocks.get(blockchain, -1)
+    if not isinstance(block_end, int) or block_end > confirmed_block:
+        head = web3.eth.block_number
+        confirmed_block = head - UNCONFIRMED_BLOCKS
+        _confirmed_blocks[blockchain] = confirmed_block
+        if not isinstance(block_end, int):
+            block_end = head
+    stored_end = max(block_start - 1, min(block_end, confirmed_block))
+    recent_logs = []
+    if stored_end < block_end:
+        recent_logs = get_logs_from_node(address, blockchain, stored_end + 1, block_end, topics, None, web3)
+
+    for from_block, to_block in log_store.missing_ranges(address, topics, block_start, stored_end):
+        logs = get_logs_from_node(address, blockchain, from_block, to_block, topics, None, web3)
+        log_store.add(address, topics, from_block, to_block, logs)
+    return log_store.get_logs(address, topics, block_start, stored_end) + recent_logs
+
+
+def get_logs_from_node(
+    address: str,
+    blockchain: str,
+    block_start: int | str,
+    block_end: int | str,
+    topics: list,
+    block_hash: str,
+    web3: Web3,
+) -> list:
     try:
-        params = {"address": address, "fromBlock": block_start, "toBlock": None, "topics": topics}
+        params = {"address": address, "fromBlock": block_start, "toBlock": block_end, "topics": topics}
         if block_hash is not None:
             params.update({"blockHash": block_hash})
         logs = web3.eth.get_logs(params)
-
-        if not isinstance(block_end, str) and block_end is not None:
-            for n in range(len(logs)):
-                if logs[n]["blockNumber"] > block_end:
-                    logs = logs[:n]
-                    break
     except ValueError as error:
-        error_info = error.args[0]
-
-        if error_info["code"] == -32005:  # error code in infura
-            block_interval = int(error_info["data"]["to"], 16) - int(error_info["data"]["from"], 16)
-        elif error_info["code"] == -32602:  # error code in alchemy
-            blocks = [int(block, 16) for block in re.findall(r"0x[0-9a-fA-F]+", error_info["message"])]
-            block_interval = blocks[1] - blocks[0]
-        else:
-            raise ValueError(error_info)
+        block_interval = get_logs_block_interval(error)
 
         logger.debug(
-            f"Web3.eth.get_logs: query returned more than 10000 results. Trying with a {block_interval} block range."
+            f"Web3.eth.get_logs: query returned more than 10000 results. Scanning with a {block_interval} block range."
+        )
+        logs = list(
+            iter_logs(address, blockchain, block_start, block_end, topics, block_hash, web3, block_range=block_interval)
         )
-        logs = []
-        params = {"address": address, "topics": topics}
+
+    return logs
+
+
+def iter_logs(
+    address: str,
+    blockchain: str,
+    block_start: int = None,
+    block_end: int | str = None,
+    topics: list = None,
+    block_hash: str = None,
+    web3: Web3 = None,
+    block_range: int = INITIAL_BLOCK_RANGE,
+) -> Iterator:
+    """Yields the logs of the address in block order, fetched from the node in concurrent chunks of adaptive size.
+
+    Only a few chunks are held at a time, and the chunks ahead stop being fetched when the caller stops iterating.
+    """
+    if web3 is None:
+        web3 = get_node(blockchain, block=block_end)
+    if block_end is None or block_end == "latest":
+        block_end = web3.eth.block_number
+
+    address = Web3.to_checksum_address(address)
+
+    def fetch_logs(from_block, to_block):
+        params = {"address": address, "topics": topics, "fromBlock": from_block, "toBlock": to_block}
         if block_hash is not None:
             params.update({"blockHash": block_hash})
+        return web3.eth.get_logs(params)
 
-        for from_block, to_block in get_block_intervals(blockchain, block_start, block_end, block_interval):
-            params.update({"fromBlock": from_block, "toBlock": to_block})
-            logs += web3.eth.get_logs(params)
-
-    return logs
+    scanner = LogScanner(fetch_logs, get_range_hint=get_logs_range_hint, initial_block_range=block_range)
+    yield from scanner.scan(block_start or 0, block_end)
 
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -1067,7 +1298,7 @@ def get_block_samples(start_date, samples, blockchain, end_date="latest", utc=0,
         datetime.utcfromtimestamp(timestamp + 3600 * utc).strftime("%Y-%m-%d %H:%M:%S") for timestamp in timestamps
     ]
 
-    blocks = [timestamp_to_block(timestamps[i], blockchain) for i in range(samples)]
+    blocks = timestamps_to_blocks(timestamps, blockchain).tolist()
 
     if dates is True:
         return [blocks, dates_strings]
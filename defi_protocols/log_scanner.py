@@ -0,0 +1,117 @@
+"""Concurrent scan of the logs of a block range.
+
+The range is split into chunks that are fetched concurrently. The size of the chunks adapts to the density of the
+results: it shrinks so that a chunk returns about target_logs logs and grows again where there are few. A chunk that
+fails is retried with a smaller window (the one suggested by the node when it rejects the range for returning too many
+results, else half of it) and the rest of it is scanned again later. The logs are yielded in block order, as soon as
+all the chunks before them are done.
+
+    scanner = LogScanner(lambda from_block, to_block: web3.eth.get_logs({...}), get_range_hint=...)
+    for log in scanner.scan(16000000, 17000000):
+        ...
+"""
+import heapq
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Chunks fetched at the same time
+MAX_WORKERS = 8
+# Logs per chunk the size of the chunks adapts to, well below the 10000 results most providers accept
+TARGET_LOGS = 2000
+INITIAL_BLOCK_RANGE = 10000
+MAX_BLOCK_RANGE = 1000000
+# Times a chunk is retried with a smaller window (or, when it's a single block, as it is) before giving up
+MAX_CHUNK_RETRIES = 8
+
+
+class LogScanner:
+    """Fetches the logs of a block range in concurrent chunks.
+
+    fetch_logs receives the (from_block, to_block) of a chunk, both included, and returns its logs. get_range_hint
+    receives the error of a failed chunk and returns the block range suggested by the node, or None.
+    """
+
+    def __init__(
+        self,
+        fetch_logs: Callable[[int, int], List],
+        get_range_hint: Callable[[Exception], int | None] = None,
+        max_workers: int = MAX_WORKERS,
+        target_logs: int = TARGET_LOGS,
+        initial_block_range: int = INITIAL_BLOCK_RANGE,
+        max_block_range: int = MAX_BLOCK_RANGE,
+    ):
+        self.fetch_logs = fetch_logs
+        self.get_range_hint = get_range_hint
+        self.max_workers = max_workers
+        self.target_logs = target_logs
+        self.block_range = initial_block_range
+        self.max_block_range = max_block_range
+        self.requests = 0
+
+    def _update_block_range(self, from_block: int, to_block: int, logs_count: int) -> None:
+        blocks = to_block - from_block + 1
+        if logs_count > self.target_logs:
+            self.block_range = max(1, min(self.block_range, blocks * self.target_logs // logs_count))
+        elif logs_count < self.target_logs // 2 and blocks >= self.block_range:
+            self.block_range = min(self.max_block_range, 2 * self.block_range)
+
+    def scan(self, from_block: int, to_block: int) -> Iterator:
+        """Yields the logs from from_block to to_block (both included) in block order."""
+        # ranges not requested yet, by first block. A failed chunk puts back what it didn't get.
+        unrequested = [(from_block, to_block, 0)]
+        # chunks requested and not yielded yet: first block -> (last block, logs or None while in flight)
+        chunks = {}
+        next_block = from_block
+        futures = {}
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while next_block <= to_block:
+                # the chunks done and not yielded are bounded: a slow chunk doesn't make the others pile up
+                while unrequested and len(futures) < self.max_workers and len(chunks) < 4 * self.max_workers:
+                    start, end, retries = heapq.heappop(unrequested)
+                    chunk_end = min(end, start + self.block_range - 1)
+                    if chunk_end < end:
+                        heapq.heappush(unrequested, (chunk_end + 1, end, 0))
+                    chunks[start] = (chunk_end, None)
+                    futures[executor.submit(self.fetch_logs, start, chunk_end)] = (start, chunk_end, retries)
+                    self.requests += 1
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, retries = futures.pop(future)
+                    try:
+                        logs = future.result()
+                    except Exception as error:
+                        del chunks[start]
+                        self._retry(start, end, retries, error, unrequested)
+                        continue
+                    chunks[start] = (end, logs)
+                    self._update_block_range(start, end, len(logs))
+
+                while next_block in chunks and chunks[next_block][1] is not None:
+                    end, logs = chunks.pop(next_block)
+                    next_block = end + 1
+                    yield from logs
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _retry(self, start: int, end: int, retries: int, error: Exception, unrequested: list) -> None:
+        hint = self.get_range_hint(error) if self.get_range_hint is not None else None
+        if hint is not None and end > start:
+            # the node rejected the range for the number of results, it's not an error of the chunk
+            window = max(1, min(hint, end - start))
+        else:
+            retries += 1
+            if retries > MAX_CHUNK_RETRIES:
+                raise error
+            window = max(1, (end - start + 1) // 2)
+        logger.debug("Logs of blocks %d-%d failed (%s). Retrying with a %d block range.", start, end, error, window)
+
+        self.block_range = min(self.block_range, window)
+        if start + window <= end:
+            heapq.heappush(unrequested, (start + window, end, 0))
+        heapq.heappush(unrequested, (start, start + window - 1, retries))
@@ -0,0 +1,223 @@
+"""Local store of the event logs of a blockchain.
+
+The logs of each filter (an address and its topics) are stored in a SQLite file, a column per field, along with the
+block ranges that have been synced for the filter. A query is answered from the store: only the parts of its range
+that haven't been synced yet are fetched from the node, so overlapping or shifted windows are only fetched once.
+
+    store = LogStore("/tmp/defi_protocols/log_store/ethereum.sqlite")
+    for from_block, to_block in store.missing_ranges(address, topics, 16000000, 17000000):
+        store.add(address, topics, from_block, to_block, fetch_logs(from_block, to_block))
+    logs = store.get_logs(address, topics, 16000000, 17000000)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+LOG_STORE_DIR = os.environ.get(
+    "DEFI_PROTO_LOG_STORE_DIR",
+    os.path.join(os.environ.get("DEFI_PROTO_CACHE_DIR", "/tmp/defi_protocols/"), "log_store"),
+)
+LOG_STORE_MAX_SIZE = int(os.environ.get("DEFI_PROTO_LOG_STORE_MAX_SIZE", 4 * 1024**3))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filters (
+    id INTEGER PRIMARY KEY,
+    address TEXT NOT NULL,
+    topics TEXT NOT NULL,
+    UNIQUE (address, topics)
+);
+CREATE TABLE IF NOT EXISTS synced_ranges (
+    filter_id INTEGER NOT NULL,
+    from_block INTEGER NOT NULL,
+    to_block INTEGER NOT NULL,
+    PRIMARY KEY (filter_id, from_block)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS logs (
+    filter_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    topics BLOB NOT NULL,
+    data BLOB NOT NULL,
+    transaction_hash BLOB NOT NULL,
+    transaction_index INTEGER NOT NULL,
+    block_hash BLOB NOT NULL,
+    removed INTEGER NOT NULL,
+    PRIMARY KEY (filter_id, block_number, log_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS filter_usage (
+    filter_id INTEGER PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def normalize_topics(topics: list | None) -> str:
+    """Returns the topics filter as a string, the same for equivalent filters (hex strings or bytes, any case)."""
+
+    def normalize(topic):
+        if topic is None:
+            return None
+        if isinstance(topic, (list, tuple)):
+            return [normalize(item) for item in topic]
+        return HexBytes(topic).hex().lower()
+
+    topics = [normalize(topic) for topic in topics or []]
+    # trailing wildcards don't filter anything
+    while topics and topics[-1] is None:
+        topics.pop()
+    return json.dumps(topics)
+
+
+class LogStore:
+    """Logs and synced block ranges of the filters of a blockchain. Without a path the store is only kept in memory.
+
+    If max_size (in bytes) is exceeded, the logs and synced ranges of the least recently used filters are evicted.
+    """
+
+    def __init__(self, path: str = None, max_size: int = None):
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=60)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def _get_filter_id(self, address: str, topics: list | None) -> int:
+        key = (address.lower(), normalize_topics(topics))
+        self._connection.execute("INSERT OR IGNORE INTO filters (address, topics) VALUES (?, ?)", key)
+        filter_id = self._connection.execute("SELECT id FROM filters WHERE address = ? AND topics = ?", key).fetchone()[
+            0
+        ]
+        self._connection.execute("INSERT OR REPLACE INTO filter_usage VALUES (?, ?)", (filter_id, time.time()))
+        return filter_id
+
+    def size(self) -> int:
+        """Returns the size in bytes of the pages in use."""
+        page_size = self._connection.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self._connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def _evict(self, filter_id: int) -> None:
+        """Evicts the least recently used filters other than filter_id until the store fits in max_size."""
+        while self.max_size is not None and self.size() > self.max_size:
+            row = self._connection.execute(
+                "SELECT filter_id FROM filter_usage WHERE filter_id != ? ORDER BY last_used, filter_id LIMIT 1",
+                (filter_id,),
+            ).fetchone()
+            if row is None:
+                break
+            for table in ("logs", "synced_ranges", "filter_usage"):
+                self._connection.execute(f"DELETE FROM {table} WHERE filter_id = ?", row)
+            self.evictions += 1
+
+    def get_synced_ranges(self, address: str, topics: list | None) -> List[Tuple[int, int]]:
+        with self._lock, self._connection:
+            filter_id = self._get_filter_id(address, topics)
+            return self._connection.execute(
+                "SELECT from_block, to_block FROM synced_ranges WHERE filter_id = ? ORDER BY from_block", (filter_id,)
+            ).fetchall()
+
+    def missing_ranges(
+        self, address: str, topics: list | None, from_block: int, to_block: int
+    ) -> List[Tuple[int, int]]:
+        """Returns the block ranges between from_block and to_block (both included) that haven't been synced."""
+        missing = []
+        for synced_from, synced_to in self.get_synced_ranges(address, topics):
+            if synced_to < from_block:
+                continue
+            if synced_from > to_block:
+                break
+            if synced_from > from_block:
+                missing.append((from_block, synced_from - 1))
+            from_block = synced_to + 1
+        if from_block <= to_block:
+            missing.append((from_block, to_block))
+        return missing
+
+    @staticmethod
+    def _to_rows(filter_id: int, logs: list):
+        for log in logs:
+            yield (
+                filter_id,
+                log["blockNumber"],
+                log["logIndex"],
+                log["address"],
+                b"".join(bytes(topic) for topic in log["topics"]),
+                bytes(HexBytes(log["data"])),
+                bytes(log["transactionHash"]),
+                log["transactionIndex"],
+                bytes(log["blockHash"]),
+                int(log.get("removed", False)),
+            )
+
+    def add(self, address: str, topics: list | None, from_block: int, to_block: int, logs: list) -> None:
+        """Stores the logs of the filter from from_block to to_block (both included) and marks the range as synced."""
+        with self._lock, self._connection:
+            filter_id = self._get_filter_id(address, topics)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._to_rows(filter_id, logs)
+            )
+
+            # the range is merged with the synced ranges it overlaps or touches
+            merged = self._connection.execute(
+                "SELECT MIN(from_block), MAX(to_block) FROM synced_ranges "
+                "WHERE filter_id = ? AND to_block >= ? AND from_block <= ?",
+                (filter_id, from_block - 1, to_block + 1),
+            ).fetchone()
+            if merged[0] is not None:
+                from_block, to_block = min(from_block, merged[0]), max(to_block, merged[1])
+            self._connection.execute(
+                "DELETE FROM synced_ranges WHERE filter_id = ? AND to_block >= ? AND from_block <= ?",
+                (filter_id, from_block - 1, to_block + 1),
+            )
+            self._connection.execute("INSERT INTO synced_ranges VALUES (?, ?, ?)", (filter_id, from_block, to_block))
+            self._evict(filter_id)
+
+    def get_logs(self, address: str, topics: list | None, from_block: int, to_block: int) -> list:
+        """Returns the stored logs of the filter from from_block to to_block (both included), in block order."""
+        with self._lock, self._connection:
+            filter_id = self._get_filter_id(address, topics)
+            rows = self._connection.execute(
+                "SELECT block_number, log_index, address, topics, data, transaction_hash, transaction_index, "
+                "block_hash, removed FROM logs WHERE filter_id = ? AND block_number BETWEEN ? AND ? "
+                "ORDER BY block_number, log_index",
+                (filter_id, from_block, to_block),
+            ).fetchall()
+
+        return [
+            AttributeDict(
+                {
+                    "address": log_address,
+                    "topics": [HexBytes(log_topics[i : i + 32]) for i in range(0, len(log_topics), 32)],
+                    "data": HexBytes(data),
+                    "blockNumber": block_number,
+                    "transactionHash": HexBytes(transaction_hash),
+                    "transactionIndex": transaction_index,
+                    "blockHash": HexBytes(block_hash),
+                    "logIndex": log_index,
+                    "removed": bool(removed),
+                }
+            )
+            for (
+                block_number,
+                log_index,
+                log_address,
+                log_topics,
+                data,
+                transaction_hash,
+                transaction_index,
+                block_hash,
+                removed,
+            ) in rows
+        ]
@@ -0,0 +1,148 @@
+"""Batching of contract reads through Multicall3.
+
+Every ``contract.functions.X().call(block_identifier=block)`` is a separate ``eth_call``. A ``Multicall`` collects
+several contract function calls and executes them in a single ``eth_call`` to Multicall3's ``aggregate3`` at the
+given block. Each call is allowed to fail on its own: a reverted call yields ``None``, as ``call_contract_method``
+does, instead of failing the whole batch. Blocks before Multicall3 was deployed are served with one eth_call per
+contract function, all of them sent in a single JSON-RPC batch.
+
+    multicall = Multicall(block, ETHEREUM, web3=web3)
+    for ctoken in ctokens:
+        multicall.add(ctoken.functions.balanceOf(wallet))
+    balances = multicall.execute()
+"""
+import itertools
+import logging
+from typing import Any, List
+
+from eth_abi.exceptions import DecodingError
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.contract.contract import ContractFunction
+
+from defi_protocols.chains import CHAINS, get_chain
+from defi_protocols.functions import get_node, make_batch_request
+
+logger = logging.getLogger(__name__)
+
+# aggregate3((address target, bool allowFailure, bytes callData)[] calls)
+AGGREGATE3_SELECTOR = bytes.fromhex("82ad56cb")
+AGGREGATE3_INPUT_TYPES = ["(address,bool,bytes)[]"]
+AGGREGATE3_OUTPUT_TYPES = ["(bool,bytes)[]"]
+
+# Maximum number of calls aggregated in a single eth_call. Bigger batches may hit the node's gas cap for eth_call.
+MAX_CALLS_PER_BATCH = 500
+
+# JSON-RPC error codes returned by the nodes when an eth_call reverts
+REVERT_ERROR_CODES = [3, -32000, -32015]
+
+
+def is_multicall_available(block: int | str, blockchain: str) -> bool:
+    """Whether Multicall3 was already deployed in the blockchain at the given block."""
+    chain = CHAINS.get(blockchain)
+    deployment_block = chain.multicall_deployment_block if chain is not None else None
+    if deployment_block is None:
+        return False
+    return isinstance(block, str) or block >= deployment_block
+
+
+class Multicall:
+    def __init__(self, block: int | str, blockchain: str, web3: Web3 = None, batch_size: int = MAX_CALLS_PER_BATCH):
+        self.block = block
+        self.blockchain = blockchain
+        self.web3 = get_node(blockchain, block=block) if web3 is None else web3
+        self.batch_size = batch_size
+        self.calls = []
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def add(self, contract_function: ContractFunction) -> int:
+        """Adds a contract function call (with its arguments already set) and returns its index in the results."""
+        self.calls.append(contract_function)
+        return len(self.calls) - 1
+
+    def execute(self) -> List:
+        """Executes all the added calls and returns their results in the same order they were added.
+
+        The results are decoded as ``.call()`` would decode them. Calls that revert or return undecodable data
+        yield ``None``.
+        """
+        if not self.calls:
+            return []
+        if not is_multicall_available(self.block, self.blockchain):
+            return self._batch_call(self.calls)
+
+        results = []
+        for i in range(0, len(self.calls), self.batch_size):
+            chunk = self.calls[i : i + self.batch_size]
+            try:
+                results += self._aggregate(chunk)
+            except ValueError as e:
+                # The whole batch failed (e.g. out of gas): fall back to one eth_call per contract function
+                logger.warning("Multicall of %d calls failed, calling them one by one: %s", len(chunk), e)
+                results += self._batch_call(chunk)
+        return results
+
+    def _batch_call(self, contract_functions: List[ContractFunction]) -> List:
+        """Sends one eth_call per contract function, all of them in a single JSON-RPC batch."""
+        block = self.block if isinstance(self.block, str) else hex(self.block)
+        responses = make_batch_request(
+            self.web3,
+            [
+                (
+                    "eth_call",
+                    [{"to": contract_function.address, "data": contract_function._encode_transaction_data()}, block],
+                )
+                for contract_function in contract_functions
+            ],
+        )
+
+        results = []
+        for contract_function, response in zip(contract_functions, responses):
+            if "error" in response:
+                if response["error"].get("code") not in REVERT_ERROR_CODES:
+                    raise ValueError(response["error"])
+                results.append(None)
+            else:
+                results.append(self._decode(contract_function, True, Web3.to_bytes(hexstr=response["result"])))
+        return results
+
+    def _aggregate(self, contract_functions: List[ContractFunction]) -> List:
+        calls = [
+            (contract_function.address, True, Web3.to_bytes(hexstr=contract_function._encode_transaction_data()))
+            for contract_function in contract_functions
+        ]
+        data = AGGREGATE3_SELECTOR + self.web3.codec.encode(AGGREGATE3_INPUT_TYPES, [calls])
+        return_data = self.web3.eth.call(
+            {"to": get_chain(self.blockchain).multicall_address, "data": Web3.to_hex(data)}, block_identifier=self.block
+        )
+        (outputs,) = self.web3.codec.decode(AGGREGATE3_OUTPUT_TYPES, return_data)
+
+        return [
+            self._decode(contract_function, success, output)
+            for contract_function, (success, output) in zip(contract_functions, outputs)
+        ]
+
+    def _decode(self, contract_function: ContractFunction, success: bool, output: bytes) -> Any:
+        if not success or not output:
+            return None
+
+        output_types = get_abi_output_types(contract_function.abi)
+        try:
+            decoded = self.web3.codec.decode(output_types, output)
+        except DecodingError:
+            return None
+
+        normalizers = itertools.chain(BASE_RETURN_NORMALIZERS, contract_function._return_data_normalizers)
+        normalized = map_abi_data(normalizers, output_types, decoded)
+        return normalized[0] if len(normalized) == 1 else normalized
+
+
+def multicall(contract_functions: List[ContractFunction], block: int | str, blockchain: str, web3: Web3 = None) -> List:
+    """Executes the contract function calls in as few eth_calls as possible. See ``Multicall.execute``."""
+    batch = Multicall(block, blockchain, web3=web3)
+    for contract_function in contract_functions:
+        batch.add(contract_function)
+    return batch.execute()
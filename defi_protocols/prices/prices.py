@@ -3,9 +3,7 @@ import os
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
 import requests
-from tqdm import tqdm
 from web3 import Web3
 
 from defi_protocols.constants import (
@@ -187,6 +185,9 @@ def get_etherscan_price(token_address):
 # get_today_prices_data
 # ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 def get_today_prices_data(file_name, return_type="df", web3=None):
+    # pandas and tqdm take long to import and are only used here
+    from tqdm import tqdm
+
     file = open(str(Path(os.path.abspath(__file__)).resolve().parents[0]) + "/" + file_name, "r")
     token_file = json.load(file)
 
@@ -236,6 +237,8 @@ def get_today_prices_data(file_name, return_type="df", web3=None):
     }
 
     if return_type == "df":
+        import pandas as pd
+
         df = pd.DataFrame(data_raw)
         return df
     else:
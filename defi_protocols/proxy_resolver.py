@@ -0,0 +1,162 @@
+"""Resolution of the implementations of proxy contracts.
+
+The code of a contract and its two implementation storage slots (EIP-1967 and unstructured storage) are fetched in a
+single batch, and the proxy pattern is classified from them at once. The implementations are cached per address and
+block range:
+
+- Minimal proxies (EIP-1167 and the like) have the implementation in their code, which can't change: it holds for all
+  the blocks after the one it was resolved at.
+- Upgradeable proxies emit an Upgraded event with every new implementation: an implementation resolved at a block also
+  holds at another one if there were no Upgraded events in between. The range of a resolution is extended that way to
+  the blocks asked close to it (up to a get_logs request away), with an eth_getLogs (answered by the log store once
+  synced) instead of reading the contract again. Farther blocks are resolved by reading the contract.
+- Other proxies (implementation() functions of EIP-897, Safes) are resolved by calling the contract, only at the block.
+
+    resolver = ProxyResolver(fetch_state, has_upgrades, resolve_fallback)
+    resolver.resolve(address, 17000000)
+"""
+import math
+import threading
+from bisect import bisect_right
+from typing import Callable, List, NamedTuple, Tuple
+
+from defi_protocols.log_scanner import INITIAL_BLOCK_RANGE
+
+EIP_1967 = "eip1967"
+EIP_1167 = "eip1167"
+# similar to EIP-1167, e.g. mainnet: 0x09cabEC1eAd1c0Ba254B09efb3EE13841712bE14 / GC: 0x7B7DA887E0c18e631e175532C06221761Db30A24
+MINIMAL_CUSTOM = "minimal_custom"
+UNSTRUCTURED = "unstructured"
+
+# proxies whose implementation is in their code
+MINIMAL_PATTERNS = {EIP_1167, MINIMAL_CUSTOM}
+
+# (prefix, implementation address, suffix) of the code of the minimal proxies
+MINIMAL_CODES = {
+    EIP_1167: (bytes.fromhex("363d3d373d3d3d363d73"), bytes.fromhex("5af43d82803e903d91602b57fd5bf3")),
+    MINIMAL_CUSTOM: (bytes.fromhex("366000600037611000600036600073"), bytes.fromhex("5af41558576110006000f3")),
+}
+
+
+def slot_to_address(value: bytes) -> str | None:
+    """Returns the address stored in a storage slot, None if it's empty."""
+    address = "0x" + bytes(value)[-20:].rjust(20, b"\0").hex()
+    return None if int(address, 16) == 0 else address
+
+
+def classify_proxy(code: bytes, eip1967_slot: bytes, unstructured_slot: bytes) -> Tuple[str | None, str | None]:
+    """Returns the proxy pattern of a contract and its implementation, (None, None) if none of them matches.
+
+    The patterns are checked in order: EIP-1967 slot, EIP-1167 and similar minimal proxies, unstructured storage slot.
+    """
+    implementation = slot_to_address(eip1967_slot)
+    if implementation is not None:
+        return EIP_1967, implementation
+
+    code = bytes(code)
+    for pattern, (prefix, suffix) in MINIMAL_CODES.items():
+        if len(code) == len(prefix) + 20 + len(suffix) and code.startswith(prefix) and code.endswith(suffix):
+            return pattern, "0x" + code[len(prefix) : len(prefix) + 20].hex()
+
+    implementation = slot_to_address(unstructured_slot)
+    if implementation is not None:
+        return UNSTRUCTURED, implementation
+
+    return None, None
+
+
+class Resolution(NamedTuple):
+    from_block: int
+    to_block: int | float
+    implementation: str
+    # whether the range can be extended to the blocks without Upgraded events
+    upgradeable: bool
+
+
+class ProxyResolver:
+    """Implementations of the proxies of a blockchain.
+
+    fetch_state receives an address and a block and returns the code, the EIP-1967 slot and the unstructured storage
+    slot of the contract. has_upgrades receives an address and a block range (both included) and returns whether there
+    were Upgraded events in it. resolve_fallback receives an address, a block and the code of the contract and returns the
+    implementation of the proxies that don't match any pattern, the zero address if it isn't a proxy.
+
+    A resolution is only extended to blocks up to max_gap blocks away: scanning a longer range for Upgraded events costs
+    more than reading the contract again.
+    """
+
+    def __init__(
+        self,
+        fetch_state: Callable[[str, int | str], Tuple[bytes, bytes, bytes]],
+        has_upgrades: Callable[[str, int, int], bool],
+        resolve_fallback: Callable[[str, int | str, bytes], str],
+        max_gap: int = INITIAL_BLOCK_RANGE,
+    ):
+        self.fetch_state = fetch_state
+        self.has_upgrades = has_upgrades
+        self.resolve_fallback = resolve_fallback
+        self.max_gap = max_gap
+        # resolutions of each address, sorted by from_block and not overlapping
+        self._resolutions = dict()
+        self._lock = threading.Lock()
+
+    def get_resolutions(self, address: str) -> List[Resolution]:
+        with self._lock:
+            return list(self._resolutions.get(address.lower(), []))
+
+    def _find(self, address: str, block: int) -> Tuple[Resolution | None, Resolution | None]:
+        """Returns the resolutions of the address right before and after the block, or the one that contains it."""
+        resolutions = self._resolutions.get(address.lower(), [])
+        i = bisect_right([resolution.from_block for resolution in resolutions], block)
+        before = resolutions[i - 1] if i > 0 else None
+        after = resolutions[i] if i < len(resolutions) else None
+        return before, after
+
+    def _replace(self, address: str, old: Resolution | None, new: Resolution) -> None:
+        with self._lock:
+            resolutions = self._resolutions.setdefault(address.lower(), [])
+            if old is not None and old in resolutions:
+                resolutions.remove(old)
+            resolutions.append(new)
+            resolutions.sort()
+
+    def resolve(self, address: str, block: int | str) -> str:
+        """Returns the implementation of the proxy at the block, the zero address if it isn't a proxy."""
+        if not isinstance(block, int):
+            # the latest block moves: it isn't cached
+            return self._resolve(address, block)[0]
+
+        with self._lock:
+            before, after = self._find(address, block)
+        if before is not None and block <= before.to_block:
+            return before.implementation
+
+        # the closest upgradeable resolution holds at the block if there were no upgrades in between
+        candidates = []
+        if before is not None and before.upgradeable and block - before.to_block <= self.max_gap:
+            candidates.append((block - before.to_block, before, (before.to_block + 1, block)))
+        if after is not None and after.upgradeable and after.from_block - block <= self.max_gap:
+            candidates.append((after.from_block - block, after, (block + 1, after.from_block)))
+        if candidates:
+            _, resolution, (from_block, to_block) = min(candidates, key=lambda candidate: candidate[0])
+            if not self.has_upgrades(address, from_block, to_block):
+                extended = resolution._replace(
+                    from_block=min(resolution.from_block, block), to_block=max(resolution.to_block, block)
+                )
+                self._replace(address, resolution, extended)
+                return resolution.implementation
+
+        implementation, pattern = self._resolve(address, block)
+        if pattern in MINIMAL_PATTERNS:
+            to_block = after.from_block - 1 if after is not None else math.inf
+            self._replace(address, None, Resolution(block, to_block, implementation, False))
+        else:
+            self._replace(address, None, Resolution(block, block, implementation, pattern is not None))
+        return implementation
+
+    def _resolve(self, address: str, block: int | str) -> Tuple[str, str | None]:
+        code, eip1967_slot, unstructured_slot = self.fetch_state(address, block)
+        pattern, implementation = classify_proxy(code, eip1967_slot, unstructured_slot)
+        if pattern is None:
+            implementation = self.resolve_fallback(address, block, code)
+        return implementation, pattern
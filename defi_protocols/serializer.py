@@ -0,0 +1,90 @@
+"""Compact serialization of the values stored in the cache.
+
+Most values are pickled as they are. Lists of logs (``AttributeDict`` items with the same keys, such as the result of
+``eth_getLogs``) are the biggest values in the cache. Pickle stores the keys of every log and the class of every
+``HexBytes``, and equal values in different logs (addresses, topics, block hashes) are stored once per log. They are
+stored as a table instead: the keys once, a row of plain values per log, and equal values only once.
+
+    data = dumps(value)
+    assert loads(data) == value
+"""
+import pickle
+
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+# First byte of the serialized tables. Pickled values start with the PROTO opcode (0x80).
+TABLE = b"\x01"
+
+PLAIN_TYPES = (str, int, bool, type(None))
+
+
+def to_table(items: list):
+    """Returns the (keys, rows) table of a list of AttributeDicts, or None if it can't be restored exactly."""
+    if type(items[0]) is not AttributeDict:
+        return None
+    keys = tuple(items[0].keys())
+
+    # equal values are replaced by the same object, which pickle stores only once
+    interned = {}
+    rows = []
+    for item in items:
+        if type(item) is not AttributeDict or tuple(item.keys()) != keys:
+            return None
+        row = []
+        for value in item.values():
+            value_type = type(value)
+            if value_type is HexBytes:
+                value = bytes(value)
+            elif value_type is list:
+                if any(type(element) is not HexBytes for element in value):
+                    return None
+                value = tuple(interned.setdefault(bytes(element), bytes(element)) for element in value)
+            elif value_type is str:
+                value = interned.setdefault(value, value)
+            elif value_type not in PLAIN_TYPES:
+                return None
+            if type(value) is bytes:
+                value = interned.setdefault(value, value)
+            row.append(value)
+        rows.append(tuple(row))
+    return keys, rows
+
+
+def from_table(keys: tuple, rows: list) -> list:
+    # equal values were stored once: so are their HexBytes. The values are already bytes, so HexBytes' conversion
+    # of the argument is skipped.
+    hexbytes = {value: bytes.__new__(HexBytes, value) for row in rows for value in row if type(value) is bytes}
+    for row in rows:
+        for value in row:
+            if type(value) is tuple:
+                for element in value:
+                    if element not in hexbytes:
+                        hexbytes[element] = bytes.__new__(HexBytes, element)
+
+    items = []
+    for row in rows:
+        item = {}
+        for key, value in zip(keys, row):
+            value_type = type(value)
+            if value_type is bytes:
+                value = hexbytes[value]
+            elif value_type is tuple:
+                value = [hexbytes[element] for element in value]
+            item[key] = value
+        items.append(AttributeDict(item))
+    return items
+
+
+def dumps(value) -> bytes:
+    if type(value) is list and value:
+        table = to_table(value)
+        if table is not None:
+            return TABLE + pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL)
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data: bytes):
+    if data[:1] == TABLE:
+        return from_table(*pickle.loads(data[1:]))
+    return pickle.loads(data)
@@ -1,8 +1,7 @@
 from dataclasses import dataclass, field
 from typing import Optional
 
-import requests
-
+from defi_protocols.util.explorer_client import get_explorer_client
 from defi_protocols.util.explorers import Explorer
 from defi_protocols.util.impl_contract import ImplContractData
 
@@ -33,8 +32,8 @@ class RequestFromScan:
         return params
 
     def request(self):
-        request = requests.get(
+        request = get_explorer_client().get(
             "https://api.{}/api?".format(self.blockchain),
             params={k: v for k, v in self.__dict__.items() if k != "kwargs"},
-        ).json()
+        )
         return request
@@ -0,0 +1,136 @@
+"""Shared client of the block explorer APIs (Etherscan and the like).
+
+All the requests go through a pooled keep-alive session and are rate limited per API key (or per host, for keyless
+APIs) with a token bucket, so that concurrent callers stay within the plan's limit. Requests that fail or are
+throttled by the explorer are retried a few times, waiting an exponential backoff with jitter.
+
+    client = get_explorer_client()
+    data = client.get(API_ETHERSCAN_GETABI % (address, API_KEY_ETHERSCAN))
+    pages = client.get_many([url_1, url_2, url_3])
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Requests per second allowed per API key. 5 is the limit of the free plans.
+RATE_LIMIT = float(os.environ.get("DEFI_PROTO_EXPLORER_RATE_LIMIT", 5))
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 10
+TIMEOUT = 30
+# Connections kept alive per host, and requests of get_many in flight
+POOL_SIZE = 16
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ExplorerError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity requests."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes a token, waiting until there is one."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_rate_limited(data) -> bool:
+    """Whether the explorer answered that the rate limit was exceeded ('Max rate limit reached', 'Max calls...')."""
+    if not isinstance(data, dict) or data.get("status") != "0" or not isinstance(data.get("result"), str):
+        return False
+    result = data["result"].lower()
+    return "rate limit" in result or "max calls" in result
+
+
+class ExplorerClient:
+    def __init__(self, rate_limit: float = RATE_LIMIT, max_retries: int = MAX_RETRIES, pool_size: int = POOL_SIZE):
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, url: str, params: dict = None) -> TokenBucket:
+        """Returns the token bucket of the API key of the request, or of its host if it has no key."""
+        parsed_url = urlparse(url)
+        key = (params or {}).get("apikey") or parse_qs(parsed_url.query).get("apikey", [None])[0] or parsed_url.netloc
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate_limit)
+            return self._buckets[key]
+
+    def get(self, url: str, params: dict = None, headers: dict = None):
+        """Returns the decoded JSON response of the request."""
+        bucket = self.get_bucket(url, params)
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                # full jitter: concurrent callers that were throttled together don't retry together
+                time.sleep(random.uniform(0, min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2**attempt)))
+            bucket.acquire()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.warning("Explorer request failed: %s", e)
+                error = e
+                continue
+            if response.status_code in RETRY_STATUS_CODES:
+                error = ExplorerError(f"HTTP {response.status_code} from {urlparse(url).netloc}")
+                logger.warning("Explorer request failed: %s", error)
+                continue
+            data = response.json()
+            if is_rate_limited(data):
+                error = ExplorerError(f"Rate limited by {urlparse(url).netloc}: {data['result']}")
+                logger.debug("%s", error)
+                continue
+            return data
+        raise ExplorerError(f"Explorer request failed after {self.max_retries + 1} attempts") from error
+
+    def get_many(self, urls: List[str], headers: dict = None) -> list:
+        """Returns the decoded JSON responses of the requests, in order. The requests are made concurrently."""
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            return list(executor.map(lambda url: self.get(url, headers=headers), urls))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_explorer_client() -> ExplorerClient:
+    """Returns the explorer client shared by the whole process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ExplorerClient()
+        return _client
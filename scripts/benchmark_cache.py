@@ -0,0 +1,91 @@
+"""Per-hit overhead of the cache.
+
+Compares the cache keys (getcallargs + web3's generate_cache_key vs bind_call_args + generate_cache_key) and the
+storage of the values (diskcache's pickle vs CompactDisk) on cache hits.
+
+    python scripts/benchmark_cache.py
+"""
+import os
+import timeit
+from inspect import getcallargs
+
+import diskcache
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from web3.middleware.cache import generate_cache_key as web3_generate_cache_key
+
+from defi_protocols import serializer
+from defi_protocols.cache import CompactDisk, TemporaryCache, bind_call_args, cache_call, generate_cache_key
+
+TOPIC = HexBytes(os.urandom(32))
+
+
+def build_logs(count):
+    return [
+        AttributeDict(
+            {
+                "address": "0x6B175474E89094C44Da98b954EedeAC495271d0F",
+                "blockHash": HexBytes(os.urandom(32)) if i % 5 == 0 else HexBytes(b"\x11" * 32),
+                "blockNumber": 17000000 + i // 5,
+                "data": HexBytes(os.urandom(32)),
+                "logIndex": i % 300,
+                "removed": False,
+                "topics": [TOPIC, HexBytes(b"\x00" * 12 + os.urandom(20)), HexBytes(b"\x00" * 12 + os.urandom(20))],
+                "transactionHash": HexBytes(os.urandom(32)),
+                "transactionIndex": i % 100,
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def get_contract_abi(contract_address, blockchain):
+    pass
+
+
+def measure(name, f, number):
+    seconds = min(timeit.repeat(f, number=number, repeat=5)) / number
+    print(f"{name:<55} {seconds * 1e6:>10.2f} us")
+
+
+def main():
+    args = ("0x6B175474E89094C44Da98b954EedeAC495271d0F", "ethereum")
+    bind = bind_call_args(get_contract_abi)
+
+    print("Cache key of a cache_call hit")
+    measure(
+        "  before: getcallargs + web3 generate_cache_key",
+        lambda: web3_generate_cache_key(("get_contract_abi", getcallargs(get_contract_abi, *args))),
+        20000,
+    )
+    measure(
+        "  after: bind_call_args + generate_cache_key",
+        lambda: generate_cache_key(("get_contract_abi", bind(args, {}))),
+        20000,
+    )
+
+    params = [{"to": args[0], "data": "0x70a08231" + "00" * 32}, "0x1036640"]
+    print("Cache key of an eth_call")
+    measure("  before: web3 generate_cache_key", lambda: web3_generate_cache_key(params), 20000)
+    measure("  after: generate_cache_key", lambda: generate_cache_key(params), 20000)
+
+    logs = build_logs(1000)
+    print("1000 logs")
+    print(f"  before: pickle {len(serializer.pickle.dumps(logs, protocol=5)):>10} bytes")
+    print(f"  after: serializer {len(serializer.dumps(logs)):>10} bytes")
+    for name, disk in [("before: diskcache", diskcache.Disk), ("after: CompactDisk", CompactDisk)]:
+        with diskcache.Cache(disk=disk) as store:
+            store["logs"] = logs
+            store["decimals"] = 18
+            measure(f"  {name} hit (1000 logs)", lambda: store["logs"], 20)
+            measure(f"  {name} hit (int)", lambda: store["decimals"], 20000)
+
+    print("cache_call hit")
+    with TemporaryCache():
+        cached_get_contract_abi = cache_call()(get_contract_abi)
+        cached_get_contract_abi(*args)
+        measure("  after: served from the in-memory tier", lambda: cached_get_contract_abi(*args), 20000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Import time of the package and its most used modules.
+
+Each module is imported in a new interpreter, so nothing is already loaded; the best of several runs is printed. The
+configuration, the cache and the heavy dependencies only used by a few functions (pandas, tqdm, gql, numpy) are loaded
+when first used, not at import time: what's left is mostly web3.
+
+    python scripts/benchmark_import.py
+    python scripts/benchmark_import.py defi_protocols.Aave defi_protocols.Balancer --runs 10
+"""
+import argparse
+import subprocess
+import sys
+
+MODULES = [
+    "web3",
+    "defi_protocols",
+    "defi_protocols.constants",
+    "defi_protocols.cache",
+    "defi_protocols.functions",
+    "defi_protocols.prices.prices",
+    "defi_protocols.Connext",
+    "defi_protocols.Aave",
+    "defi_protocols.Balancer",
+]
+
+SNIPPET = "import time; start = time.perf_counter(); import %s; print(time.perf_counter() - start)"
+
+
+def measure(module, runs):
+    seconds = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SNIPPET % module], capture_output=True, text=True, check=True
+        ).stdout
+        seconds.append(float(output))
+    return min(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        print(f"{module:<40} {measure(module, args.runs) * 1e3:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import json
+from unittest import mock
+
+from defi_protocols.abi_store import ABIStore, find_addresses, find_db_addresses, find_module_addresses, prefetch
+from defi_protocols.constants import ETHEREUM, XDAI
+from defi_protocols.util.explorer_client import ExplorerClient
+
+TOKEN_ABI = json.dumps(
+    [
+        {
+            "type": "function",
+            "name": "transfer",
+            "inputs": [{"name": "to", "type": "address"}, {"name": "amount", "type": "uint256"}],
+            "outputs": [{"name": "", "type": "bool"}],
+            "stateMutability": "nonpayable",
+        },
+        {
+            "type": "event",
+            "name": "Transfer",
+            "inputs": [
+                {"name": "from", "type": "address", "indexed": True},
+                {"name": "to", "type": "address", "indexed": True},
+                {"name": "value", "type": "uint256", "indexed": False},
+            ],
+            "anonymous": False,
+        },
+    ]
+)
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+VAULT = "0xBA12222222228d8Ba445958a75a0704d566BF2C8"
+
+
+def test_abi_store(tmp_path):
+    path = str(tmp_path / "abis.sqlite")
+    store = ABIStore(path)
+    # the same ABI is stored once, whether it comes as JSON or parsed
+    assert store.add(ETHEREUM, DAI, TOKEN_ABI) == store.add(ETHEREUM, USDC, json.loads(TOKEN_ABI))
+    store.add(ETHEREUM, VAULT, None)
+    assert store._connection.execute("SELECT COUNT(*) FROM abis").fetchone()[0] == 1
+
+    assert json.loads(store.get_abi(ETHEREUM, DAI.lower())) == json.loads(TOKEN_ABI)
+    assert store.get_abi(XDAI, DAI) is None
+    assert store.contains(ETHEREUM, VAULT) and store.get_abi(ETHEREUM, VAULT) is None
+
+    assert store.get_function_signatures("0xa9059cbb") == ["transfer(address,uint256)"]
+    assert store.get_event_signatures(TRANSFER_TOPIC) == ["Transfer(address,address,uint256)"]
+    assert ABIStore(path).get_function_signatures(bytes.fromhex("a9059cbb")) == ["transfer(address,uint256)"]
+
+
+def test_find_addresses(tmp_path):
+    source = f'VAULT_XDAI = "{VAULT}"\nDAI_ETH = "{DAI}"\n\n\ndef f():\n    return "{USDC}"\n'
+    assert list(find_module_addresses(source)) == [
+        (XDAI, VAULT),
+        (ETHEREUM, DAI),
+        (None, VAULT),
+        (None, DAI),
+        (None, USDC),
+    ]
+    db = {"pools": {VAULT: {"token": DAI}}, ETHEREUM: [{"pool": USDC}]}
+    assert list(find_db_addresses(db)) == [(None, VAULT), (None, DAI), (ETHEREUM, USDC)]
+
+    # the addresses without a blockchain are skipped
+    (tmp_path / "module.py").write_text(source)
+    (tmp_path / "db").mkdir()
+    (tmp_path / "db" / "db.json").write_text(json.dumps(db))
+    with mock.patch("defi_protocols.abi_store.PACKAGE_DIR", str(tmp_path)):
+        assert find_addresses([ETHEREUM, XDAI]) == {ETHEREUM: {DAI.lower(), USDC.lower()}, XDAI: {VAULT.lower()}}
+
+
+def test_prefetch(requests_mock):
+    def explorer(request, context):
+        if request.qs["address"][0] == DAI.lower():
+            return {"status": "1", "message": "OK", "result": TOKEN_ABI}
+        if request.qs["address"][0] == USDC.lower():
+            context.status_code = 503
+            return {}
+        return {"status": "0", "message": "NOTOK", "result": "Contract source code not verified"}
+
+    requests_mock.get("https://api.etherscan.io/api", json=explorer)
+    store = ABIStore()
+    client = ExplorerClient(rate_limit=1000, max_retries=0)
+    addresses = [DAI.lower(), USDC.lower(), VAULT.lower()]
+    with mock.patch("defi_protocols.abi_store.get_explorer_client", return_value=client):
+        # an address that fails doesn't prevent storing the others
+        assert prefetch(store, ETHEREUM, addresses) == 2
+        assert json.loads(store.get_abi(ETHEREUM, DAI)) == json.loads(TOKEN_ABI)
+        assert store.contains(ETHEREUM, VAULT)
+        assert not store.contains(ETHEREUM, USDC)
+        assert requests_mock.call_count == 3
+
+        # only the contracts that failed, and with refresh those not verified, are queried again
+        assert prefetch(store, ETHEREUM, addresses) == 0
+        assert prefetch(store, ETHEREUM, addresses, refresh=True) == 1
+    assert requests_mock.call_count == 6
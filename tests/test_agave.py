@@ -109,6 +109,21 @@ def test_get_data():
     assert data == GNOSIS_SAFE_DATA
 
 
+def test_get_data_many():
+    wallets = [GNOSIS_SAFE_IN_GNO, TEST_WALLET_ADDRESS, GNOSIS_SAFE_IN_GNO]
+    data = Agave.get_data_many(wallets, TEST_BLOCK, XDAI, web3=WEB3)
+    assert list(data) == [GNOSIS_SAFE_IN_GNO, TEST_WALLET_ADDRESS]
+    assert data[GNOSIS_SAFE_IN_GNO] == GNOSIS_SAFE_DATA
+    # the test wallet has no positions: its collateral ratio is NaN
+    assert data[TEST_WALLET_ADDRESS].pop("collateral_ratio").is_nan()
+    assert data[TEST_WALLET_ADDRESS] == {
+        "liquidation_ratio": Decimal("Infinity"),
+        "xdai_price_usd": Decimal("0.99974566"),
+        "collaterals": [],
+        "debts": [],
+    }
+
+
 def test_get_all_rewards():
     all_rewards = Agave.get_all_rewards(TEST_WALLET_ADDRESS, TEST_BLOCK, XDAI, web3=WEB3, decimals=True)
     assert all_rewards == [["0x3a97704a1b25F08aa230ae53B352e2e72ef52843", Decimal("14.334056377962964551")]]
@@ -125,6 +140,24 @@ def test_underlying_all(reward, decimals=False):
     assert ua == expected
 
 
+@pytest.mark.parametrize("reward", [True, False])
+def test_underlying_all_many(reward):
+    # a repeated wallet is only counted once
+    wallets = [GNOSIS_SAFE_IN_GNO, TEST_WALLET_ADDRESS, UNUSED_ADDRESS, GNOSIS_SAFE_IN_GNO]
+    ua = Agave.underlying_all_many(wallets, TEST_BLOCK, XDAI, web3=WEB3, reward=reward, decimals=False)
+    rewards = {
+        GNOSIS_SAFE_IN_GNO: GNOSIS_SAFE_UNDERLYING_ALL_WITH_REWARDS[-1:],
+        TEST_WALLET_ADDRESS: [["0x3a97704a1b25F08aa230ae53B352e2e72ef52843", Decimal("14334056377962964551")]],
+        UNUSED_ADDRESS: [["0x3a97704a1b25F08aa230ae53B352e2e72ef52843", Decimal("0")]],
+    }
+    assert ua == {
+        GNOSIS_SAFE_IN_GNO: GNOSIS_SAFE_UNDERLYING_ALL_WITH_REWARDS[:-1]
+        + (rewards[GNOSIS_SAFE_IN_GNO] if reward else []),
+        TEST_WALLET_ADDRESS: rewards[TEST_WALLET_ADDRESS] if reward else [],
+        UNUSED_ADDRESS: rewards[UNUSED_ADDRESS] if reward else [],
+    }
+
+
 @pytest.mark.parametrize("apy", [True, False])
 def test_get_apr(apy):
     TOKEN_ADDRESS = "0x3a97704a1b25F08aa230ae53B352e2e72ef52843"
@@ -0,0 +1,89 @@
+import asyncio
+from decimal import Decimal
+
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.providers.async_base import AsyncBaseProvider
+
+from defi_protocols.async_functions import AsyncProviderManager, balance_of
+from defi_protocols.cache import TemporaryCache
+from defi_protocols.constants import ETHEREUM
+
+TOKEN = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+WALLET = "0x849D52316331967b6fF1198e5E32A0eB168D039d"
+
+BALANCE_OF_SELECTOR = "0x70a08231"
+DECIMALS_SELECTOR = "0x313ce567"
+
+
+class FakeAsyncProvider(AsyncBaseProvider):
+    def __init__(self, delay=0, error=None):
+        self.delay = delay
+        self.error = error
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    async def make_request(self, method, params):
+        self.requests.append((method, params))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return {"jsonrpc": "2.0", "id": 1, "result": self.result(method, params)}
+        finally:
+            self.in_flight -= 1
+
+    def result(self, method, params):
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "eth_call":
+            w3 = Web3()
+            if params[0]["data"].startswith(BALANCE_OF_SELECTOR):
+                return Web3.to_hex(w3.codec.encode(["uint256"], [5 * 10**18]))
+            if params[0]["data"].startswith(DECIMALS_SELECTOR):
+                return Web3.to_hex(w3.codec.encode(["uint8"], [18]))
+        return "0x1"
+
+
+def build_manager(*fake_providers, max_concurrency_per_provider=2):
+    endpoints = [f"http://node{i}" for i in range(len(fake_providers))]
+    manager = AsyncProviderManager(endpoints, max_concurrency_per_provider=max_concurrency_per_provider)
+    manager.providers = [
+        (fake_provider, errors) for fake_provider, (_, errors) in zip(fake_providers, manager.providers)
+    ]
+    return manager
+
+
+def test_async_provider_manager_failover():
+    down = FakeAsyncProvider(error=aiohttp.ClientConnectionError("down"))
+    up = FakeAsyncProvider()
+    manager = build_manager(down, up)
+
+    response = asyncio.run(manager.make_request("eth_blockNumber", []))
+    assert response["result"] == "0x1"
+    assert len(manager.providers[0][1].errors) == 1
+    assert len(up.requests) == 1
+
+
+def test_async_provider_manager_bounded_concurrency():
+    provider = FakeAsyncProvider(delay=0.01)
+    manager = build_manager(provider, max_concurrency_per_provider=2)
+
+    async def make_requests():
+        return await asyncio.gather(*[manager.make_request("eth_blockNumber", []) for _ in range(10)])
+
+    assert len(asyncio.run(make_requests())) == 10
+    assert provider.max_in_flight == 2
+    # the manager can be reused from another event loop
+    assert len(asyncio.run(make_requests())) == 10
+
+
+def test_async_balance_of():
+    with TemporaryCache():
+        web3 = AsyncWeb3(FakeAsyncProvider())
+        web3._network_name = ETHEREUM
+        balance = asyncio.run(balance_of(WALLET, TOKEN, 17000000, ETHEREUM, web3=web3))
+        assert balance == Decimal(5)
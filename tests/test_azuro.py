@@ -30,3 +30,10 @@ def test_underlying_all():
         [[WXDAI, Decimal("71451.436321150949751018")], [WXDAI, Decimal("1611.490569207598008139")]],
         [[WXDAI, Decimal("2327299.184243886654322408")], [WXDAI, Decimal("27299.184243886654322408")]],
     ]
+
+
+def test_underlying_all_many():
+    wallets = [WALLET_N1, WXDAI]
+    assert Azuro.underlying_all_many(wallets, BLOCK, XDAI, NODE, rewards=True) == {
+        wallet: Azuro.underlying_all(wallet, BLOCK, XDAI, NODE, rewards=True) for wallet in wallets
+    }
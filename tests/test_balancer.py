@@ -1,5 +1,7 @@
 from decimal import Decimal
 
+from web3 import Web3
+
 from defi_protocols import Balancer
 from defi_protocols.constants import BAL_POL, ETHEREUM, POLYGON, XDAI, ETHTokenAddr, GnosisTokenAddr
 from defi_protocols.functions import date_to_block, get_contract, get_node
@@ -80,6 +82,45 @@ def test_get_lptoken_data():
     ]
 
 
+def test_get_pool_structure():
+    block = 16950590
+
+    structure = Balancer.get_pool_structure(B60WETH40DAI_ADDR, block, ETHEREUM)
+    assert structure["supplyFunction"] == "totalSupply"
+    assert structure["bptIndex"] is None
+    assert [token["type"] for token in structure["tokens"]] == ["token", "token"]
+
+    structure = Balancer.get_pool_structure(bbaUSD_ADDR, block, ETHEREUM)
+    assert structure["decimals"] == 18
+    assert structure["bptIndex"] == 2
+    assert [token["type"] for token in structure["tokens"]] == ["pool", "pool", "bpt", "pool"]
+
+
+def test_get_pool_graph():
+    block = 16950590
+
+    graph = Balancer.get_pool_graph(bbaUSD_ADDR, block, ETHEREUM)
+    assert set(graph) == {
+        bbaUSD_ADDR,
+        Web3.to_checksum_address(bbaUSDT_ADDR),
+        Web3.to_checksum_address(bbaUSDC_ADDR),
+        Web3.to_checksum_address(bbaDAI_ADDR),
+    }
+
+
+def test_get_pool_token_balances():
+    block = 17117344
+    node = get_node(ETHEREUM, block)
+
+    # the balances of the nested linear pools, unwrapped to their main token
+    token_balances = Balancer.get_pool_token_balances(bbaUSD_ADDR, block, ETHEREUM, web3=node)
+    assert token_balances == [
+        [[ETHTokenAddr.USDT, Decimal("11433582.31554748359005298347")]],
+        [[ETHTokenAddr.USDC, Decimal("13368829.78950840748853951224")]],
+        [[ETHTokenAddr.DAI, Decimal("13416454.19566038579649334747")]],
+    ]
+
+
 def test_bal_rewards():
     block = 16978206
     node = get_node(ETHEREUM, block)
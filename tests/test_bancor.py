@@ -33,3 +33,12 @@ def test_underlying_all():
         [[E_ADDRESS, Decimal("0.149703304228299349")], [ETHTokenAddr.BNT, Decimal("0")]],
         *(list() for _ in range(147)),  # plus 147 empty lists
     ]
+
+
+def test_underlying_all_many():
+    block = 17067718
+    node = get_node(ETHEREUM, block)
+
+    wallets = [WALLET_N1, WALLET_N2]
+    underlying = Bancor.underlying_all_many(wallets, block, ETHEREUM, web3=node)
+    assert underlying == {wallet: Bancor.underlying_all(wallet, block, ETHEREUM, web3=node) for wallet in wallets}
@@ -0,0 +1,128 @@
+import math
+import random
+from bisect import bisect_right
+
+from pytest import raises
+
+from defi_protocols.block_index import BlockTimestampIndex
+
+GENESIS_TIMESTAMP = 1438269973
+
+
+def build_chain(blocks):
+    rng = random.Random(0)
+    timestamps = [GENESIS_TIMESTAMP]
+    for _ in range(blocks - 1):
+        # irregular block times, some blocks with the same timestamp
+        timestamps.append(timestamps[-1] + rng.choice([0, 1, 12, 12, 12, 13, 30]))
+    return timestamps
+
+
+class FakeNode:
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+        self.requests = []
+
+    def fetch_blocks(self, blocks):
+        self.requests.append(blocks)
+        blocks = [len(self.timestamps) - 1 if block == "latest" else block for block in blocks]
+        return [(block, self.timestamps[block]) for block in blocks]
+
+
+def test_get_block():
+    timestamps = build_chain(100000)
+    node = FakeNode(timestamps)
+    index = BlockTimestampIndex(node.fetch_blocks)
+
+    rng = random.Random(1)
+    for timestamp in [rng.randint(timestamps[0], timestamps[-1] + 100) for _ in range(50)] + [timestamps[500]]:
+        # closest block before the timestamp
+        assert index.get_block(timestamp) == bisect_right(timestamps, timestamp) - 1
+
+    # every search takes a few rounds of requests
+    assert len(node.requests) < 51 * 10
+
+    with raises(ValueError):
+        index.get_block(timestamps[0] - 1)
+
+
+def test_get_block_rounds_are_logarithmic():
+    # the block rate changes near the end: interpolating from the first and last blocks is far off
+    timestamps = [GENESIS_TIMESTAMP]
+    for i in range(1, 200000):
+        timestamps.append(timestamps[-1] + (2 if i < 199000 else 600))
+
+    for timestamp in [timestamps[198900], timestamps[199500], timestamps[100000]]:
+        node = FakeNode(timestamps)
+        index = BlockTimestampIndex(node.fetch_blocks)
+        assert index.get_block(timestamp) == bisect_right(timestamps, timestamp) - 1
+        # every round at least halves the gap
+        assert len(node.requests) <= math.log2(len(timestamps)) + 2
+
+
+def test_get_timestamp():
+    node = FakeNode(build_chain(1000))
+    index = BlockTimestampIndex(node.fetch_blocks)
+    assert index.get_timestamp(500) == node.timestamps[500]
+    assert index.get_timestamp(500) == node.timestamps[500]
+    assert node.requests == [[500]]
+
+
+def test_index_is_persisted(tmp_path):
+    timestamps = build_chain(10000)
+    path = str(tmp_path / "ethereum.bin")
+    index = BlockTimestampIndex(FakeNode(timestamps).fetch_blocks, path=path)
+    block = index.get_block(timestamps[5000])
+    index.get_timestamp(7000)
+
+    node = FakeNode(timestamps)
+    loaded_index = BlockTimestampIndex(node.fetch_blocks, path=path)
+    # all but the latest block, that could still be reorganized
+    assert len(loaded_index) == len(index) - 1
+    assert loaded_index.get_block(timestamps[5000]) == block
+    assert loaded_index.get_timestamp(7000) == timestamps[7000]
+    assert node.requests == []
+
+    # samples added by other processes are kept
+    index.get_timestamp(8000)
+    loaded_index.get_timestamp(9000)
+    assert BlockTimestampIndex(node.fetch_blocks, path=path).get_timestamp(8000) == timestamps[8000]
+    # 9000 is after the saved blocks: the head of the chain tells whether it's confirmed
+    assert node.requests == [[9000, "latest"]]
+
+
+def test_unconfirmed_blocks_are_not_persisted(tmp_path):
+    timestamps = build_chain(1000)
+    path = str(tmp_path / "ethereum.bin")
+    node = FakeNode(timestamps)
+    index = BlockTimestampIndex(node.fetch_blocks, path=path, unconfirmed_blocks=100)
+    assert index.get_timestamps([500, 950]) == [timestamps[500], timestamps[950]]
+    # the head of the chain is fetched with the blocks to know which ones are confirmed
+    assert node.requests == [[500, 950, "latest"]]
+    assert index.get_timestamp(950) == timestamps[950]
+
+    loaded_index = BlockTimestampIndex(node.fetch_blocks, path=path, unconfirmed_blocks=100)
+    assert list(loaded_index.blocks) == [500]
+    # blocks before the saved ones were already confirmed
+    assert loaded_index.get_timestamp(400) == timestamps[400]
+    assert node.requests[1:] == [[400]]
+
+
+def test_get_blocks():
+    timestamps = build_chain(100000)
+    node = FakeNode(timestamps)
+    index = BlockTimestampIndex(node.fetch_blocks)
+
+    rng = random.Random(2)
+    queries = [rng.randint(timestamps[0], timestamps[-1] + 100) for _ in range(200)]
+    assert index.get_blocks(queries) == [bisect_right(timestamps, timestamp) - 1 for timestamp in queries]
+    # all the searches share the rounds of requests
+    assert len(node.requests) < 30
+
+
+def test_get_timestamps():
+    node = FakeNode(build_chain(1000))
+    index = BlockTimestampIndex(node.fetch_blocks)
+    index.get_timestamp(10)
+    assert index.get_timestamps([30, 10, 20, 30]) == [node.timestamps[block] for block in [30, 10, 20, 30]]
+    assert node.requests == [[10], [20, 30]]
@@ -1,6 +1,32 @@
+import fnmatch
+import io
+import json
+import socketserver
+import subprocess
+import sys
+import threading
+import time
 from unittest import mock
 
-from defi_protocols.cache import TemporaryCache, cache_call, const_call
+import diskcache
+import numpy as np
+import pytest
+from web3.datastructures import AttributeDict
+
+from defi_protocols import cache
+from defi_protocols.cache import (
+    CachePolicy,
+    CompactDisk,
+    DiskCache,
+    MemoryCache,
+    RedisCache,
+    TemporaryCache,
+    TwoTierCache,
+    bind_call_args,
+    cache_call,
+    const_call,
+    generate_cache_key,
+)
 
 
 def build_web3_contract_mock():
@@ -51,3 +77,260 @@ def test_const_cache_disabled():
         const_call(web3_contract_function)
         const_call(web3_contract_function)
         assert centinel.call_count == 2
+
+
+def test_cache_decorator_disabled():
+    centinel = mock.Mock()
+
+    @cache_call()
+    def f(a):
+        centinel()
+        return a
+
+    with mock.patch("defi_protocols.cache.is_enabled", wraps=lambda: False):
+        assert f(1) == 1
+        assert f(1) == 1
+        assert centinel.call_count == 2
+
+
+def test_generate_cache_key():
+    key = generate_cache_key(("f", {"a": 1, "b": [b"\x01", "0x1"]}))
+    assert key == generate_cache_key(("f", {"b": (b"\x01", "0x1"), "a": 1}))
+    assert key != generate_cache_key(("f", {"a": True, "b": [b"\x01", "0x1"]}))
+    assert generate_cache_key(1) != generate_cache_key("1")
+    assert generate_cache_key({"a": 1}) != generate_cache_key((("a", 1),))
+    assert generate_cache_key(("f", np.int64(17000000))) == generate_cache_key(("f", 17000000))
+    assert generate_cache_key(AttributeDict({"a": 1, "b": 2})) == generate_cache_key({"b": 2, "a": 1})
+
+
+def test_bind_call_args():
+    def f(a, b, c=3, d=None):
+        pass
+
+    bind = bind_call_args(f)
+    assert bind((1, 2), {}) == {"a": 1, "b": 2, "c": 3, "d": None}
+    assert bind((1,), {"b": 2, "d": 4}) == {"a": 1, "b": 2, "c": 3, "d": 4}
+    for args, kwargs in [((1,), {}), ((1, 2, 3, 4, 5), {}), ((1, 2), {"a": 1}), ((1, 2), {"e": 1})]:
+        with pytest.raises(TypeError):
+            bind(args, kwargs)
+
+
+def test_compact_disk():
+    logs = [AttributeDict({"address": "0x6B175474E89094C44Da98b954EedeAC495271d0F", "logIndex": i}) for i in range(3)]
+    disk = diskcache.Cache(disk=CompactDisk)
+    for value in [logs, 1, "0x1", b"\x01", ("result", "0x1"), None]:
+        disk["key"] = value
+        assert disk["key"] == value
+
+
+def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(max_entries=2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    assert memory.get("a") == 1
+    memory.set("c", 3)
+    assert memory.get("b") is None
+    assert memory.get("a") == 1 and memory.get("c") == 3
+    assert memory.stats() == {"entries": 2, "size": memory.size, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_memory_cache_max_bytes():
+    memory = MemoryCache(max_bytes=1000)
+    memory.set("big", "x" * 2000)
+    assert memory.get("big") is None
+    for i in range(10):
+        memory.set(i, "x" * 200)
+    assert memory.size <= 1000
+    assert memory.evictions > 0
+
+
+def test_memory_cache_values_are_not_shared():
+    memory = MemoryCache()
+    memory.set("list", [1, 2])
+    memory.get("list").append(3)
+    assert memory.get("list") == [1, 2]
+
+
+def test_two_tier_cache():
+    disk = diskcache.Cache()
+    disk["key"] = None
+    cache = TwoTierCache(disk)
+    assert "key" in cache
+    assert cache.get("key", "default") is None
+    # the value is now served from memory
+    del disk["key"]
+    assert cache["key"] is None
+    assert cache.get("other", "default") == "default"
+
+    cache["other"] = 1
+    assert disk["other"] == 1
+    cache.clear()
+    assert "other" not in cache
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    """Minimal stand-in for a Redis server: GET, SET, DEL and SCAN over the RESP protocol."""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.execute(args[0].upper(), args[1:]))
+
+    def execute(self, command, args):
+        data = self.server.data
+        if command == b"GET":
+            value = data.get(args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            data[args[0]] = args[1]
+            return b"+OK\r\n"
+        if command == b"DEL":
+            return b":%d\r\n" % sum(data.pop(key, None) is not None for key in args)
+        if command == b"SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            keys = [key for key in data if fnmatch.fnmatch(key.decode(), pattern)]
+            return b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(
+                b"$%d\r\n%s\r\n" % (len(key), key) for key in keys
+            )
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+def redis_url():
+    pytest.importorskip("redis")
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RESPHandler)
+    server.daemon_threads = True
+    server.data = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+def test_redis_cache(redis_url):
+    backend = RedisCache(redis_url)
+    assert backend.get("key", "default") == "default"
+    backend["key"] = {"result": "0x1"}
+    assert backend.get("key") == {"result": "0x1"}
+    # another process using the same server sees the value
+    assert RedisCache(redis_url).get("key") == {"result": "0x1"}
+
+    other_app = RedisCache(redis_url, prefix="other:")
+    other_app["key"] = 1
+    assert backend.clear() == 1
+    assert backend.get("key") is None
+    assert other_app.get("key") == 1
+
+
+def test_two_tier_cache_with_redis(redis_url):
+    cache = TwoTierCache(RedisCache(redis_url))
+    cache["key"] = ("result", "0x1")
+    assert TwoTierCache(RedisCache(redis_url)).get("key") == ("result", "0x1")
+
+
+def test_namespace_policies():
+    policies = {"ttl": CachePolicy(ttl=0.1), "capped": CachePolicy(max_size=1024**2)}
+    two_tier_cache = TwoTierCache(DiskCache(disk=CompactDisk), policies=policies)
+
+    two_tier_cache.set("key", 1, namespace="ttl")
+    # entries with a ttl are not kept in memory
+    assert len(two_tier_cache.memory) == 0
+    assert two_tier_cache.get("key", namespace="ttl") == 1
+    time.sleep(0.2)
+    assert two_tier_cache.get("key", namespace="ttl") is None
+
+    two_tier_cache.set("key", 2, namespace="capped")
+    assert two_tier_cache.get_backend("capped") is not two_tier_cache.backend
+    assert two_tier_cache.get_backend("capped").get("capped:key") == 2
+    assert two_tier_cache.backend.get("capped:key") is None
+
+    two_tier_cache.clear()
+    assert two_tier_cache.get("key", namespace="capped") is None
+
+
+def test_namespaced_keys():
+    two_tier_cache = TwoTierCache(DiskCache(disk=CompactDisk), policies={"capped": CachePolicy(max_size=1024**2)})
+    two_tier_cache.set("key", 1, namespace="a")
+    two_tier_cache.set("key", 2, namespace="b")
+    two_tier_cache.set("key", 3, namespace="capped")
+    assert [two_tier_cache.get("key", namespace=namespace) for namespace in ["a", "b", "capped"]] == [1, 2, 3]
+    assert "key" not in two_tier_cache
+    assert two_tier_cache.contains("key", namespace="a")
+
+    two_tier_cache.delete("key", namespace="a")
+    two_tier_cache.delete("key", namespace="capped")
+    assert not two_tier_cache.contains("key", namespace="a")
+    assert not two_tier_cache.contains("key", namespace="capped")
+    assert two_tier_cache.get("key", namespace="b") == 2
+
+
+def test_contains_is_not_counted():
+    two_tier_cache = TwoTierCache(DiskCache(disk=CompactDisk))
+    two_tier_cache.set("key", 1, namespace="a")
+    assert two_tier_cache.contains("key", namespace="a")
+    assert not two_tier_cache.contains("missing", namespace="a")
+    stats = two_tier_cache.stats()
+    assert (stats["memory"]["hits"], stats["memory"]["misses"]) == (0, 0)
+    assert stats["namespaces"]["a"]["hits"] == stats["namespaces"]["a"]["misses"] == 0
+
+
+def test_disk_evictions_are_counted():
+    two_tier_cache = TwoTierCache(DiskCache(disk=CompactDisk), policies={"capped": CachePolicy(max_size=1)})
+    for i in range(5):
+        two_tier_cache.set(f"key{i}", "x" * 1000, namespace="capped")
+    stats = two_tier_cache.stats()["namespaces"]["capped"]
+    assert stats["sets"] == 5
+    assert stats["disk_evictions"] == 5 - len(two_tier_cache.get_backend("capped"))
+    assert stats["disk_evictions"] > 0
+
+
+def test_stats():
+    with TemporaryCache():
+        centinel = mock.Mock()
+
+        @cache_call()
+        def f(a):
+            centinel()
+            return a
+
+        f(1)
+        f(1)
+        f(2)
+        stats = cache.stats()
+        assert stats["namespaces"]["call.test_stats.<locals>.f"] == {
+            "hits": 1,
+            "misses": 2,
+            "sets": 2,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+        assert stats["volume"]["default"] > 0
+
+        output = io.StringIO()
+        cache.dump_stats(output)
+        assert json.loads(output.getvalue()) == json.loads(json.dumps(stats))
+
+
+def test_nothing_is_loaded_at_import():
+    # in a new interpreter, so that the modules aren't already imported by other tests
+    code = """
+import sys
+import defi_protocols
+import defi_protocols.functions
+from defi_protocols import cache, constants
+
+assert not cache._cache_opened
+assert "config_data" not in vars(constants)
+assert not {"pandas", "tqdm", "gql", "numpy"} & set(sys.modules)
+assert "defi_protocols.Aave" not in sys.modules
+
+assert defi_protocols.Aave is sys.modules["defi_protocols.Aave"]
+assert constants.NODES_ENDPOINTS[constants.ETHEREUM] == constants.NODE_ETH
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,48 @@
+from unittest import mock
+
+from pytest import raises
+
+from defi_protocols.abi_store import ABIStore
+from defi_protocols.cache import TemporaryCache
+from defi_protocols.chains import CHAINS, get_chain
+from defi_protocols.constants import (
+    API_BLOCKSCOUT_GETABI,
+    ETHEREUM,
+    MULTICALL3_DEPLOYMENT_BLOCKS,
+    NODES_ENDPOINTS,
+    XDAI,
+    ZERO_ADDRESS,
+)
+from defi_protocols.functions import get_contract_abi, get_symbol
+from defi_protocols.util.explorer_client import ExplorerClient
+
+CONTRACT = "0xBA12222222228d8Ba445958a75a0704d566BF2C8"
+
+
+def test_get_chain():
+    assert get_chain(ETHEREUM).native_token == "ETH"
+    assert get_chain(XDAI).nodes is NODES_ENDPOINTS[XDAI]
+    assert get_chain(ETHEREUM).multicall_deployment_block == MULTICALL3_DEPLOYMENT_BLOCKS[ETHEREUM]
+    with raises(ValueError):
+        get_chain("mainnet")
+    # every blockchain with nodes is in the registry
+    assert set(NODES_ENDPOINTS) <= set(CHAINS)
+
+
+def test_get_symbol_of_native_token():
+    assert get_symbol(ZERO_ADDRESS, XDAI, web3=mock.Mock()) == "XDAI"
+
+
+def test_get_contract_abi_falls_back(requests_mock):
+    requests_mock.get(
+        "https://api.gnosisscan.io/api",
+        json={"status": "0", "message": "NOTOK", "result": "Contract source code not verified"},
+    )
+    requests_mock.get(API_BLOCKSCOUT_GETABI % CONTRACT, json={"status": "1", "message": "OK", "result": "[]"})
+    client = ExplorerClient(rate_limit=1000)
+    with TemporaryCache(), mock.patch("defi_protocols.functions._abi_store", ABIStore()), mock.patch(
+        "defi_protocols.functions.get_explorer_client", return_value=client
+    ):
+        assert get_contract_abi(CONTRACT, XDAI) == "[]"
+        assert get_contract_abi(CONTRACT, "mainnet") is None
+    assert requests_mock.call_count == 2
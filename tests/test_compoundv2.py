@@ -1,5 +1,7 @@
 from decimal import Decimal
 
+import pytest
+
 from defi_protocols import Compound
 from defi_protocols.constants import ETHEREUM, ZERO_ADDRESS, ETHTokenAddr
 from defi_protocols.functions import get_node
@@ -29,6 +31,8 @@ CTOKEN_CONTRACTS = {
 
 WALLET_N1 = "0x31cD267D34EC6368eac930Be4f412dfAcc71A844"
 WALLET_N2 = "0x99e881e9e89152b0add27c367f0761f0fbe5ddc3"
+# an address without any position
+EMPTY_WALLET = "0xa9a1Ed356709ee0cc3D1C873a7a76Fc27e956ca4"
 
 
 def test_get_comptoller_address():
@@ -79,6 +83,37 @@ def test_get_ctoken_data():
     assert wallet2_ccomp["exchangeRateStored"] == 204174793505775477876721754
 
 
+def test_get_markets_snapshot():
+    block = 16904422
+    web3 = get_node(ETHEREUM, block)
+    snapshot = Compound.get_markets_snapshot(block, ETHEREUM, web3=web3)
+    assert list(snapshot["markets"]) == list(CTOKEN_CONTRACTS.values())
+    assert snapshot["ctokens_by_underlying"][ZERO_ADDRESS] == [CTOKEN_CONTRACTS["ceth_contract"]]
+    assert snapshot["ctokens_by_underlying"][ETHTokenAddr.WBTC] == [
+        CTOKEN_CONTRACTS["cwbtc_contract"],
+        CTOKEN_CONTRACTS["cwbtc2_contract"],
+    ]
+
+    wallet1_cdai = Compound.get_ctoken_data(CTOKEN_CONTRACTS["cdai_contract"], WALLET_N1, block, ETHEREUM, web3=web3)
+    assert snapshot["markets"][CTOKEN_CONTRACTS["cdai_contract"]] == {
+        "underlying": ETHTokenAddr.DAI,
+        "decimals": 8,
+        "underlying_decimals": 18,
+        "exchangeRateStored": wallet1_cdai["exchangeRateStored"],
+    }
+
+
+def test_get_wallets_ctoken_balances():
+    block = 16904422
+    web3 = get_node(ETHEREUM, block)
+    ctokens = [CTOKEN_CONTRACTS["cdai_contract"], CTOKEN_CONTRACTS["ceth_contract"]]
+    balances = Compound.get_wallets_ctoken_balances([WALLET_N1, WALLET_N2], ctokens, block, ETHEREUM, web3=web3)
+    for wallet in [WALLET_N1, WALLET_N2]:
+        for ctoken in ctokens:
+            ctoken_data = Compound.get_ctoken_data(ctoken, wallet, block, ETHEREUM, web3=web3)
+            assert balances[wallet][ctoken] == [ctoken_data["balanceOf"], ctoken_data["borrowBalanceStored"]]
+
+
 def test_underlying():
     block = 16904422
     node = get_node(ETHEREUM, block)
@@ -102,6 +137,40 @@ def test_underlying_all():
     ]
 
 
+def test_underlying_all_many():
+    block = 16906410
+    node = get_node(ETHEREUM, block)
+    underlyings = Compound.underlying_all_many([WALLET_N1, EMPTY_WALLET], block, ETHEREUM, web3=node)
+    assert underlyings == {
+        WALLET_N1: [
+            [ETHTokenAddr.DAI, Decimal("1.000010884057654258470225384")],
+            [ZERO_ADDRESS, Decimal("0.0009999999621424394485648011655")],
+        ],
+        EMPTY_WALLET: [],
+    }
+
+
+def test_underlying_all_lens():
+    block = 16906410
+    node = get_node(ETHEREUM, block)
+    underlyings = Compound.underlying_all(WALLET_N1, block, ETHEREUM, web3=node, lens=True)
+    # the lens includes the interest accrued since the last update of each market
+    stored_underlyings = Compound.underlying_all(WALLET_N1, block, ETHEREUM, web3=node)
+    assert [token for token, _ in underlyings] == [token for token, _ in stored_underlyings]
+    for (_, amount), (_, stored_amount) in zip(underlyings, stored_underlyings):
+        assert amount == pytest.approx(stored_amount, rel=Decimal("1e-4"))
+
+
+def test_get_wallets_lens_balances():
+    block = 16906410
+    node = get_node(ETHEREUM, block)
+    ctokens = [CTOKEN_CONTRACTS["cdai_contract"], CTOKEN_CONTRACTS["ceth_contract"]]
+    balances = Compound.get_wallets_lens_balances([WALLET_N1], ctokens, block, ETHEREUM, web3=node)
+    stored_balances = Compound.get_wallets_ctoken_balances([WALLET_N1], ctokens, block, ETHEREUM, web3=node)
+    for ctoken in ctokens:
+        assert balances[WALLET_N1][ctoken][0] == stored_balances[WALLET_N1][ctoken][0]
+
+
 def test_all_comp_rewards():
     block = 16924820
     node = get_node(ETHEREUM, block)
@@ -105,3 +105,10 @@ def test_underlying_all():
             "wallet": "0x849D52316331967b6fF1198e5E32A0eB168D039d",
         },
     ]
+
+
+def test_underlying_all_many():
+    block = 16627530
+    wallets = [WALLET, LPTOKEN_ADDR]
+    underlying = Element.underlying_all_many(wallets, block, blockchain=ETHEREUM)
+    assert underlying == {wallet: Element.underlying_all(wallet, block, blockchain=ETHEREUM) for wallet in wallets}
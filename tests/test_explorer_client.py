@@ -0,0 +1,54 @@
+import time
+from unittest import mock
+
+from pytest import raises
+
+from defi_protocols.util.explorer_client import ExplorerClient, ExplorerError, TokenBucket
+
+URL = "https://api.etherscan.io/api?module=contract&action=getabi&address=%s&apikey=KEY"
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=5)
+    start = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    # the burst is free, the next 10 wait for the refill
+    assert 0.08 < time.monotonic() - start < 0.5
+
+
+def test_get_retries_when_rate_limited(requests_mock):
+    requests_mock.get(
+        "https://api.etherscan.io/api",
+        [
+            {"json": {"status": "0", "message": "NOTOK", "result": "Max rate limit reached"}},
+            {"status_code": 502},
+            {"json": {"status": "1", "message": "OK", "result": "[]"}},
+        ],
+    )
+    client = ExplorerClient(rate_limit=1000)
+    with mock.patch("defi_protocols.util.explorer_client.time.sleep") as sleep:
+        assert client.get(URL % "0x1")["result"] == "[]"
+    assert requests_mock.call_count == 3
+    assert sleep.call_count == 2
+
+
+def test_get_gives_up(requests_mock):
+    requests_mock.get("https://api.etherscan.io/api", status_code=503)
+    client = ExplorerClient(rate_limit=1000, max_retries=2)
+    with mock.patch("defi_protocols.util.explorer_client.time.sleep"):
+        with raises(ExplorerError):
+            client.get(URL % "0x1")
+    assert requests_mock.call_count == 3
+
+
+def test_get_many(requests_mock):
+    requests_mock.get(
+        "https://api.etherscan.io/api", json=lambda request, context: {"result": request.qs["address"][0]}
+    )
+    client = ExplorerClient(rate_limit=1000)
+    addresses = [f"0x{i}" for i in range(20)]
+    assert [data["result"] for data in client.get_many([URL % address for address in addresses])] == addresses
+    # the requests with the same API key share the rate limit
+    assert client.get_bucket(URL % "0x1") is client.get_bucket("https://api.etherscan.io/api", {"apikey": "KEY"})
+    assert client.get_bucket(URL % "0x1") is not client.get_bucket("https://blockscout.com/xdai/mainnet/api")
@@ -1,10 +1,47 @@
 import datetime
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from unittest import mock
 
+import numpy as np
 import pytz
+import requests
+from hexbytes import HexBytes
 from pytest import raises
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.providers import BaseProvider
 
-from defi_protocols.constants import ETHEREUM, STETH_ETH, USDC_ETH, XDAI, ETHTokenAddr
-from defi_protocols.functions import date_to_block, get_node, get_symbol, search_proxy_impl_address
+from defi_protocols.block_index import BlockTimestampIndex
+from defi_protocols.cache import TemporaryCache
+from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, ETHEREUM, STETH_ETH, USDC_ETH, XDAI, ETHTokenAddr
+from defi_protocols.functions import (
+    ENDPOINT_COOLDOWN,
+    AllProvidersDownError,
+    ProviderManager,
+    blocks_to_timestamps,
+    date_to_block,
+    get_cached_contract,
+    get_contract,
+    get_logs_web3,
+    get_node,
+    get_symbol,
+    get_web3_call_count,
+    get_web3_provider,
+    iter_logs,
+    iter_token_tx,
+    make_batch_request,
+    reset_web3_call_count,
+    search_proxy_impl_address,
+    timestamps_to_blocks,
+)
+from defi_protocols.log_store import LogStore
+from defi_protocols.util.explorer_client import ExplorerClient
+
+WALLET = "0x849D52316331967b6fF1198e5E32A0eB168D039d"
 
 
 def test_get_node():
@@ -12,6 +49,47 @@ def test_get_node():
     assert node
 
 
+def test_get_node_is_reused():
+    assert get_node(ETHEREUM) is get_node(ETHEREUM)
+    assert get_node(ETHEREUM, 17000000) is get_node(ETHEREUM, 16000000)
+    assert get_node(ETHEREUM) is not get_node(ETHEREUM, 17000000)
+
+
+def test_get_contract_is_reused():
+    web3 = get_node(ETHEREUM)
+    contract = get_contract(USDC_ETH, ETHEREUM, web3=web3, abi=ABI_TOKEN_SIMPLIFIED)
+    assert get_contract(USDC_ETH.lower(), ETHEREUM, web3=web3, abi=ABI_TOKEN_SIMPLIFIED) is contract
+    assert get_contract(USDC_ETH, ETHEREUM, web3=web3, abi=json.loads(ABI_TOKEN_SIMPLIFIED)) is not contract
+    assert get_contract(USDC_ETH, ETHEREUM, web3=get_node(ETHEREUM, 17000000), abi=ABI_TOKEN_SIMPLIFIED) is not contract
+
+
+def test_get_contract_cache_is_bounded():
+    web3 = Web3()
+    with mock.patch("defi_protocols.functions.MAX_CACHED_CONTRACTS", 2):
+        first = get_cached_contract(web3, USDC_ETH, ABI_TOKEN_SIMPLIFIED)
+        get_cached_contract(web3, STETH_ETH, ABI_TOKEN_SIMPLIFIED)
+        assert get_cached_contract(web3, USDC_ETH, ABI_TOKEN_SIMPLIFIED) is first
+        # STETH is the least recently used
+        get_cached_contract(web3, ETHTokenAddr.DAI, ABI_TOKEN_SIMPLIFIED)
+        assert len(web3._contracts) == 2
+        assert get_cached_contract(web3, USDC_ETH, ABI_TOKEN_SIMPLIFIED) is first
+        assert (STETH_ETH, ABI_TOKEN_SIMPLIFIED) not in web3._contracts
+
+
+def test_web3_call_count():
+    class FakeProvider(BaseProvider):
+        def make_request(self, method, params):
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+
+    web3 = get_web3_provider(FakeProvider())
+    web3.eth.block_number
+    assert get_web3_call_count(web3) > 0
+    reset_web3_call_count(web3)
+    assert get_web3_call_count(web3) == 0
+    web3.eth.block_number
+    assert get_web3_call_count(web3) == 1
+
+
 def test_date_to_block():
     block = 16671547
     assert date_to_block("2023-02-20 18:30:00", ETHEREUM) == block
@@ -75,3 +153,351 @@ def test_search_proxy_impl_address():
     # Custom proxy implementation (used by Safes)
     implementation = search_proxy_impl_address("0x4F2083f5fBede34C2714aFfb3105539775f7FE64", ETHEREUM)
     assert implementation == "0xd9Db270c1B5E3Bd161E8c8503c55cEABeE709552"
+
+
+def test_provider_manager_batch_request(requests_mock):
+    # responses of a batch can come in any order
+    requests_mock.post(
+        "http://node1",
+        json=[
+            {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "header not found"}},
+            {"jsonrpc": "2.0", "id": 0, "result": "0x2"},
+        ],
+    )
+    manager = ProviderManager(endpoints=["http://node1"])
+    responses = manager.make_batch_request([("eth_getBalance", [WALLET, "0x1"]), ("eth_getCode", [WALLET, "0x1"])])
+    assert responses[0]["result"] == "0x2"
+    assert responses[1]["error"]["code"] == -32000
+    assert [request["method"] for request in requests_mock.last_request.json()] == ["eth_getBalance", "eth_getCode"]
+
+
+def test_provider_manager_batch_request_not_supported(requests_mock):
+    def answer(request, context):
+        payload = request.json()
+        if isinstance(payload, list):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600}}
+        return {"jsonrpc": "2.0", "id": payload["id"], "result": payload["params"][1]}
+
+    requests_mock.post("http://node1", json=answer)
+    manager = ProviderManager(endpoints=["http://node1"])
+    rpc_requests = [("eth_getBalance", [WALLET, "0x1"]), ("eth_getBalance", [WALLET, "0x2"])]
+    assert [response["result"] for response in manager.make_batch_request(rpc_requests)] == ["0x1", "0x2"]
+    # not an error of the endpoint, that still serves the requests one at a time
+    assert manager.providers[0][1].errors == deque()
+    assert requests_mock.call_count == 3
+
+    # the batch isn't tried again
+    assert [response["result"] for response in manager.make_batch_request(rpc_requests)] == ["0x1", "0x2"]
+    assert requests_mock.call_count == 5
+    assert all(not isinstance(request.json(), list) for request in requests_mock.request_history[3:])
+
+
+def test_make_batch_request_is_cached(requests_mock):
+    requests_mock.post(
+        "http://node1",
+        json=[{"jsonrpc": "2.0", "id": 0, "result": "0x2"}, {"jsonrpc": "2.0", "id": 1, "result": "0x3"}],
+    )
+    rpc_requests = [("eth_getBalance", [WALLET, "0x1"]), ("eth_getBalance", [WALLET, "latest"])]
+    with TemporaryCache():
+        web3 = get_web3_provider(ProviderManager(endpoints=["http://node1"]))
+        web3._network_name = ETHEREUM
+        assert [response["result"] for response in make_batch_request(web3, rpc_requests)] == ["0x2", "0x3"]
+
+        requests_mock.post("http://node1", json=[{"jsonrpc": "2.0", "id": 0, "result": "0x4"}])
+        # the historical balance comes from the cache, only 'latest' is requested again
+        assert [response["result"] for response in make_batch_request(web3, rpc_requests)] == ["0x2", "0x4"]
+        assert len(requests_mock.last_request.json()) == 1
+
+
+def build_provider_manager(*fake_providers, max_fails_per_provider=2, max_executions=2):
+    manager = ProviderManager(
+        endpoints=[f"http://node{i}" for i in range(len(fake_providers))],
+        max_fails_per_provider=max_fails_per_provider,
+        max_executions=max_executions,
+        retry_backoff=0,
+    )
+    manager.providers = [(fake, health) for fake, (_, health) in zip(fake_providers, manager.providers)]
+    return manager
+
+
+def test_provider_manager_routes_to_fastest_endpoint():
+    slow, fast = mock.Mock(), mock.Mock()
+    slow.make_request.return_value = fast.make_request.return_value = {"result": "0x1"}
+    manager = build_provider_manager(slow, fast)
+    manager.providers[0][1].record_success(2.0)
+    manager.providers[1][1].record_success(0.1)
+
+    manager.make_request("eth_blockNumber", [])
+    assert slow.make_request.call_count == 0
+    assert fast.make_request.call_count == 1
+
+
+def test_provider_manager_spreads_concurrent_requests():
+    def slow_request(method, params):
+        time.sleep(0.05)
+        return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+
+    fast, slower = mock.Mock(), mock.Mock()
+    fast.make_request.side_effect = slower.make_request.side_effect = slow_request
+    manager = build_provider_manager(fast, slower)
+    manager.providers[0][1].record_success(0.1)
+    manager.providers[1][1].record_success(0.15)
+
+    # the requests in flight in the fastest endpoint make the next one cheaper
+    threads = [threading.Thread(target=manager.make_request, args=("eth_blockNumber", [])) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fast.make_request.call_count >= 2
+    assert slower.make_request.call_count >= 1
+
+
+def test_provider_manager_trips_and_recovers_endpoint():
+    down, up = mock.Mock(), mock.Mock()
+    down.make_request.side_effect = requests.exceptions.ConnectionError("down")
+    up.make_request.return_value = {"result": "0x1"}
+    manager = build_provider_manager(down, up, max_fails_per_provider=0)
+
+    assert manager.make_request("eth_blockNumber", []) == {"result": "0x1"}
+    # the endpoint tripped with its first error, it's skipped until the cool-down expires
+    manager.make_request("eth_blockNumber", [])
+    assert down.make_request.call_count == 1
+
+    down.make_request.side_effect = None
+    down.make_request.return_value = {"result": "0x2"}
+    manager.providers[1][1].record_success(5.0)
+    with mock.patch("defi_protocols.functions.time.monotonic", return_value=manager.providers[0][1].tripped_until):
+        assert manager.make_request("eth_blockNumber", []) == {"result": "0x2"}
+
+
+def test_provider_manager_cooldown_backs_off():
+    manager = build_provider_manager(mock.Mock(), max_fails_per_provider=0)
+    health = manager.providers[0][1]
+    with mock.patch("defi_protocols.functions.time.monotonic", return_value=1000):
+        health.record_error(ValueError())
+        assert health.tripped_until == 1000 + ENDPOINT_COOLDOWN
+        health.record_error(ValueError())
+        assert health.tripped_until == 1000 + 2 * ENDPOINT_COOLDOWN
+
+
+def test_provider_manager_retries_with_backoff():
+    down = mock.Mock()
+    down.make_request.side_effect = requests.exceptions.Timeout("timeout")
+    manager = build_provider_manager(down, max_fails_per_provider=5, max_executions=3)
+    manager.retry_backoff = 0.5
+    with mock.patch("defi_protocols.functions.time.sleep") as sleep:
+        raises(AllProvidersDownError, manager.make_request, "eth_blockNumber", [])
+    assert down.make_request.call_count == 3
+    assert [call.args[0] for call in sleep.call_args_list] == [0.5, 1.0]
+
+
+def test_provider_manager_hedges_slow_endpoint():
+    def slow_request(method, params):
+        time.sleep(0.5)
+        return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+
+    slow, fast = mock.Mock(), mock.Mock()
+    slow.make_request.side_effect = slow_request
+    fast.make_request.return_value = {"jsonrpc": "2.0", "id": 1, "result": "0x2"}
+    manager = build_provider_manager(slow, fast)
+    manager.hedge, manager.hedge_after = True, 0.05
+    manager.providers[0][1].record_success(0.01)
+    manager.providers[1][1].record_success(0.02)
+
+    start = time.monotonic()
+    assert manager.make_request("eth_blockNumber", [])["result"] == "0x2"
+    assert time.monotonic() - start < 0.4
+    assert slow.make_request.call_count == 1
+
+
+def test_provider_manager_hedge_error_response():
+    error_response = {"jsonrpc": "2.0", "id": 1, "error": {"code": 3, "message": "execution reverted"}}
+
+    def slow_request(method, params):
+        time.sleep(0.2)
+        return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+
+    def slow_error(method, params):
+        time.sleep(0.1)
+        return error_response
+
+    primary, secondary = mock.Mock(), mock.Mock()
+    primary.make_request.return_value = error_response
+    secondary.make_request.side_effect = slow_request
+    manager = build_provider_manager(primary, secondary)
+    manager.hedge, manager.hedge_after = True, 0.05
+    manager.providers[0][1].record_success(0.01)
+    manager.providers[1][1].record_success(0.02)
+
+    # an error answered in time is returned without hedging: the other endpoint would answer the same
+    assert manager.make_request("eth_call", [])["error"]["code"] == 3
+    assert secondary.make_request.call_count == 0
+
+    # once hedged, the error comes first but the other endpoint has the result
+    primary.make_request.side_effect = slow_error
+    assert manager.make_request("eth_call", [])["result"] == "0x1"
+    assert secondary.make_request.call_count == 1
+
+    # a request that fails in time is hedged
+    primary.make_request.side_effect = requests.exceptions.ConnectionError("connection refused")
+    assert manager.make_request("eth_call", [])["result"] == "0x1"
+    assert secondary.make_request.call_count == 2
+
+
+def test_provider_manager_does_not_hedge_fast_endpoint():
+    fast, other = mock.Mock(), mock.Mock()
+    fast.make_request.return_value = {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+    manager = build_provider_manager(fast, other)
+    manager.hedge = True
+    for latency in [0.01] * 19 + [0.2]:
+        manager.providers[0][1].record_success(latency)
+    manager.providers[1][1].record_success(0.5)
+
+    # the threshold is the p95 of the endpoint's latencies
+    assert manager.get_hedge_after(manager.providers[0][1]) == 0.2
+    assert manager.make_request("eth_blockNumber", [])["result"] == "0x1"
+    assert other.make_request.call_count == 0
+
+
+def test_timestamps_to_blocks():
+    def fetch_blocks(blocks):
+        fetched.append(blocks)
+        # a block every 10 seconds
+        return [(1000 if block == "latest" else block, 10 * (1000 if block == "latest" else block)) for block in blocks]
+
+    fetched = []
+    with mock.patch.dict("defi_protocols.functions._block_indexes", {ETHEREUM: BlockTimestampIndex(fetch_blocks)}):
+        blocks = timestamps_to_blocks(np.array([[55, 5000], [55, 9999]]), ETHEREUM)
+        assert blocks.tolist() == [[5, 500], [5, 999]]
+        assert blocks_to_timestamps([5, 999, 5], ETHEREUM).tolist() == [50, 9990, 50]
+        assert timestamps_to_blocks([], ETHEREUM).tolist() == []
+    assert len(fetched) < 10
+
+
+def build_log(block, log_index=0):
+    return AttributeDict(
+        {
+            "address": WALLET,
+            "topics": [HexBytes(b"\x01" * 32)],
+            "data": HexBytes(b"\x02" * 32),
+            "blockNumber": block,
+            "transactionHash": HexBytes(block.to_bytes(32, "big")),
+            "transactionIndex": 0,
+            "blockHash": HexBytes(block.to_bytes(32, "big")),
+            "logIndex": log_index,
+            "removed": False,
+        }
+    )
+
+
+def test_get_logs_web3_scans_rejected_range():
+    logs = [build_log(block) for block in range(0, 10000, 3)]
+    requests = []
+
+    def get_logs(params):
+        from_block, to_block = params["fromBlock"], params["toBlock"]
+        requests.append((from_block, to_block))
+        if to_block - from_block >= 1000:
+            raise ValueError({"code": -32005, "data": {"from": hex(from_block), "to": hex(from_block + 500)}})
+        return [log for log in logs if from_block <= log["blockNumber"] <= to_block]
+
+    web3 = mock.Mock()
+    web3.eth.get_logs.side_effect = get_logs
+    web3.eth.block_number = 20000
+    with mock.patch.dict("defi_protocols.functions._log_stores", {ETHEREUM: LogStore()}), mock.patch.dict(
+        "defi_protocols.functions._confirmed_blocks", clear=True
+    ):
+        assert get_logs_web3(WALLET, ETHEREUM, block_start=0, block_end=8999, web3=web3) == logs[:3000]
+
+        # a shifted window is answered from the log store, only the new blocks are fetched
+        requests.clear()
+        assert get_logs_web3(WALLET, ETHEREUM, block_start=500, block_end=9999, web3=web3) == logs[167:]
+        assert requests == [(9000, 9999)]
+
+        # the most recent blocks are not stored
+        requests.clear()
+        web3.eth.block_number = 9999
+        assert get_logs_web3(WALLET, ETHEREUM, block_start=9500, block_end="latest", web3=web3) == logs[3167:]
+        assert requests == [(9872, 9999)]
+
+        # neither when the range ends in a block number
+        requests.clear()
+        assert get_logs_web3(WALLET, ETHEREUM, block_start=9500, block_end=9999, web3=web3) == logs[3167:]
+        assert requests == [(9872, 9999)]
+
+
+def test_iter_token_tx_pages(requests_mock):
+    # 12500 transfers sorted by descending block, 2 transactions per block with 2 identical transfers each
+    transfers = [
+        {
+            "blockNumber": str(i // 4),
+            "hash": f"0x{i // 2:x}",
+            "from": WALLET,
+            "to": USDC_ETH,
+            "value": "1",
+            "confirmations": str(20000 - i // 4),
+        }
+        for i in range(12499, -1, -1)
+    ]
+
+    def explorer(request, context):
+        end = int(request.qs["endblock"][0])
+        page, offset = int(request.qs["page"][0]), int(request.qs["offset"][0])
+        window = [transfer for transfer in transfers if int(transfer["blockNumber"]) <= end]
+        return {"status": "1", "message": "OK", "result": window[(page - 1) * offset : page * offset]}
+
+    requests_mock.get("https://api.etherscan.io/api", json=explorer)
+    with mock.patch("defi_protocols.functions.get_explorer_client", return_value=ExplorerClient(rate_limit=1000)):
+        records = list(iter_token_tx(USDC_ETH, WALLET, 0, 6249, ETHEREUM))
+        assert records == transfers
+        # the records past the first 10000 are queried again from the block of the last one
+        assert requests_mock.call_count == 13
+        assert "endblock=625" in requests_mock.request_history[10].url
+
+        # only the pages that are read are requested
+        requests_mock.reset_mock()
+        next(iter_token_tx(USDC_ETH, WALLET, 0, 6249, ETHEREUM))
+        assert requests_mock.call_count == 1
+
+
+def test_iter_logs_stops_early():
+    web3 = mock.Mock()
+    web3.eth.get_logs.side_effect = lambda params: [{"blockNumber": params["fromBlock"]}]
+    logs = iter_logs(WALLET, ETHEREUM, block_start=0, block_end=10**6, web3=web3, block_range=10)
+    assert [log["blockNumber"] for log in itertools.islice(logs, 3)] == [0, 10, 20]
+    logs.close()
+    assert web3.eth.get_logs.call_count < 100
+
+
+def test_search_proxy_impl_address_in_one_batch(requests_mock):
+    implementation = "0x3eD1DFBCCF893b7d2D730EAd3e5eDBF1f8f95a48"
+
+    def node(request, context):
+        body = request.json()
+        if isinstance(body, list):
+            # code and the two implementation slots
+            results = ["0x6080", "0x" + implementation[2:].lower().rjust(64, "0"), "0x" + "0" * 64]
+            return [{"jsonrpc": "2.0", "id": item["id"], "result": result} for item, result in zip(body, results)]
+        assert body["method"] == "eth_getLogs"
+        return {"jsonrpc": "2.0", "id": body["id"], "result": []}
+
+    requests_mock.post("http://node1", json=node)
+    proxy = "0xE95A203B1a91a908F9B9CE46459d101078c2c3cb"
+    with TemporaryCache(), mock.patch.dict(
+        "defi_protocols.functions._log_stores", {ETHEREUM: LogStore()}
+    ), mock.patch.dict("defi_protocols.functions._confirmed_blocks", {ETHEREUM: 17000000}):
+        web3 = get_web3_provider(ProviderManager(endpoints=["http://node1"]))
+        web3._network_name = ETHEREUM
+        assert search_proxy_impl_address(proxy, ETHEREUM, web3=web3, block=16000000) == implementation
+        assert requests_mock.call_count == 1
+        assert [item["method"] for item in requests_mock.last_request.json()] == [
+            "eth_getCode",
+            "eth_getStorageAt",
+            "eth_getStorageAt",
+        ]
+
+        # a later block only checks that there were no upgrades in between
+        assert search_proxy_impl_address(proxy, ETHEREUM, web3=web3, block=16000100) == implementation
+        assert requests_mock.call_count == 2
+        assert requests_mock.last_request.json()["method"] == "eth_getLogs"
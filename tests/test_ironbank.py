@@ -9,6 +9,8 @@ from defi_protocols.functions import get_node
 # 2023.04.27
 TEST_BLOCK = 94882677
 TEST_WALLET = "0x5eD64f02588C8B75582f2f8eFd7A5521e3F897CC"
+# an address without any position
+EMPTY_WALLET = "0xa9a1Ed356709ee0cc3D1C873a7a76Fc27e956ca4"
 WEB3 = get_node(blockchain=OPTIMISM, block=TEST_BLOCK)
 
 iUSDC = "0x1d073cf59Ae0C169cbc58B6fdD518822ae89173a"
@@ -29,6 +31,22 @@ def test_get_itoken_data():
     assert {k: data[k] for k in expected} == expected
 
 
+def test_get_markets_snapshot():
+    snapshot = IronBank.get_markets_snapshot(TEST_BLOCK, OPTIMISM, WEB3)
+    assert snapshot["itokens_by_underlying"][USDC] == [iUSDC]
+    assert snapshot["markets"][iUSDC] == {
+        "underlying": USDC,
+        "decimals": 8,
+        "underlying_decimals": 6,
+        "exchangeRateStored": 101609986612647,
+    }
+
+
+def test_get_wallets_itoken_balances():
+    balances = IronBank.get_wallets_itoken_balances([TEST_WALLET], [iUSDC], TEST_BLOCK, OPTIMISM, WEB3)
+    assert balances == {TEST_WALLET: {iUSDC: [37470207787145, 0]}}
+
+
 @pytest.mark.parametrize("decimals", [True, False])
 def test_get_all_rewards(decimals):
     x = IronBank.get_all_rewards(TEST_WALLET, iUSDC, TEST_BLOCK, OPTIMISM, WEB3, decimals=decimals)
@@ -74,6 +92,15 @@ def test_underlying_all(decimals, reward):
     assert x == [[USDC, Decimal("3807347311.624904820141022815") / y, 0], [IB, Decimal("0")]][: (2 if reward else 1)]
 
 
+@pytest.mark.parametrize("reward", [True, False])
+def test_underlying_all_many(reward):
+    x = IronBank.underlying_all_many([TEST_WALLET, EMPTY_WALLET], TEST_BLOCK, OPTIMISM, WEB3, reward=reward)
+    assert x == {
+        TEST_WALLET: [[USDC, Decimal("3807.347311624904820141022815"), 0], [IB, Decimal("0")]][: (2 if reward else 1)],
+        EMPTY_WALLET: [[IB, Decimal("0")]] if reward else [],
+    }
+
+
 @pytest.mark.parametrize("decimals", [True, False])
 def test_unwrap(decimals):
     x = IronBank.unwrap(Decimal(198489), iUSDC, TEST_BLOCK, OPTIMISM, WEB3, decimals=decimals)
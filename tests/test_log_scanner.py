@@ -0,0 +1,68 @@
+import threading
+import time
+
+from pytest import raises
+
+from defi_protocols.log_scanner import LogScanner
+
+
+class FakeNode:
+    """Logs of a block range, denser in some blocks. Rejects the queries with more than max_results results."""
+
+    def __init__(self, blocks, max_results=100, delay=0.0):
+        self.logs = [
+            {"blockNumber": block, "logIndex": i}
+            for block in range(blocks)
+            for i in range(20 if 3000 <= block < 3100 else block % 2)
+        ]
+        self.max_results = max_results
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_logs(self, from_block, to_block):
+        with self.lock:
+            self.requests.append((from_block, to_block))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            logs = [log for log in self.logs if from_block <= log["blockNumber"] <= to_block]
+            if len(logs) > self.max_results:
+                raise ValueError({"code": -32005, "message": "query returned more than 100 results"})
+            return logs
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_scan():
+    node = FakeNode(10000, delay=0.001)
+    scanner = LogScanner(node.get_logs, target_logs=50, initial_block_range=1000)
+    logs = list(scanner.scan(0, 9999))
+
+    # all the logs, once and in order, although the chunks are fetched concurrently
+    assert logs == node.logs
+    assert node.max_in_flight > 1
+    # the range shrank in the dense blocks and grew again after them
+    assert min(to_block - from_block for from_block, to_block in node.requests) < 10
+    assert max(to_block - from_block for from_block, to_block in node.requests[-5:]) >= 32
+
+
+def test_scan_retries_with_hint():
+    node = FakeNode(5000)
+    scanner = LogScanner(node.get_logs, get_range_hint=lambda error: 50, max_workers=1, initial_block_range=5000)
+    assert list(scanner.scan(1000, 4999)) == node.logs[500:]
+    # the rejected range was retried with the suggested one
+    assert node.requests[:2] == [(1000, 4999), (1000, 1049)]
+
+
+def test_scan_gives_up():
+    def get_logs(from_block, to_block):
+        raise ValueError("invalid params")
+
+    scanner = LogScanner(get_logs, initial_block_range=1000)
+    with raises(ValueError):
+        list(scanner.scan(0, 9999))
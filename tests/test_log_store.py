@@ -0,0 +1,76 @@
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from defi_protocols.log_store import LogStore, normalize_topics
+
+VAULT = "0xBA12222222228d8Ba445958a75a0704d566BF2C8"
+SWAP_TOPIC = "0x2170c741c41531aec20e7c107c24eecfdd15e69c9bb0a8dd37b1840b9e0b207b"
+
+
+def build_log(block, log_index=0):
+    return AttributeDict(
+        {
+            "address": VAULT,
+            "topics": [HexBytes(SWAP_TOPIC), HexBytes(block.to_bytes(32, "big"))],
+            "data": HexBytes(b"\x02" * 64),
+            "blockNumber": block,
+            "transactionHash": HexBytes(block.to_bytes(32, "big")),
+            "transactionIndex": 3,
+            "blockHash": HexBytes(block.to_bytes(32, "big")),
+            "logIndex": log_index,
+            "removed": False,
+        }
+    )
+
+
+def test_normalize_topics():
+    assert normalize_topics([SWAP_TOPIC]) == normalize_topics([HexBytes(SWAP_TOPIC), None])
+    assert normalize_topics([SWAP_TOPIC.upper().replace("0X", "0x")]) == normalize_topics([SWAP_TOPIC])
+    assert normalize_topics([SWAP_TOPIC]) != normalize_topics([None, SWAP_TOPIC])
+
+
+def test_missing_ranges():
+    store = LogStore()
+    assert store.missing_ranges(VAULT, [SWAP_TOPIC], 100, 200) == [(100, 200)]
+
+    store.add(VAULT, [SWAP_TOPIC], 120, 150, [])
+    store.add(VAULT, [SWAP_TOPIC], 170, 180, [])
+    assert store.missing_ranges(VAULT, [SWAP_TOPIC], 100, 200) == [(100, 119), (151, 169), (181, 200)]
+    assert store.missing_ranges(VAULT, [SWAP_TOPIC], 125, 150) == []
+    # the ranges are per filter
+    assert store.missing_ranges(VAULT, None, 125, 150) == [(125, 150)]
+
+    # overlapping and adjacent ranges are merged
+    store.add(VAULT, [SWAP_TOPIC], 151, 175, [])
+    assert store.get_synced_ranges(VAULT, [SWAP_TOPIC]) == [(120, 180)]
+
+
+def test_get_logs(tmp_path):
+    path = str(tmp_path / "ethereum.sqlite")
+    logs = [build_log(block, log_index) for block in range(100, 200, 7) for log_index in range(2)]
+    store = LogStore(path)
+    store.add(VAULT.lower(), [SWAP_TOPIC], 100, 199, logs)
+
+    assert store.get_logs(VAULT, [SWAP_TOPIC], 100, 199) == logs
+    assert store.get_logs(VAULT, [SWAP_TOPIC], 120, 150) == [log for log in logs if 120 <= log["blockNumber"] <= 150]
+
+    # the logs are persisted
+    assert LogStore(path).get_logs(VAULT, [SWAP_TOPIC], 100, 199) == logs
+    assert LogStore(path).missing_ranges(VAULT, [SWAP_TOPIC], 100, 250) == [(200, 250)]
+
+
+def test_least_recently_used_filters_are_evicted():
+    store = LogStore(max_size=150_000)
+    logs = [build_log(block) for block in range(200)]
+    store.add(VAULT, [SWAP_TOPIC], 0, 999, logs)
+    store.add(VAULT, None, 0, 999, logs)
+    assert store.evictions == 0
+
+    # the first filter is used again, so the second one is evicted
+    assert store.get_logs(VAULT, [SWAP_TOPIC], 0, 999) == logs
+    store.add(VAULT, [None, SWAP_TOPIC], 0, 999, logs)
+    assert store.evictions == 1
+    assert store.size() <= 150_000
+    assert store.missing_ranges(VAULT, None, 0, 999) == [(0, 999)]
+    assert store.get_logs(VAULT, None, 0, 999) == []
+    assert store.missing_ranges(VAULT, [SWAP_TOPIC], 0, 999) == []
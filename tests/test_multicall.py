@@ -0,0 +1,109 @@
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from defi_protocols.constants import ABI_TOKEN_SIMPLIFIED, ETHEREUM, MULTICALL3_ADDRESS
+from defi_protocols.multicall import AGGREGATE3_INPUT_TYPES, AGGREGATE3_OUTPUT_TYPES, Multicall, multicall
+
+TOKEN = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+WALLET = "0x849D52316331967b6fF1198e5E32A0eB168D039d"
+BLOCK = 17000000
+
+
+class Aggregate3Provider(BaseProvider):
+    """Fake node that answers aggregate3 calls with the balances of the wallets."""
+
+    def __init__(self, balances):
+        self.balances = balances
+        self.requests = []
+
+    def make_request(self, method, params):
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+        self.requests.append((method, params))
+        w3 = Web3()
+        if params[0]["to"] != MULTICALL3_ADDRESS:
+            # plain eth_call to balanceOf
+            success, output = self.balance_of(w3, bytes.fromhex(params[0]["data"][2:]))
+            if not success:
+                return {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "execution reverted"}}
+            return {"jsonrpc": "2.0", "id": 1, "result": Web3.to_hex(output)}
+
+        (calls,) = w3.codec.decode(AGGREGATE3_INPUT_TYPES, bytes.fromhex(params[0]["data"][10:]))
+        outputs = [self.balance_of(w3, call_data) for _, _, call_data in calls]
+        result = w3.codec.encode(AGGREGATE3_OUTPUT_TYPES, [outputs])
+        return {"jsonrpc": "2.0", "id": 1, "result": Web3.to_hex(result)}
+
+    def balance_of(self, w3, call_data):
+        (wallet,) = w3.codec.decode(["address"], call_data[4:])
+        balance = self.balances.get(Web3.to_checksum_address(wallet))
+        if balance is None:
+            return False, b""
+        return True, w3.codec.encode(["uint256"], [balance])
+
+
+class BatchProvider(Aggregate3Provider):
+    def __init__(self, balances):
+        super().__init__(balances)
+        self.batches = []
+
+    def make_batch_request(self, rpc_requests):
+        self.batches.append(rpc_requests)
+        return [self.make_request(method, params) for method, params in rpc_requests]
+
+
+def build_web3(balances):
+    provider = Aggregate3Provider(balances)
+    return Web3(provider), provider
+
+
+def test_multicall():
+    other_wallet = "0x0000000000000000000000000000000000000001"
+    web3, provider = build_web3({WALLET: 10, other_wallet: 20})
+    token = web3.eth.contract(address=TOKEN, abi=ABI_TOKEN_SIMPLIFIED)
+    calls = Multicall(BLOCK, ETHEREUM, web3=web3)
+    assert calls.add(token.functions.balanceOf(WALLET)) == 0
+    assert calls.add(token.functions.balanceOf(other_wallet)) == 1
+    assert calls.execute() == [10, 20]
+    assert len(provider.requests) == 1
+
+
+def test_multicall_failed_call_is_none():
+    web3, _ = build_web3({WALLET: 10})
+    token = web3.eth.contract(address=TOKEN, abi=ABI_TOKEN_SIMPLIFIED)
+    calls = [token.functions.balanceOf(WALLET), token.functions.balanceOf(TOKEN)]
+    assert multicall(calls, BLOCK, ETHEREUM, web3=web3) == [10, None]
+
+
+def test_multicall_without_calls():
+    web3, provider = build_web3({})
+    assert multicall([], BLOCK, ETHEREUM, web3=web3) == []
+    assert provider.requests == []
+
+
+def test_multicall_batches():
+    wallets = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 8)]
+    web3, provider = build_web3({wallet: i for i, wallet in enumerate(wallets)})
+    token = web3.eth.contract(address=TOKEN, abi=ABI_TOKEN_SIMPLIFIED)
+    calls = Multicall(BLOCK, ETHEREUM, web3=web3, batch_size=3)
+    for wallet in wallets:
+        calls.add(token.functions.balanceOf(wallet))
+    assert calls.execute() == list(range(len(wallets)))
+    assert len(provider.requests) == 3
+
+
+def test_multicall_before_deployment():
+    web3, provider = build_web3({WALLET: 5})
+    token = web3.eth.contract(address=TOKEN, abi=ABI_TOKEN_SIMPLIFIED)
+    calls = [token.functions.balanceOf(WALLET), token.functions.balanceOf(TOKEN)]
+    assert multicall(calls, 10000000, ETHEREUM, web3=web3) == [5, None]
+    assert [params[0]["to"] for _, params in provider.requests] == [TOKEN, TOKEN]
+    assert provider.requests[0][1][1] == hex(10000000)
+
+
+def test_multicall_before_deployment_uses_rpc_batch():
+    provider = BatchProvider({WALLET: 5})
+    web3 = Web3(provider)
+    token = web3.eth.contract(address=TOKEN, abi=ABI_TOKEN_SIMPLIFIED)
+    calls = [token.functions.balanceOf(WALLET), token.functions.balanceOf(TOKEN)]
+    assert multicall(calls, 10000000, ETHEREUM, web3=web3) == [5, None]
+    assert len(provider.batches) == 1
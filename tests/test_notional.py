@@ -85,6 +85,17 @@ def test_underlying_all():
     ]
 
 
+def test_underlying_all_many():
+    block = 17049450
+    node = get_node(ETHEREUM, block)
+
+    wallets = [WALLET_N1, ZERO_ADDRESS]
+    underlying = Notional.underlying_all_many(wallets, block, ETHEREUM, web3=node, reward=True)
+    assert underlying == {
+        wallet: Notional.underlying_all(wallet, block, ETHEREUM, web3=node, reward=True) for wallet in wallets
+    }
+
+
 def test_underlying():
     block = 17049450
     node = get_node(ETHEREUM, block)
@@ -0,0 +1,110 @@
+from defi_protocols.proxy_resolver import EIP_1167, EIP_1967, UNSTRUCTURED, ProxyResolver, classify_proxy
+
+PROXY = "0xE95A203B1a91a908F9B9CE46459d101078c2c3cb"
+IMPLEMENTATION = "0x3ed1dfbccf893b7d2d730ead3e5edbf1f8f95a48"
+OTHER_IMPLEMENTATION = "0x89632e27427109d64ffe1cdd98027139477e020f"
+EMPTY_SLOT = b"\0" * 32
+EIP_1167_CODE = bytes.fromhex(
+    "363d3d373d3d3d363d73" + IMPLEMENTATION[2:] + "5af43d82803e903d91602b57fd5bf3",
+)
+
+
+def to_slot(address):
+    return bytes.fromhex(address[2:]).rjust(32, b"\0")
+
+
+def test_classify_proxy():
+    assert classify_proxy(b"\x60\x80", to_slot(IMPLEMENTATION), EMPTY_SLOT) == (EIP_1967, IMPLEMENTATION)
+    assert classify_proxy(EIP_1167_CODE, EMPTY_SLOT, EMPTY_SLOT) == (EIP_1167, IMPLEMENTATION)
+    assert classify_proxy(b"\x60\x80", EMPTY_SLOT, to_slot(IMPLEMENTATION)) == (UNSTRUCTURED, IMPLEMENTATION)
+    assert classify_proxy(b"\x60\x80", EMPTY_SLOT, EMPTY_SLOT) == (None, None)
+
+
+class FakeChain:
+    """Proxies with an implementation upgraded at some blocks."""
+
+    def __init__(self, upgrades=None, code=b"\x60\x80"):
+        self.upgrades = upgrades or {}
+        self.code = code
+        self.state_requests = []
+        self.log_requests = []
+
+    def fetch_state(self, address, block):
+        self.state_requests.append(block)
+        implementation = IMPLEMENTATION
+        for upgrade_block, upgrade_implementation in sorted(self.upgrades.items()):
+            if block == "latest" or upgrade_block <= block:
+                implementation = upgrade_implementation
+        return self.code, to_slot(implementation), EMPTY_SLOT
+
+    def has_upgrades(self, address, from_block, to_block):
+        self.log_requests.append((from_block, to_block))
+        return any(from_block <= block <= to_block for block in self.upgrades)
+
+    def resolver(self):
+        return ProxyResolver(self.fetch_state, self.has_upgrades, lambda address, block, code: None)
+
+
+def test_resolve_extends_to_blocks_without_upgrades():
+    chain = FakeChain(upgrades={500: OTHER_IMPLEMENTATION})
+    resolver = chain.resolver()
+    assert resolver.resolve(PROXY, 100) == IMPLEMENTATION
+    assert resolver.resolve(PROXY, 100) == IMPLEMENTATION
+    assert chain.state_requests == [100]
+
+    # no upgrades between 100 and 400: the implementation still holds
+    assert resolver.resolve(PROXY, 400) == IMPLEMENTATION
+    assert resolver.resolve(PROXY, 250) == IMPLEMENTATION
+    assert chain.state_requests == [100]
+    assert chain.log_requests == [(101, 400)]
+
+    # the upgrade at 500 invalidates it
+    assert resolver.resolve(PROXY, 600) == OTHER_IMPLEMENTATION
+    assert chain.state_requests == [100, 600]
+    # the closest resolution is extended
+    assert resolver.resolve(PROXY, 550) == OTHER_IMPLEMENTATION
+    assert chain.log_requests[-1] == (551, 600)
+    assert [(resolution.from_block, resolution.to_block) for resolution in resolver.get_resolutions(PROXY)] == [
+        (100, 400),
+        (550, 600),
+    ]
+
+    # the latest block is not cached
+    assert resolver.resolve(PROXY, "latest") == OTHER_IMPLEMENTATION
+    assert chain.state_requests == [100, 600, "latest"]
+
+    # the blocks far from any resolution are read again instead of scanning the logs in between
+    log_requests = len(chain.log_requests)
+    assert resolver.resolve(PROXY, 600 + resolver.max_gap + 1) == OTHER_IMPLEMENTATION
+    assert chain.state_requests == [100, 600, "latest", 600 + resolver.max_gap + 1]
+    assert len(chain.log_requests) == log_requests
+
+
+def test_resolve_minimal_proxy():
+    chain = FakeChain(code=EIP_1167_CODE)
+    chain.fetch_state = lambda address, block, fetch_state=chain.fetch_state: (
+        fetch_state(address, block)[0],
+        EMPTY_SLOT,
+        EMPTY_SLOT,
+    )
+    resolver = chain.resolver()
+    assert resolver.resolve(PROXY, 100) == IMPLEMENTATION
+    # the code can't change: it holds for all the next blocks without querying the logs
+    assert resolver.resolve(PROXY, 10**8) == IMPLEMENTATION
+    assert chain.state_requests == [100]
+    assert chain.log_requests == []
+
+
+def test_resolve_fallback():
+    fallbacks = []
+
+    def resolve_fallback(address, block, code):
+        fallbacks.append((block, code))
+        return IMPLEMENTATION
+
+    resolver = ProxyResolver(lambda address, block: (b"\x60\x80", EMPTY_SLOT, EMPTY_SLOT), None, resolve_fallback)
+    assert resolver.resolve(PROXY, 100) == IMPLEMENTATION
+    assert resolver.resolve(PROXY, 100) == IMPLEMENTATION
+    # implementations resolved by calling the contract only hold at their block
+    assert resolver.resolve(PROXY, 101) == IMPLEMENTATION
+    assert fallbacks == [(100, b"\x60\x80"), (101, b"\x60\x80")]
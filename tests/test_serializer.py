@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from defi_protocols.serializer import TABLE, dumps, loads
+
+TOPIC = HexBytes("0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef")
+
+
+def build_log(log_index):
+    return AttributeDict(
+        {
+            "address": "0x6B175474E89094C44Da98b954EedeAC495271d0F",
+            "blockHash": HexBytes(b"\x11" * 32),
+            "blockNumber": 17000000,
+            "data": HexBytes(log_index.to_bytes(32, "big")),
+            "logIndex": log_index,
+            "removed": False,
+            "topics": [TOPIC, HexBytes(b"\x00" * 32)],
+            "transactionHash": HexBytes(b"\x22" * 32),
+            "transactionIndex": 1,
+        }
+    )
+
+
+def test_logs_are_stored_as_table():
+    logs = [build_log(i) for i in range(100)]
+    data = dumps(logs)
+    assert data[:1] == TABLE
+
+    restored = loads(data)
+    assert restored == logs
+    assert all(type(log) is AttributeDict for log in restored)
+    assert type(restored[0]["topics"][0]) is HexBytes
+
+
+def test_other_values_are_pickled():
+    values = [
+        1,
+        "0x6B175474E89094C44Da98b954EedeAC495271d0F",
+        Decimal("1.5"),
+        ("result", "0x01"),
+        [1, 2],
+        [AttributeDict({"a": 1}), AttributeDict({"b": 1})],
+        [AttributeDict({"a": b"\x01"})],
+    ]
+    for value in values:
+        assert dumps(value)[:1] != TABLE
+        assert loads(dumps(value)) == value
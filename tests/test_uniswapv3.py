@@ -67,6 +67,14 @@ def test_underlying_all():
     ]
 
 
+def test_underlying_all_many():
+    block = 17119477
+
+    wallets = [WALLET_N1, WALLET_N2]
+    balances = UniswapV3.underlying_all_many(wallets, block, ETHEREUM, fee=True)
+    assert balances == {wallet: UniswapV3.underlying_all(wallet, block, ETHEREUM, fee=True) for wallet in wallets}
+
+
 def test_get_rate():
     block = 17094489
     node = get_node(ETHEREUM, block)